@@ -0,0 +1,241 @@
+"""
+Approximate-nearest-neighbour variants of the FAISS index.
+
+Builds IVF-Flat, HNSW or IVF-PQ copies of the exact index in faiss_index/.
+Vectors are added in the same order, so row ids (and therefore the
+docstore mapping) stay valid.
+
+Usage:
+    python ann_index.py build --mode hnsw
+    python ann_index.py report --modes ivf_flat hnsw ivf_pq --output ann_report.json
+"""
+import argparse
+import json
+import math
+import os
+import time
+
+import faiss
+import numpy as np
+
+from retrieval_config import FAISS_INDEX_PATH, FAISS_NPROBE, FAISS_EF_SEARCH
+
+ANN_MODES = ("ivf_flat", "hnsw", "ivf_pq")
+
+
+def exact_index_path(index_dir=FAISS_INDEX_PATH):
+    """Path of the exact (flat) index: vectors.faiss in the compact format, else LangChain's index.faiss."""
+    compact_path = os.path.join(index_dir, "vectors.faiss")
+    return compact_path if os.path.exists(compact_path) else os.path.join(index_dir, "index.faiss")
+
+
+def ann_index_path(mode, index_dir=FAISS_INDEX_PATH):
+    """Path of the approximate index for a mode."""
+    return os.path.join(index_dir, f"index_{mode}.faiss")
+
+
+def default_nlist(ntotal):
+    """Number of IVF lists: about 4 * sqrt(n), at least 1 and at most n / 39."""
+    nlist = int(4 * math.sqrt(ntotal))
+    # FAISS wants ~39 training points per centroid
+    return max(1, min(nlist, ntotal // 39 or 1))
+
+
+def build_ann_index(vectors, mode, metric=faiss.METRIC_L2, nlist=None, hnsw_m=32,
+                    ef_construction=200, pq_m=16, pq_bits=8):
+    """
+    Build an approximate index over a matrix of vectors.
+
+    Args:
+        vectors (np.ndarray): float32 matrix, one row per stored chunk.
+        mode (str): One of "ivf_flat", "hnsw" or "ivf_pq".
+        metric (int): FAISS metric type of the exact index.
+        nlist (int): Number of IVF lists (IVF modes only).
+        hnsw_m (int): Graph degree (HNSW only).
+        ef_construction (int): Build-time search depth (HNSW only).
+        pq_m (int): Number of PQ sub-quantizers; must divide the dimension (IVF-PQ only).
+        pq_bits (int): Bits per PQ code (IVF-PQ only).
+
+    Returns:
+        faiss.Index: The trained index with all vectors added in row order.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    ntotal, dim = vectors.shape
+
+    if mode == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, metric)
+        index.hnsw.efConstruction = ef_construction
+    elif mode in ("ivf_flat", "ivf_pq"):
+        nlist = nlist or default_nlist(ntotal)
+        quantizer = faiss.IndexFlat(dim, metric)
+        if mode == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_bits, metric)
+        index.train(vectors)
+    else:
+        raise ValueError(f"Unknown index mode '{mode}', expected one of {ANN_MODES}")
+
+    index.add(vectors)
+    return index
+
+
+def set_search_params(index, nprobe=FAISS_NPROBE, ef_search=FAISS_EF_SEARCH):
+    """Apply query-time tunables (nprobe for IVF, efSearch for HNSW) to an index."""
+    if hasattr(index, "nprobe"):
+        index.nprobe = nprobe
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+    return index
+
+
+def search_params(index, selector):
+    """
+    Build FAISS search parameters that restrict a search to a set of ids.
+
+    The parameters carry the index's own nprobe / efSearch, because passing
+    parameters overrides what was set on the index.
+
+    Args:
+        index (faiss.Index): The index that will be searched.
+        selector (faiss.IDSelector): Which row ids may be returned.
+
+    Returns:
+        faiss.SearchParameters: Parameters to pass to index.search().
+    """
+    if hasattr(index, "nprobe"):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    if hasattr(index, "hnsw"):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def load_ann_index(mode, index_dir=FAISS_INDEX_PATH, nprobe=FAISS_NPROBE, ef_search=FAISS_EF_SEARCH):
+    """Load a previously built approximate index and apply its search parameters."""
+    path = ann_index_path(mode, index_dir)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No {mode} index at {path}; run 'python ann_index.py build --mode {mode}'")
+    return set_search_params(faiss.read_index(path), nprobe, ef_search)
+
+
+def reconstruct_vectors(index):
+    """Return all vectors stored in a flat index as a float32 matrix."""
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def _timed_search(index, queries, k):
+    """Search one query at a time (as query_faiss does) and time each call."""
+    labels = np.empty((len(queries), k), dtype=np.int64)
+    latencies = []
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, labels[i:i + 1] = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return labels, np.array(latencies)
+
+
+def recall_at_k(exact_labels, ann_labels):
+    """Fraction of the exact top-k neighbours the approximate search also returned."""
+    k = exact_labels.shape[1]
+    found = [len(set(exact) & set(ann)) for exact, ann in zip(exact_labels, ann_labels)]
+    return float(np.sum(found)) / (len(found) * k)
+
+
+def recall_latency_report(exact_index, variants, queries, k=3):
+    """
+    Compare approximate indexes against the exact index.
+
+    Args:
+        exact_index (faiss.Index): The flat index giving ground truth.
+        variants (dict): Label -> (index, nprobe, ef_search) to evaluate.
+        queries (np.ndarray): float32 query matrix.
+        k (int): Number of neighbours per query.
+
+    Returns:
+        list: One dict per variant (plus the exact baseline) with recall@k
+            and per-query latency percentiles in milliseconds.
+    """
+    exact_labels, exact_latencies = _timed_search(exact_index, queries, k)
+    rows = [{
+        "variant": "flat",
+        "recall_at_k": 1.0,
+        "p50_ms": float(np.percentile(exact_latencies, 50)),
+        "p95_ms": float(np.percentile(exact_latencies, 95)),
+    }]
+    for label, (index, nprobe, ef_search) in variants.items():
+        set_search_params(index, nprobe, ef_search)
+        labels, latencies = _timed_search(index, queries, k)
+        rows.append({
+            "variant": label,
+            "nprobe": nprobe if hasattr(index, "nprobe") else None,
+            "ef_search": ef_search if hasattr(index, "hnsw") else None,
+            "recall_at_k": recall_at_k(exact_labels, labels),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+        })
+    return rows
+
+
+def sample_queries(vectors, n_queries=200, noise=0.01, seed=0):
+    """Build a query set by perturbing stored vectors, so every query has close neighbours."""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+    queries = vectors[rows] + rng.normal(0, noise, size=(len(rows), vectors.shape[1]))
+    return queries.astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and evaluate approximate FAISS indexes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="build an approximate index next to the exact one")
+    build_parser.add_argument("--mode", choices=ANN_MODES, required=True)
+    build_parser.add_argument("--nlist", type=int, default=None)
+    build_parser.add_argument("--hnsw-m", type=int, default=32)
+    build_parser.add_argument("--pq-m", type=int, default=16)
+
+    report_parser = subparsers.add_parser("report", help="recall-vs-latency report against the exact index")
+    report_parser.add_argument("--modes", nargs="+", choices=ANN_MODES, default=list(ANN_MODES))
+    report_parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    report_parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 64, 256])
+    report_parser.add_argument("--queries", type=int, default=200)
+    report_parser.add_argument("-k", type=int, default=3)
+    report_parser.add_argument("--output", default="ann_report.json")
+
+    parser.add_argument("--index-dir", default=FAISS_INDEX_PATH)
+    args = parser.parse_args()
+
+    exact_index = faiss.read_index(exact_index_path(args.index_dir))
+
+    if args.command == "build":
+        start = time.perf_counter()
+        index = build_ann_index(
+            reconstruct_vectors(exact_index), args.mode, metric=exact_index.metric_type,
+            nlist=args.nlist, hnsw_m=args.hnsw_m, pq_m=args.pq_m,
+        )
+        faiss.write_index(index, ann_index_path(args.mode, args.index_dir))
+        print(f"Built {args.mode} index over {index.ntotal} vectors in {time.perf_counter() - start:.1f}s")
+        return
+
+    queries = sample_queries(reconstruct_vectors(exact_index), args.queries)
+    variants = {}
+    for mode in args.modes:
+        index = load_ann_index(mode, args.index_dir)
+        if mode == "hnsw":
+            for ef_search in args.ef_search:
+                variants[f"hnsw ef_search={ef_search}"] = (index, FAISS_NPROBE, ef_search)
+        else:
+            for nprobe in args.nprobe:
+                variants[f"{mode} nprobe={nprobe}"] = (index, nprobe, FAISS_EF_SEARCH)
+
+    rows = recall_latency_report(exact_index, variants, queries, k=args.k)
+    for row in rows:
+        print(f"{row['variant']:<28} recall@{args.k}={row['recall_at_k']:.3f}  "
+              f"p50={row['p50_ms']:.3f}ms  p95={row['p95_ms']:.3f}ms")
+    with open(args.output, "w") as f:
+        json.dump({"k": args.k, "queries": len(queries), "ntotal": exact_index.ntotal, "results": rows}, f, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Batch analysis of PDF reports from a folder or ZIP archive.
+
+Each report goes through text extraction -> extract_measurements ->
+interpret_medical_values in a pool of worker processes (one report per
+task, so throughput scales with cores). Results are written as one row per
+report, with the time series of every reading, to JSONL as they complete
+or to Parquet at the end.
+
+Usage:
+    python batch_reports.py reports/ --output results.jsonl
+    python batch_reports.py reports.zip --output results.parquet --workers 8
+"""
+import argparse
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from conditions import find_conditions
+from pdf_extraction import extract_pdf_pages
+from report_analysis import (
+    extract_measurements, interpret_medical_values, iter_measurements, measurement_series
+)
+
+
+def collect_reports(path):
+    """
+    List the PDF reports in a folder (recursively) or a ZIP archive.
+
+    Returns:
+        list: (report name, source) tasks, sorted by name; the source is a file
+            path or a (zip path, member name) pair read by the worker.
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            members = [name for name in archive.namelist()
+                       if name.lower().endswith(".pdf") and not name.startswith("__MACOSX/")]
+        return [(name, (path, name)) for name in sorted(members)]
+
+    reports = []
+    for root, _, files in os.walk(path):
+        for name in files:
+            if name.lower().endswith(".pdf"):
+                file_path = os.path.join(root, name)
+                reports.append((os.path.relpath(file_path, path).replace(os.sep, "/"), file_path))
+    return sorted(reports)
+
+
+def collect_uploaded_reports(files):
+    """Turn uploaded PDFs and ZIP archives (e.g. from st.file_uploader) into (name, bytes) tasks."""
+    tasks = []
+    for uploaded in files:
+        data = uploaded.getvalue()
+        if uploaded.name.lower().endswith(".zip"):
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                for member in sorted(archive.namelist()):
+                    if member.lower().endswith(".pdf") and not member.startswith("__MACOSX/"):
+                        tasks.append((f"{uploaded.name}/{member}", archive.read(member)))
+        else:
+            tasks.append((uploaded.name, data))
+    return tasks
+
+
+def _read_source(source):
+    if isinstance(source, bytes):
+        return source
+    if isinstance(source, tuple):
+        zip_path, member = source
+        with zipfile.ZipFile(zip_path) as archive:
+            return archive.read(member)
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def analyze_report(task):
+    """
+    Worker: extract, find and interpret the medical values of one report.
+
+    Args:
+        task (tuple): (report name, source) where source is a path, a
+            (zip path, member) pair or the PDF bytes.
+
+    Returns:
+        dict: One result row; "error" is set instead of values if the report failed.
+    """
+    name, source = task
+    start = time.perf_counter()
+    row = {"report": name, "sha256": None, "values": {}, "findings": [],
+           "recommendations": [], "conditions": [], "time_series": {}, "error": None}
+    try:
+        data = _read_source(source)
+        row["sha256"] = hashlib.sha256(data).hexdigest()
+        # One process per report already uses every core, so pages are read in-process
+        pages = extract_pdf_pages(io.BytesIO(data), workers=1)
+        text = "\n".join(pages).strip()
+        if not text:
+            raise ValueError("no extractable text")
+        measurements = extract_measurements(text)
+        # First reading of each analyte, as floats in canonical units (see measurements.CANONICAL_UNITS)
+        for measurement in measurements:
+            row["values"].setdefault(measurement.analyte_name, measurement.value)
+        interpretations = interpret_medical_values(measurements)
+        row["findings"] = interpretations["findings"]
+        row["recommendations"] = interpretations["recommendations"]
+        row["conditions"] = find_conditions(text)
+        row["time_series"] = measurement_series(iter_measurements(pages))
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["seconds"] = time.perf_counter() - start
+    return row
+
+
+def run_batch(tasks, workers=None, on_result=None):
+    """
+    Analyze reports in a process pool.
+
+    Args:
+        tasks (list): (report name, source) pairs, e.g. from collect_reports().
+        workers (int): Worker processes (default: all cores).
+        on_result (callable): Called as on_result(done, total, row) after each report,
+            in completion order, for progress display and streaming output.
+
+    Returns:
+        list: The result rows, sorted by report name.
+    """
+    rows = []
+    # Spawned workers: run_batch is also called from the multi-threaded Streamlit server, which is unsafe to fork
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(analyze_report, task) for task in tasks]
+        for future in as_completed(futures):
+            row = future.result()
+            rows.append(row)
+            if on_result:
+                on_result(len(rows), len(tasks), row)
+    return sorted(rows, key=lambda row: row["report"])
+
+
+def write_jsonl(rows, f):
+    for row in rows:
+        f.write(json.dumps(row) + "\n")
+
+
+def write_parquet(rows, path):
+    """Write rows to Parquet: one float column per analyte code; the time series is stored as JSON."""
+    import pandas as pd
+    from measurements import ANALYTE_CODES
+
+    frame = pd.DataFrame([
+        dict({key: value for key, value in row.items() if key != "values"},
+             **{code: row["values"].get(code) for code in ANALYTE_CODES},
+             time_series=json.dumps(row["time_series"]))
+        for row in rows
+    ])
+    frame.to_parquet(path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze a folder or ZIP archive of PDF reports")
+    parser.add_argument("input", help="folder of PDFs or a ZIP archive")
+    parser.add_argument("--output", default="report_results.jsonl", help=".jsonl or .parquet")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    tasks = collect_reports(args.input)
+    if not tasks:
+        print(f"No PDF reports found in {args.input}")
+        return
+    start = time.perf_counter()
+
+    if args.output.endswith(".parquet"):
+        def progress(done, total, row):
+            print(f"[{done}/{total}] {row['report']}{' (error)' if row['error'] else ''}")
+
+        rows = run_batch(tasks, args.workers, progress)
+        write_parquet(rows, args.output)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            # Rows are streamed as reports finish, so partial results survive an interruption
+            def progress(done, total, row):
+                write_jsonl([row], f)
+                f.flush()
+                print(f"[{done}/{total}] {row['report']}{' (error)' if row['error'] else ''}")
+
+            rows = run_batch(tasks, args.workers, progress)
+
+    elapsed = time.perf_counter() - start
+    failed = sum(1 for row in rows if row["error"])
+    print(f"Analyzed {len(rows)} reports ({failed} failed) in {elapsed:.1f}s "
+          f"({len(rows) / elapsed:.1f} reports/s); results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""
+On-disk formats of the FAISS store.
+
+The original format is LangChain's: index.faiss plus a pickled docstore in
+index.pkl that every process unpickles in full. The compact format keeps
+the same vectors in vectors.faiss, opened memory-mapped so worker processes
+share pages through the OS cache, and the chunk text and metadata in
+docstore.sqlite, which is only read for the rows a search returns. Loading
+it needs neither pickle nor the embedding model.
+
+Both formats are wrapped in classes with the same small interface, used by
+query_faiss (reads) and faiss_ingest (writes).
+
+Usage:
+    python compact_store.py convert    # index.faiss + index.pkl -> vectors.faiss + docstore.sqlite
+
+Once converted, the compact files take precedence and faiss_ingest writes
+only to them, so index.faiss and index.pkl can be removed.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+
+import faiss
+import numpy as np
+
+from retrieval_config import FAISS_INDEX_PATH
+
+VECTORS_FILE = "vectors.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+
+# Zero-copy mmap of flat vector storage (older FAISS builds only have IO_FLAG_MMAP)
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def is_compact(index_dir=FAISS_INDEX_PATH):
+    """Check whether an index directory holds the compact format."""
+    return os.path.exists(os.path.join(index_dir, DOCSTORE_FILE))
+
+
+def _make_document(content, metadata, doc_id):
+    from langchain_core.documents import Document
+
+    return Document(page_content=content, metadata=metadata, id=doc_id)
+
+
+class PickledVectorStore:
+    """The LangChain format: index.faiss plus a pickled docstore in index.pkl."""
+
+    TMP_NAME = "index_tmp"
+
+    def __init__(self, index_dir, embeddings):
+        from langchain_community.vectorstores import FAISS
+
+        self.index_dir = index_dir
+        self.store = FAISS.load_local(
+            index_dir,
+            embeddings=embeddings,
+            allow_dangerous_deserialization=True  # Allow loading of pickle files
+        )
+
+    @property
+    def index(self):
+        return self.store.index
+
+    @index.setter
+    def index(self, index):
+        self.store.index = index
+
+    @property
+    def normalize_L2(self):
+        return getattr(self.store, "_normalize_L2", False)
+
+    def get_documents(self, rows):
+        """Return the documents stored at FAISS rows, in the same order."""
+        return [self.store.docstore.search(self.store.index_to_docstore_id[int(row)]) for row in rows]
+
+    def rows_for_ids(self, doc_ids):
+        """Return the FAISS rows of the given document ids."""
+        doc_ids = set(doc_ids)
+        return [row for row, doc_id in self.store.index_to_docstore_id.items() if doc_id in doc_ids]
+
+    def existing_ids(self):
+        return set(self.store.index_to_docstore_id.values())
+
+    def iter_documents(self):
+        """Yield (row, document) for every stored chunk, in row order."""
+        for row in range(self.store.index.ntotal):
+            document = self.get_documents([row])[0]
+            # Documents pickled by older LangChain versions have no id; the docstore key is their id
+            if document.id is None:
+                document.id = self.store.index_to_docstore_id[row]
+            yield row, document
+
+    def append(self, texts, vectors, metadatas, ids, on_saved):
+        self.store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+        self._save(on_saved)
+
+    def remove(self, doc_ids, on_saved):
+        self.store.delete(list(doc_ids))
+        self._save(on_saved)
+
+    def _save(self, on_saved):
+        """Write next to the live files, record that in the log, then swap them in."""
+        self.store.save_local(self.index_dir, index_name=self.TMP_NAME)
+        on_saved()
+        self.finish_save(self.index_dir)
+
+    @classmethod
+    def finish_save(cls, index_dir):
+        """Move a fully written temporary save into place."""
+        for extension in (".faiss", ".pkl"):
+            tmp_path = os.path.join(index_dir, cls.TMP_NAME + extension)
+            if os.path.exists(tmp_path):
+                os.replace(tmp_path, os.path.join(index_dir, "index" + extension))
+
+    @classmethod
+    def discard_partial_save(cls, index_dir):
+        for extension in (".faiss", ".pkl"):
+            tmp_path = os.path.join(index_dir, cls.TMP_NAME + extension)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+class CompactVectorStore:
+    """
+    Memory-mapped vectors.faiss plus an SQLite docstore.
+
+    Row i of the index is the row with primary key i in the documents table.
+    Appends insert the documents first and then replace vectors.faiss, so rows
+    beyond index.ntotal belong to an append that did not finish. Read-only
+    stores open the docstore together with the vectors, so both always come
+    from the same save.
+    """
+
+    def __init__(self, index_dir, mmap=True):
+        self.index_dir = index_dir
+        self.mmap = mmap
+        self.index = faiss.read_index(self.vectors_path, MMAP_FLAGS if mmap else 0)
+        self._local = threading.local()
+        self._read_only = mmap
+        self._lock = threading.Lock()
+        self._shared = None
+        if mmap:
+            # Readers share one connection opened together with the memory-mapped vectors: it keeps
+            # reading the docstore that matches them even after `compact` replaces the files
+            self._shared = sqlite3.connect(f"file:{self.docstore_path}?mode=ro", uri=True, check_same_thread=False)
+        meta = dict(self._query("SELECT key, value FROM meta"))
+        self.normalize_L2 = meta.get("normalize_L2") == "1"
+
+    @property
+    def vectors_path(self):
+        return os.path.join(self.index_dir, VECTORS_FILE)
+
+    @property
+    def docstore_path(self):
+        return os.path.join(self.index_dir, DOCSTORE_FILE)
+
+    def _connection(self):
+        if self._shared is not None:
+            return self._shared
+        # The writer (faiss_ingest) uses a connection per thread
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.docstore_path)
+            self._local.connection = connection
+        return connection
+
+    def _query(self, sql, params=()):
+        """Run a read query; the shared reader connection is used by one thread at a time."""
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    def get_documents(self, rows):
+        """Return the documents stored at FAISS rows, in the same order."""
+        rows = [int(row) for row in rows]
+        if not rows:
+            return []
+        placeholders = ",".join("?" * len(rows))
+        found = {
+            row: _make_document(content, json.loads(metadata), doc_id)
+            for row, doc_id, content, metadata in self._query(
+                f"SELECT row, doc_id, content, metadata FROM documents WHERE row IN ({placeholders})", rows
+            )
+        }
+        return [found[row] for row in rows]
+
+    def rows_for_ids(self, doc_ids):
+        """Return the FAISS rows of the given document ids."""
+        doc_ids = list(doc_ids)
+        rows = []
+        # Stay below SQLite's bound-parameter limit
+        for start in range(0, len(doc_ids), 500):
+            batch = doc_ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows.extend(row for (row,) in self._query(
+                f"SELECT row FROM documents WHERE doc_id IN ({placeholders}) AND row < ?",
+                batch + [self.index.ntotal],
+            ))
+        return rows
+
+    def existing_ids(self):
+        return {doc_id for (doc_id,) in self._query(
+            "SELECT doc_id FROM documents WHERE row < ?", (self.index.ntotal,)
+        )}
+
+    def iter_documents(self):
+        """Yield (row, document) for every stored chunk, in row order."""
+        with self._lock:
+            cursor = self._connection().execute(
+                "SELECT row, doc_id, content, metadata FROM documents WHERE row < ? ORDER BY row",
+                (self.index.ntotal,),
+            )
+        while True:
+            with self._lock:
+                batch = cursor.fetchmany(1000)
+            if not batch:
+                return
+            for row, doc_id, content, metadata in batch:
+                yield row, _make_document(content, json.loads(metadata), doc_id)
+
+    def discard_incomplete(self):
+        """Drop documents of an append whose vectors never reached vectors.faiss."""
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM documents WHERE row >= ?", (self.index.ntotal,))
+
+    def append(self, texts, vectors, metadatas, ids, on_saved):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.normalize_L2:
+            faiss.normalize_L2(vectors)
+        self.discard_incomplete()
+        start = self.index.ntotal
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                "INSERT INTO documents (row, doc_id, content, metadata) VALUES (?, ?, ?, ?)",
+                [(start + i, doc_id, text, json.dumps(metadata))
+                 for i, (doc_id, text, metadata) in enumerate(zip(ids, texts, metadatas))],
+            )
+        self.index.add(vectors)
+        faiss.write_index(self.index, self.vectors_path + ".tmp")
+        os.replace(self.vectors_path + ".tmp", self.vectors_path)
+        on_saved()
+
+    def remove(self, doc_ids, on_saved):
+        """Rewrite the store without the given documents (rows are renumbered)."""
+        removed = set(self.rows_for_ids(doc_ids))
+        keep = [row for row in range(self.index.ntotal) if row not in removed]
+        vectors = self.index.reconstruct_n(0, self.index.ntotal)[keep] if keep else None
+
+        documents = [(doc_id, content, metadata) for row, doc_id, content, metadata in self._connection().execute(
+            "SELECT row, doc_id, content, metadata FROM documents WHERE row < ? ORDER BY row",
+            (self.index.ntotal,),
+        ) if row not in removed]
+        index = faiss.IndexFlat(self.index.d, self.index.metric_type)
+        if vectors is not None:
+            index.add(vectors)
+        write_compact(self.index_dir, index, documents, self.normalize_L2, suffix=".tmp")
+        on_saved()
+        self.finish_save(self.index_dir)
+        # The docstore file was replaced, so connections to the old one are dropped
+        self.index = index
+        self._local = threading.local()
+
+    @staticmethod
+    def finish_save(index_dir):
+        for name in (VECTORS_FILE, DOCSTORE_FILE):
+            tmp_path = os.path.join(index_dir, name + ".tmp")
+            if os.path.exists(tmp_path):
+                os.replace(tmp_path, os.path.join(index_dir, name))
+
+    @staticmethod
+    def discard_partial_save(index_dir):
+        for name in (VECTORS_FILE, DOCSTORE_FILE):
+            tmp_path = os.path.join(index_dir, name + ".tmp")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def write_compact(index_dir, index, documents, normalize_L2=False, suffix=""):
+    """
+    Write a store in the compact format.
+
+    Args:
+        index_dir (str): Directory to write into.
+        index (faiss.Index): Flat index whose row i is documents[i].
+        documents (iterable): (doc_id, content, metadata) tuples in row order;
+            metadata may be a dict or an already encoded JSON string.
+        normalize_L2 (bool): Whether query vectors must be L2-normalized.
+        suffix (str): Appended to file names, e.g. ".tmp" for a save that is swapped in later.
+    """
+    docstore_path = os.path.join(index_dir, DOCSTORE_FILE + suffix)
+    if os.path.exists(docstore_path):
+        os.remove(docstore_path)
+
+    connection = sqlite3.connect(docstore_path)
+    with connection:
+        connection.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        connection.execute(
+            "CREATE TABLE documents (row INTEGER PRIMARY KEY, doc_id TEXT UNIQUE, content TEXT, metadata TEXT)"
+        )
+        connection.execute("INSERT INTO meta VALUES ('normalize_L2', ?)", ("1" if normalize_L2 else "0",))
+        connection.executemany(
+            "INSERT INTO documents (row, doc_id, content, metadata) VALUES (?, ?, ?, ?)",
+            ((row, doc_id, content, metadata if isinstance(metadata, str) else json.dumps(metadata))
+             for row, (doc_id, content, metadata) in enumerate(documents)),
+        )
+    connection.close()
+    faiss.write_index(index, os.path.join(index_dir, VECTORS_FILE + suffix))
+
+
+def open_vector_store(index_dir=FAISS_INDEX_PATH, embeddings=None, mmap=True):
+    """
+    Open the FAISS store in whichever format the directory holds.
+
+    Args:
+        index_dir (str): The FAISS index directory.
+        embeddings: Embedding model, only needed by the pickled LangChain format.
+        mmap (bool): Memory-map the compact format's vectors (read-only).
+
+    Returns:
+        CompactVectorStore or PickledVectorStore: The opened store.
+    """
+    if is_compact(index_dir):
+        return CompactVectorStore(index_dir, mmap=mmap)
+    return PickledVectorStore(index_dir, embeddings)
+
+
+def convert_to_compact(index_dir=FAISS_INDEX_PATH, embeddings=None):
+    """Write vectors.faiss and docstore.sqlite from an existing index.faiss + index.pkl."""
+    legacy = PickledVectorStore(index_dir, embeddings)
+    documents = (
+        (document.id, document.page_content, document.metadata)
+        for _, document in legacy.iter_documents()
+    )
+    write_compact(index_dir, legacy.index, documents, legacy.normalize_L2)
+    return legacy.index.ntotal
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the FAISS store to the compact format")
+    parser.add_argument("command", choices=["convert"])
+    parser.add_argument("--index-dir", default=FAISS_INDEX_PATH)
+    args = parser.parse_args()
+
+    from query_faiss import get_embeddings
+
+    count = convert_to_compact(args.index_dir, get_embeddings())
+    print(f"Wrote {count} documents to {VECTORS_FILE} and {DOCSTORE_FILE} in {args.index_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Dictionary-driven detection of medical conditions mentioned in report text.
+
+CONDITION_LEXICON maps canonical condition IDs to a display name and the
+phrases that mention them. The phrases are compiled into a trie over word
+tokens. A report is tokenized in one C-level pass (bytes.translate and
+split), the tokens that can start a phrase are located with list scans,
+and the trie is walked only from those positions, so the cost stays
+linear in the text however many phrases the lexicon holds. Matching whole
+tokens gives word boundaries for free ("hypertensive" does not match
+inside other words, "high  blood\npressure" still matches). Overlapping
+mentions resolve to the leftmost, longest phrase, so "urinary tract
+infection" is not also reported as "infection".
+
+Mentions preceded within NEGATION_WINDOW tokens by a NEGATION_PREFIXES
+phrase ("no", "denies", "negative for", ...) or followed by a
+NEGATION_SUFFIXES phrase ("ruled out") are negated, NegEx style: the
+scope of a negation ends at clause punctuation (. ; : ! ?), so in "No
+history of diabetes; denies asthma" both mentions are negated and in "No
+fever. Type 2 diabetes" only the fever is. find_conditions leaves negated
+mentions out.
+
+Usage:
+    python conditions.py "Diagnosed with type 2 diabetes and high blood pressure"
+"""
+import argparse
+from typing import Dict, List, Tuple
+
+# Condition ID -> (display name, also the web search query; phrases as written in reports)
+CONDITION_LEXICON = {
+    "hypertension": ("Hypertension", ["hypertension", "hypertensive", "high blood pressure", "htn"]),
+    "hypotension": ("Hypotension", ["hypotension", "low blood pressure"]),
+    "diabetes": ("Diabetes", ["diabetes", "diabetes mellitus", "diabetic", "type 1 diabetes", "type 2 diabetes",
+                              "t1dm", "t2dm", "niddm", "iddm"]),
+    "prediabetes": ("Prediabetes", ["prediabetes", "pre diabetes", "impaired fasting glucose",
+                                    "impaired glucose tolerance"]),
+    "hyperlipidemia": ("Hyperlipidemia", ["hyperlipidemia", "hyperlipidaemia", "dyslipidemia", "dyslipidaemia",
+                                          "hypercholesterolemia", "hypercholesterolaemia", "high cholesterol"]),
+    "anemia": ("Anemia", ["anemia", "anaemia", "anemic", "anaemic", "iron deficiency anemia",
+                          "iron deficiency anaemia"]),
+    "fever": ("Fever", ["fever", "febrile", "pyrexia"]),
+    "infection": ("Infection", ["infection", "sepsis"]),
+    "urinary_tract_infection": ("Urinary tract infection", ["urinary tract infection", "uti"]),
+    "pneumonia": ("Pneumonia", ["pneumonia"]),
+    "tuberculosis": ("Tuberculosis", ["tuberculosis"]),
+    "covid19": ("COVID-19", ["covid 19", "covid", "sars cov 2"]),
+    "asthma": ("Asthma", ["asthma", "asthmatic"]),
+    "copd": ("COPD", ["copd", "chronic obstructive pulmonary disease", "emphysema", "chronic bronchitis"]),
+    "coronary_artery_disease": ("Coronary artery disease", ["coronary artery disease", "coronary heart disease",
+                                                            "ischemic heart disease", "ischaemic heart disease"]),
+    "myocardial_infarction": ("Myocardial infarction", ["myocardial infarction", "heart attack"]),
+    "heart_failure": ("Heart failure", ["heart failure", "congestive heart failure", "chf"]),
+    "atrial_fibrillation": ("Atrial fibrillation", ["atrial fibrillation", "afib"]),
+    "stroke": ("Stroke", ["stroke", "cerebrovascular accident", "transient ischemic attack"]),
+    "chronic_kidney_disease": ("Chronic kidney disease", ["chronic kidney disease", "ckd", "renal failure",
+                                                          "kidney failure"]),
+    "hypothyroidism": ("Hypothyroidism", ["hypothyroidism", "underactive thyroid"]),
+    "hyperthyroidism": ("Hyperthyroidism", ["hyperthyroidism", "overactive thyroid", "thyrotoxicosis"]),
+    "obesity": ("Obesity", ["obesity", "obese"]),
+    "osteoarthritis": ("Osteoarthritis", ["osteoarthritis"]),
+    "rheumatoid_arthritis": ("Rheumatoid arthritis", ["rheumatoid arthritis"]),
+    "migraine": ("Migraine", ["migraine"]),
+    "depression": ("Depression", ["depression", "major depressive disorder"]),
+}
+
+# A mention is negated by a prefix starting at most NEGATION_WINDOW tokens before it, or by a suffix right after it
+NEGATION_PREFIXES = ["no", "not", "denies", "denied", "deny", "negative for", "without", "ruled out",
+                     "rules out", "free of", "absence of"]
+NEGATION_SUFFIXES = ["ruled out", "was ruled out", "excluded", "was excluded"]
+NEGATION_WINDOW = 4
+
+# ASCII letters and digits make up tokens (lowercased); clause punctuation becomes a b"." token,
+# every other byte separates tokens
+CLAUSE_BYTES = b".;:!?"
+TOKEN_BYTES = bytes(byte + 32 if 65 <= byte <= 90 else byte if 97 <= byte <= 122 or 48 <= byte <= 57
+                    else 46 if byte in CLAUSE_BYTES else 32
+                    for byte in range(256))
+
+
+def tokenize(text: str) -> List[bytes]:
+    """
+    Lowercase word tokens as bytes, split at C speed.
+
+    "Type-2 DM; no CKD" -> [b"type", b"2", b"dm", b".", b"no", b"ckd"]
+    """
+    return text.encode("utf-8", "ignore").translate(TOKEN_BYTES).replace(b".", b" . ").split()
+
+
+class ConditionMatcher:
+    """
+    Trie of the lexicon phrases over word tokens.
+
+    goto[state] maps a token to the next state (state 0 is the root) and
+    condition[state] is the ID of the phrase ending there, if any. The
+    negation phrases are kept as token tuples, checked only around mentions.
+    """
+
+    def __init__(self, lexicon: Dict, negation_prefixes: List[str] = NEGATION_PREFIXES,
+                 negation_suffixes: List[str] = NEGATION_SUFFIXES, negation_window: int = NEGATION_WINDOW):
+        self.names = {condition_id: name for condition_id, (name, _) in lexicon.items()}
+        self.goto = [{}]
+        self.condition = [None]
+        for condition_id, (_, phrases) in lexicon.items():
+            for phrase in phrases:
+                state = 0
+                for token in tokenize(phrase):
+                    if token not in self.goto[state]:
+                        self.goto[state][token] = len(self.goto)
+                        self.goto.append({})
+                        self.condition.append(None)
+                    state = self.goto[state][token]
+                if self.condition[state] not in (None, condition_id):
+                    raise ValueError(f"Phrase '{phrase}' is listed for both {self.condition[state]} and {condition_id}")
+                self.condition[state] = condition_id
+        self.negation_prefixes = [tuple(tokenize(phrase)) for phrase in negation_prefixes]
+        self.negation_suffixes = [tuple(tokenize(phrase)) for phrase in negation_suffixes]
+        self.negation_window = negation_window
+
+    def _negated(self, tokens: List[bytes], start: int, end: int) -> bool:
+        """Whether the mention tokens[start:end] is negated within its clause."""
+        before = tokens[max(0, start - self.negation_window):start]
+        if b"." in before:
+            before = before[len(before) - before[::-1].index(b"."):]
+        for position in range(len(before)):
+            if any(tuple(before[position:position + len(phrase)]) == phrase for phrase in self.negation_prefixes):
+                return True
+        after = tuple(tokens[end:end + max(map(len, self.negation_suffixes), default=0)])
+        return any(after[:len(phrase)] == phrase for phrase in self.negation_suffixes)
+
+    def matches(self, text: str) -> List[Tuple[str, str, bool]]:
+        """
+        Condition mentions in text, leftmost-longest and non-overlapping.
+
+        Returns:
+            list: (condition ID, matched phrase as normalized tokens, negated) in text order.
+        """
+        tokens = tokenize(text)
+        # Tokens that can start a phrase are located with C-level scans, so the
+        # trie is only walked where a mention can begin
+        starts = []
+        for token in self.goto[0].keys() & set(tokens):
+            position = tokens.index(token)
+            while True:
+                starts.append(position)
+                try:
+                    position = tokens.index(token, position + 1)
+                except ValueError:
+                    break
+        starts.sort()
+
+        found = []
+        covered = 0
+        for start in starts:
+            if start < covered:
+                continue
+            state, position, longest = 0, start, None
+            while position < len(tokens) and tokens[position] in self.goto[state]:
+                state = self.goto[state][tokens[position]]
+                position += 1
+                if self.condition[state]:
+                    longest = (self.condition[state], position)
+            if longest:
+                condition_id, covered = longest
+                found.append((condition_id, b" ".join(tokens[start:covered]).decode(),
+                              self._negated(tokens, start, covered)))
+        return found
+
+    def find(self, text: str) -> List[str]:
+        """IDs of the conditions mentioned (not negated) in text, in order of first mention."""
+        return list(dict.fromkeys(condition_id for condition_id, _, negated in self.matches(text) if not negated))
+
+    def name(self, condition_id: str) -> str:
+        return self.names[condition_id]
+
+
+condition_matcher = ConditionMatcher(CONDITION_LEXICON)
+
+
+def find_conditions(text: str) -> List[str]:
+    """IDs of the CONDITION_LEXICON conditions mentioned (not negated) in text, in order of first mention."""
+    return condition_matcher.find(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the conditions mentioned in a text")
+    parser.add_argument("text")
+    args = parser.parse_args()
+
+    for condition_id, phrase, negated in condition_matcher.matches(args.text):
+        print(f"{condition_id:<26} {condition_matcher.name(condition_id):<26} {phrase}{' (negated)' if negated else ''}")
+
+
+if __name__ == "__main__":
+    main()
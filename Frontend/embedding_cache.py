@@ -0,0 +1,124 @@
+import atexit
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of query embeddings keyed on normalized query text.
+
+    The cache can optionally persist itself to a .npz file so repeated
+    searches survive a restart. Entries saved for a different model are
+    ignored on load.
+    """
+
+    def __init__(self, max_size=2048, path=None, model_name=None, persist_every=64):
+        self.max_size = max_size
+        self.path = path
+        self.model_name = model_name
+        self.persist_every = persist_every
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._unsaved = 0
+        self._lock = threading.Lock()
+
+        if self.path:
+            self.load()
+            atexit.register(self.save)
+
+    @staticmethod
+    def normalize(text):
+        """
+        Normalize query text into a cache key.
+
+        all-MiniLM-L6-v2 uses an uncased tokenizer that splits on whitespace,
+        so case and whitespace differences do not change the embedding.
+        """
+        return " ".join(text.lower().split())
+
+    def get(self, text):
+        """Return the cached embedding for a query, or None on a miss."""
+        key = self.normalize(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, text, vector):
+        """Store a query embedding, evicting the least recently used entry if full."""
+        key = self.normalize(text)
+        with self._lock:
+            self._entries[key] = np.asarray(vector, dtype=np.float32)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._unsaved += 1
+            should_save = self.path and self._unsaved >= self.persist_every
+        if should_save:
+            self.save()
+
+    def stats(self):
+        """Return hit/miss counters and the current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+            }
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def save(self):
+        """Write the cache to disk (atomically) if a path was configured."""
+        if not self.path:
+            return
+        with self._lock:
+            keys = list(self._entries)
+            vectors = list(self._entries.values())
+            self._unsaved = 0
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    keys=np.array(keys, dtype=str),
+                    vectors=np.array(vectors, dtype=np.float32),
+                    model_name=np.array(self.model_name or ""),
+                )
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Error saving embedding cache: {e}")
+
+    def load(self):
+        """Load cached entries from disk, oldest first."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if str(data["model_name"]) != (self.model_name or ""):
+                    return
+                keys = data["keys"]
+                vectors = data["vectors"]
+        except Exception as e:
+            print(f"Error loading embedding cache: {e}")
+            return
+        with self._lock:
+            for key, vector in zip(keys[-self.max_size:], vectors[-self.max_size:]):
+                self._entries[str(key)] = vector
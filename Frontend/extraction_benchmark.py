@@ -0,0 +1,136 @@
+"""
+Micro-benchmark for extract_medical_values.
+
+Times the single-pass VitalsScanner against the previous approach (one
+re.search per pattern, each scanning the whole lowercased text) on large
+synthetic report text, and checks both return the same values. Also times
+iter_measurements, which reports every reading rather than the first, the
+lexicon-based condition matcher against the diagnosis regex it replaced,
+and the vectorized interpretation of many patients' values.
+
+Usage:
+    python extraction_benchmark.py --size-kb 2048 --repeats 5
+"""
+import argparse
+import random
+import re
+import time
+
+from conditions import find_conditions
+from measurements import format_values, measurement_columns
+from reference_ranges import classify, interpret_batch
+from report_analysis import (
+    VITAL_PATTERNS, _reading_measurements, extract_measurements, extract_medical_values, iter_measurements
+)
+
+FILLER_LINES = [
+    "Patient seen in clinic for routine follow-up, no acute distress.",
+    "Medications reviewed and reconciled with the pharmacy record.",
+    "Denies chest pain, shortness of breath or palpitations.",
+    "Abdomen soft, non-tender, bowel sounds present in all quadrants.",
+    "Plan discussed with the patient, who agrees to return in 3 months.",
+    "Specimen 2024/118 received at 08:30, processed by the central lab.",
+]
+
+VALUE_LINES = [
+    "Blood pressure: 138/86 mmHg",
+    "Fasting glucose 104 mg/dL",
+    "Total cholesterol 212 mg/dL",
+    "Hemoglobin 11.2 g/dL",
+    "Temperature 100.4 F",
+    "Pulse 92 bpm",
+]
+
+
+def per_pattern_extract(text):
+    """The previous extraction: a separate re.search per pattern, stopping at the first match per analyte."""
+    readings = []
+    text_lower = text.lower()
+    for position, (_, patterns, _) in enumerate(VITAL_PATTERNS):
+        for pattern in patterns:
+            match = re.search(pattern, text_lower)
+            if match:
+                readings.append((position, match))
+                break
+    return format_values(_reading_measurements(readings))
+
+
+def regex_conditions(text):
+    """The previous condition search: a greedy diagnosis capture plus a keyword alternation."""
+    conditions_found = []
+    for pattern in (r'(?:diagnosis|diagnosed with|condition)[\s:]*([a-zA-Z\s]+)',
+                    r'(?:hypertension|diabetes|anemia|fever|infection|pneumonia|asthma)'):
+        conditions_found.extend(re.findall(pattern, text.lower()))
+    return conditions_found
+
+
+def synthetic_report(size_kb, placement, seed=0):
+    """
+    Report text of about size_kb kilobytes.
+
+    placement is "start" (values near the top), "end" (values after all the
+    filler, the worst case for repeated scans) or "none" (no values at all).
+    """
+    rng = random.Random(seed)
+    lines = []
+    length = 0
+    while length < size_kb * 1024:
+        line = rng.choice(FILLER_LINES)
+        lines.append(line)
+        length += len(line) + 1
+    if placement == "start":
+        lines[5:5] = VALUE_LINES
+    elif placement == "end":
+        lines.extend(VALUE_LINES)
+    return "\n".join(lines)
+
+
+def time_function(function, text, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(text)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark medical value extraction on large report text")
+    parser.add_argument("--size-kb", type=int, default=2048)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--patients", type=int, default=10000)
+    args = parser.parse_args()
+
+    # Values far from the keyword of a pattern anchored at its end, as in column-aligned PDF text
+    for text in ("reading 120/80" + " " * 70 + "mmhg", "x" * 30000 + " 118/76" + " " * 200 + "mm hg"):
+        if per_pattern_extract(text) != extract_medical_values(text):
+            raise AssertionError(f"Results differ: {per_pattern_extract(text)} != {extract_medical_values(text)}")
+
+    for placement in ("start", "end", "none"):
+        text = synthetic_report(args.size_kb, placement)
+        old_seconds, old_values = time_function(per_pattern_extract, text, args.repeats)
+        new_seconds, new_values = time_function(extract_medical_values, text, args.repeats)
+        if old_values != new_values:
+            raise AssertionError(f"Results differ ({placement}): {old_values} != {new_values}")
+        all_seconds, readings = time_function(lambda text: list(iter_measurements(text)), text, args.repeats)
+        print(f"{placement:<6} {args.size_kb} KB  per-pattern={old_seconds * 1000:8.1f}ms  "
+              f"single-pass={new_seconds * 1000:8.1f}ms  speedup={old_seconds / new_seconds:.1f}x  "
+              f"values={len(new_values)}  every-reading={all_seconds * 1000:8.1f}ms ({len(readings)} readings)")
+
+    text = synthetic_report(args.size_kb, "end") + "\nDiagnosis: community acquired pneumonia with fever\n"
+    regex_seconds, _ = time_function(regex_conditions, text, args.repeats)
+    lexicon_seconds, conditions = time_function(find_conditions, text, args.repeats)
+    print(f"conditions {args.size_kb} KB  regex={regex_seconds * 1000:8.1f}ms  "
+          f"lexicon={lexicon_seconds * 1000:8.1f}ms  found={conditions}")
+
+    reports = [extract_measurements(synthetic_report(1, "start", seed)) for seed in range(50)]
+    reports = (reports * (args.patients // len(reports) + 1))[:args.patients]
+    columns = measurement_columns(reports)
+    classify_seconds, _ = time_function(classify, columns, args.repeats)
+    interpret_seconds, _ = time_function(interpret_batch, columns, args.repeats)
+    print(f"interpretation of {args.patients} patients  classify={classify_seconds * 1000:.1f}ms  "
+          f"with findings={interpret_seconds * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+"""
+Incremental ingestion into the FAISS store in faiss_index/.
+
+New documents are chunked, embedded and appended to the existing index
+without a rebuild; approximate indexes, the BM25 index and the metadata
+filter index are kept in step. Deletes are tombstones (tombstones.json) that
+query_faiss excludes from searches until `compact` removes them for good.
+
+Every batch is written to an append log (ingest_log.jsonl) before it is
+applied and marked committed afterwards, so a crash mid-ingest is finished
+by `resume`, which also runs before every other command. Only one ingest
+process should write to an index directory at a time.
+
+Usage:
+    python faiss_ingest.py add guidelines/ new_label.pdf --doc-type fda_label --date 2024-05-01
+    python faiss_ingest.py delete <doc_id> [<doc_id> ...]
+    python faiss_ingest.py resume
+    python faiss_ingest.py compact
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+
+import faiss
+
+from ann_index import ANN_MODES, ann_index_path, build_ann_index
+from compact_store import CompactVectorStore, PickledVectorStore, is_compact
+from lexical_index import sync_lexical_index
+from metadata_index import sync_metadata_index
+from sharded_index import sync_shards
+from retrieval_config import FAISS_INDEX_PATH, CHUNK_SIZE, CHUNK_OVERLAP
+
+TOMBSTONES_FILE = "tombstones.json"
+INGEST_LOG_FILE = "ingest_log.jsonl"
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md", ".html", ".htm")
+EMBED_BATCH_SIZE = 256
+
+
+# Reading and chunking
+def read_document(path):
+    """Return the plain text of a PDF, HTML or text file."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".pdf":
+        import PyPDF2
+        with open(path, "rb") as f:
+            reader = PyPDF2.PdfReader(f)
+            return "\n".join(page.extract_text() or "" for page in reader.pages)
+    if extension in (".html", ".htm"):
+        from bs4 import BeautifulSoup
+        with open(path, "rb") as f:
+            return BeautifulSoup(f.read(), "html.parser").get_text(" ")
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        return f.read()
+
+
+def iter_input_files(paths):
+    """Expand files and directories into a sorted list of supported files."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for file_path in glob.glob(os.path.join(path, "**", "*"), recursive=True):
+                if file_path.lower().endswith(SUPPORTED_EXTENSIONS):
+                    files.append(file_path)
+        else:
+            files.append(path)
+    return sorted(files)
+
+
+def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """
+    Split text into overlapping chunks at whitespace boundaries.
+
+    Args:
+        text (str): The text to split.
+        chunk_size (int): Maximum characters per chunk.
+        overlap (int): Characters repeated from the end of the previous chunk.
+
+    Returns:
+        list: The chunk strings, in document order.
+    """
+    chunks = []
+    current = []
+    length = 0
+    for word in text.split():
+        if current and length + len(word) + 1 > chunk_size:
+            chunks.append(" ".join(current))
+            # Carry the tail of the chunk over as context for the next one
+            tail = []
+            tail_length = 0
+            for previous in reversed(current):
+                if tail_length + len(previous) + 1 > overlap:
+                    break
+                tail.insert(0, previous)
+                tail_length += len(previous) + 1
+            current = tail
+            length = tail_length
+        current.append(word)
+        length += len(word) + 1
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def chunk_id(source, position, text):
+    """Stable document id, so re-ingesting the same file does not duplicate it."""
+    return hashlib.sha1(f"{source}\0{position}\0{text}".encode("utf-8")).hexdigest()
+
+
+# Tombstones and the append log
+def load_tombstones(index_dir=FAISS_INDEX_PATH):
+    """Return the set of deleted document ids."""
+    path = os.path.join(index_dir, TOMBSTONES_FILE)
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return set(json.load(f))
+
+
+def _write_json_atomic(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _save_tombstones(tombstones, index_dir):
+    _write_json_atomic(os.path.join(index_dir, TOMBSTONES_FILE), sorted(tombstones))
+
+
+def _append_log(index_dir, entry):
+    """Durably append one entry to the ingest log."""
+    with open(os.path.join(index_dir, INGEST_LOG_FILE), "a") as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _read_log(index_dir):
+    path = os.path.join(index_dir, INGEST_LOG_FILE)
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with open(path) as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A torn last line from a crash; the batch was never applied
+                break
+    return entries
+
+
+def _uncommitted_batches(index_dir):
+    """Return (batch entry, saved flag) for every batch without a commit record."""
+    batches = {}
+    saved = set()
+    for entry in _read_log(index_dir):
+        if entry["op"] == "commit":
+            batches.pop(entry["batch_id"], None)
+        elif entry["op"] == "saved":
+            saved.add(entry["batch_id"])
+        else:
+            batches[entry["batch_id"]] = entry
+    return [(entry, entry["batch_id"] in saved) for entry in batches.values()]
+
+
+# Store access
+def load_store(index_dir=FAISS_INDEX_PATH):
+    """Open the store in either format for a full read or an update."""
+    # Writers load the vectors into memory, since a memory-mapped index is read-only
+    if is_compact(index_dir):
+        return CompactVectorStore(index_dir, mmap=False)
+
+    from query_faiss import get_embeddings
+    return PickledVectorStore(index_dir, get_embeddings())
+
+
+def _store_class(index_dir):
+    return CompactVectorStore if is_compact(index_dir) else PickledVectorStore
+
+
+def _sync_ann_indexes(store, index_dir):
+    """Bring any approximate indexes in line with the exact index."""
+    for mode in ANN_MODES:
+        path = ann_index_path(mode, index_dir)
+        if not os.path.exists(path):
+            continue
+        ann = faiss.read_index(path)
+        if ann.ntotal == store.index.ntotal:
+            continue
+        if ann.ntotal < store.index.ntotal:
+            # Appended rows keep their ids, so new vectors can simply be added
+            ann.add(store.index.reconstruct_n(ann.ntotal, store.index.ntotal - ann.ntotal))
+        else:
+            # Rows were compacted away, so ids shifted and the index must be rebuilt
+            ann = build_ann_index(store.index.reconstruct_n(0, store.index.ntotal), mode,
+                                  metric=store.index.metric_type)
+        faiss.write_index(ann, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+
+def _embed_in_batches(texts):
+    from query_faiss import get_embeddings
+
+    embeddings = get_embeddings()
+    vectors = []
+    for start in range(0, len(texts), EMBED_BATCH_SIZE):
+        vectors.extend(embeddings.embed_documents(texts[start:start + EMBED_BATCH_SIZE]))
+    return vectors
+
+
+def _apply_batch(store, entry, index_dir):
+    def mark_saved():
+        _append_log(index_dir, {"op": "saved", "batch_id": entry["batch_id"]})
+
+    if entry["op"] == "add":
+        existing = store.existing_ids()
+        todo = [i for i, doc_id in enumerate(entry["ids"]) if doc_id not in existing]
+        if todo:
+            texts = [entry["texts"][i] for i in todo]
+            store.append(
+                texts,
+                _embed_in_batches(texts),
+                [entry["metadatas"][i] for i in todo],
+                [entry["ids"][i] for i in todo],
+                mark_saved,
+            )
+    elif entry["op"] == "delete":
+        _save_tombstones(load_tombstones(index_dir) | set(entry["ids"]), index_dir)
+    elif entry["op"] == "compact":
+        tombstones = load_tombstones(index_dir) & store.existing_ids()
+        if tombstones:
+            store.remove(tombstones, mark_saved)
+        _save_tombstones(set(), index_dir)
+
+    _sync_ann_indexes(store, index_dir)
+    sync_shards(store, index_dir)
+    sync_lexical_index(store, index_dir)
+    sync_metadata_index(store, index_dir)
+    _append_log(index_dir, {"op": "commit", "batch_id": entry["batch_id"]})
+
+
+def _run_batch(entry, index_dir):
+    _append_log(index_dir, entry)
+    store = load_store(index_dir)
+    _apply_batch(store, entry, index_dir)
+
+
+def _new_batch_id():
+    return f"{time.time():.6f}-{os.getpid()}"
+
+
+# Public API
+def resume(index_dir=FAISS_INDEX_PATH):
+    """
+    Finish any batches an earlier, interrupted ingest left uncommitted.
+
+    Returns:
+        int: Number of batches that were resumed.
+    """
+    store_class = _store_class(index_dir)
+    pending = _uncommitted_batches(index_dir)
+    if not pending:
+        store_class.discard_partial_save(index_dir)
+        return 0
+
+    for entry, saved in pending:
+        if saved:
+            store_class.finish_save(index_dir)
+        else:
+            store_class.discard_partial_save(index_dir)
+        store = load_store(index_dir)
+        _apply_batch(store, entry, index_dir)
+        print(f"Resumed {entry['op']} batch {entry['batch_id']}")
+    return len(pending)
+
+
+def ingest_texts(texts, metadatas=None, index_dir=FAISS_INDEX_PATH):
+    """
+    Chunk, embed and append texts to the existing FAISS store.
+
+    Args:
+        texts (list): Document texts to add.
+        metadatas (list): Optional metadata dict per text; "source" is used in chunk ids.
+        index_dir (str): The FAISS index directory.
+
+    Returns:
+        list: Ids of the chunks that were added.
+    """
+    resume(index_dir)
+    metadatas = metadatas or [{} for _ in texts]
+
+    ids, chunks, chunk_metadatas = [], [], []
+    for text, metadata in zip(texts, metadatas):
+        for position, chunk in enumerate(chunk_text(text)):
+            ids.append(chunk_id(metadata.get("source", ""), position, chunk))
+            chunks.append(chunk)
+            chunk_metadatas.append(dict(metadata, chunk=position))
+    if not chunks:
+        return []
+
+    entry = {"op": "add", "batch_id": _new_batch_id(), "ids": ids,
+             "texts": chunks, "metadatas": chunk_metadatas}
+    _run_batch(entry, index_dir)
+    return ids
+
+
+def ingest_files(paths, metadata=None, index_dir=FAISS_INDEX_PATH):
+    """
+    Read files (or directories of files) and ingest them, one batch per file.
+
+    Args:
+        paths (list): Files or directories of supported files.
+        metadata (dict): Extra metadata for every chunk, e.g. doc_type and date
+            (see metadata_index.py). "source" defaults to the file name.
+        index_dir (str): The FAISS index directory.
+    """
+    added = []
+    for path in iter_input_files(paths):
+        text = read_document(path)
+        file_metadata = dict({"source": os.path.basename(path)}, **(metadata or {}))
+        ids = ingest_texts([text], [file_metadata], index_dir)
+        print(f"Ingested {path}: {len(ids)} chunks")
+        added.extend(ids)
+    return added
+
+
+def delete_documents(doc_ids, index_dir=FAISS_INDEX_PATH):
+    """Tombstone documents so searches skip them; `compact` removes them for good."""
+    resume(index_dir)
+    entry = {"op": "delete", "batch_id": _new_batch_id(), "ids": list(doc_ids)}
+    _append_log(index_dir, entry)
+    _save_tombstones(load_tombstones(index_dir) | set(doc_ids), index_dir)
+    _append_log(index_dir, {"op": "commit", "batch_id": entry["batch_id"]})
+
+
+def compact(index_dir=FAISS_INDEX_PATH):
+    """Physically remove tombstoned documents and rebuild approximate indexes."""
+    resume(index_dir)
+    _run_batch({"op": "compact", "batch_id": _new_batch_id()}, index_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally update the FAISS store")
+    parser.add_argument("--index-dir", default=FAISS_INDEX_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = subparsers.add_parser("add", help="chunk, embed and append documents")
+    add_parser.add_argument("paths", nargs="+", help="PDF, HTML or text files, or directories of them")
+    add_parser.add_argument("--source", help="source label (defaults to the file name)")
+    add_parser.add_argument("--doc-type", help="document type, e.g. fda_label or guideline")
+    add_parser.add_argument("--date", help="publication date as YYYY-MM-DD")
+
+    delete_parser = subparsers.add_parser("delete", help="tombstone documents by id")
+    delete_parser.add_argument("ids", nargs="+")
+
+    subparsers.add_parser("resume", help="finish an interrupted ingest")
+    subparsers.add_parser("compact", help="drop tombstoned documents from the index")
+
+    args = parser.parse_args()
+    if args.command == "add":
+        metadata = {field: value for field, value in
+                    (("source", args.source), ("doc_type", args.doc_type), ("date", args.date)) if value}
+        ids = ingest_files(args.paths, metadata, args.index_dir)
+        print(f"Added {len(ids)} chunks")
+    elif args.command == "delete":
+        delete_documents(args.ids, args.index_dir)
+        print(f"Tombstoned {len(args.ids)} documents")
+    elif args.command == "resume":
+        print(f"Resumed {resume(args.index_dir)} batches")
+    elif args.command == "compact":
+        compact(args.index_dir)
+        print("Compaction finished")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+Reproducible builder for faiss_index/.
+
+Builds the FAISS store from a directory of PDF, text and HTML files:
+
+1. Files are read and chunked in a process pool (one task per file; results
+   are collected in sorted file order, so the chunk order never depends on
+   scheduling).
+2. Chunks are embedded in large batches; every batch is checkpointed to
+   disk, so an interrupted build resumes where it stopped.
+3. The index is written (LangChain index.faiss + index.pkl, or the compact
+   format) together with manifest.json: corpus file hashes, model, chunk
+   parameters and hashes of the written vectors and documents, so two
+   builds can be checked for identical output.
+
+Usage:
+    python index_builder.py build corpus/ --output faiss_index
+    python index_builder.py build corpus/ --output faiss_index --format compact --workers 8
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from faiss_ingest import chunk_id, chunk_text, iter_input_files, read_document
+from retrieval_config import (
+    FAISS_INDEX_PATH, EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND, CHUNK_SIZE, CHUNK_OVERLAP
+)
+
+CHECKPOINT_DIR = "build_checkpoint"
+MANIFEST_FILE = "manifest.json"
+BUILD_EMBED_BATCH_SIZE = 1024
+# Files derived from an earlier store; their row ids mean nothing after a rebuild
+DERIVED_PREFIXES = ("index_", "bm25", "metadata", "tombstones", "ingest_log")
+
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _chunk_file(task):
+    """Process-pool worker: hash, read and chunk one file."""
+    path, source, chunk_size, overlap = task
+    chunks = chunk_text(read_document(path), chunk_size, overlap)
+    return source, _sha256_file(path), chunks
+
+
+def chunk_corpus(input_dir, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, workers=None):
+    """
+    Read and chunk every supported file under input_dir in parallel.
+
+    Returns:
+        tuple: (corpus, chunks) where corpus is a list of {"path", "sha256", "chunks"}
+            per file and chunks a list of (doc_id, text, metadata) in build order.
+    """
+    files = iter_input_files([input_dir])
+    tasks = [(path, os.path.relpath(path, input_dir).replace(os.sep, "/"), chunk_size, overlap)
+             for path in files]
+    corpus, chunks = [], []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map() yields results in task order, whatever order the workers finish in
+        for source, sha256, file_chunks in executor.map(_chunk_file, tasks, chunksize=4):
+            corpus.append({"path": source, "sha256": sha256, "chunks": len(file_chunks)})
+            for position, text in enumerate(file_chunks):
+                metadata = {"source": os.path.basename(source), "path": source, "chunk": position}
+                # Ids use the path relative to input_dir, so a/notes.txt and b/notes.txt stay distinct
+                chunks.append((chunk_id(source, position, text), text, metadata))
+    return corpus, chunks
+
+
+def build_fingerprint(corpus, chunk_size, overlap, batch_size):
+    """Hash of everything that determines the build output; checkpoints from another fingerprint are discarded."""
+    settings = {
+        "corpus": [(entry["path"], entry["sha256"]) for entry in corpus],
+        "model": EMBEDDING_MODEL_NAME,
+        "backend": EMBEDDING_BACKEND,
+        "chunk_size": chunk_size,
+        "chunk_overlap": overlap,
+        "batch_size": batch_size,
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _prepare_checkpoint(checkpoint_dir, fingerprint):
+    """Keep the checkpoint directory if it belongs to the same build, otherwise start afresh."""
+    state_path = os.path.join(checkpoint_dir, "state.json")
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            if json.load(f).get("fingerprint") == fingerprint:
+                return
+        print("Corpus or settings changed since the checkpoint; starting over")
+        shutil.rmtree(checkpoint_dir)
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    with open(state_path, "w") as f:
+        json.dump({"fingerprint": fingerprint}, f)
+
+
+def embed_with_checkpoints(texts, checkpoint_dir, batch_size=BUILD_EMBED_BATCH_SIZE):
+    """
+    Embed texts batch by batch, saving each batch; batches already on disk are reused.
+
+    Returns:
+        np.ndarray: float32 matrix with one row per text.
+    """
+    from query_faiss import get_embeddings
+
+    embeddings = None
+    batches = []
+    total = (len(texts) + batch_size - 1) // batch_size
+    for number, start in enumerate(range(0, len(texts), batch_size)):
+        path = os.path.join(checkpoint_dir, f"embeddings_{number:05d}.npy")
+        if os.path.exists(path):
+            batches.append(np.load(path))
+            continue
+        embeddings = embeddings or get_embeddings()
+        batch_start = time.perf_counter()
+        vectors = np.asarray(embeddings.embed_documents(texts[start:start + batch_size]), dtype=np.float32)
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, vectors)
+        os.replace(path + ".tmp", path)
+        batches.append(vectors)
+        print(f"Embedded batch {number + 1}/{total} in {time.perf_counter() - batch_start:.1f}s")
+    return np.vstack(batches) if batches else np.empty((0, 0), dtype=np.float32)
+
+
+def documents_sha256(chunks):
+    """Content hash of the (doc_id, text, metadata) chunks in row order."""
+    digest = hashlib.sha256()
+    for doc_id, text, metadata in chunks:
+        digest.update(json.dumps([doc_id, text, metadata], sort_keys=True).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def _clear_derived_files(output_dir, store_format):
+    from compact_store import DOCSTORE_FILE, VECTORS_FILE
+
+    # The compact files take precedence when present, so they go when writing the LangChain format
+    stale = (VECTORS_FILE, DOCSTORE_FILE) if store_format == "langchain" else ("index.faiss", "index.pkl")
+    for name in os.listdir(output_dir):
+        if name.startswith(DERIVED_PREFIXES) or name in stale:
+            os.remove(os.path.join(output_dir, name))
+            print(f"Removed {name} (built from the previous store)")
+
+
+def write_store(output_dir, vectors, chunks, store_format="langchain"):
+    """
+    Write the flat index and docstore.
+
+    Returns:
+        list: Names of the files written, vectors first.
+    """
+    import faiss
+
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+
+    if store_format == "compact":
+        from compact_store import DOCSTORE_FILE, VECTORS_FILE, write_compact
+
+        write_compact(output_dir, index, chunks, suffix=".tmp")
+        names = [VECTORS_FILE, DOCSTORE_FILE]
+    else:
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+        from langchain_community.vectorstores import FAISS
+        from compact_store import _make_document
+        from query_faiss import get_embeddings
+
+        docstore = InMemoryDocstore({doc_id: _make_document(text, metadata, doc_id)
+                                     for doc_id, text, metadata in chunks})
+        store = FAISS(get_embeddings(), index, docstore,
+                      {row: doc_id for row, (doc_id, _, _) in enumerate(chunks)})
+        store.save_local(output_dir, index_name="index_build.tmp")
+        os.replace(os.path.join(output_dir, "index_build.tmp.faiss"), os.path.join(output_dir, "index.faiss.tmp"))
+        os.replace(os.path.join(output_dir, "index_build.tmp.pkl"), os.path.join(output_dir, "index.pkl.tmp"))
+        names = ["index.faiss", "index.pkl"]
+
+    for name in names:
+        os.replace(os.path.join(output_dir, name + ".tmp"), os.path.join(output_dir, name))
+    return names
+
+
+def build_index(input_dir, output_dir=FAISS_INDEX_PATH, store_format="langchain", workers=None,
+                chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, batch_size=BUILD_EMBED_BATCH_SIZE, force=False):
+    """
+    Build the FAISS store for a corpus directory, resuming an interrupted build.
+
+    Args:
+        input_dir (str): Directory of PDF, text and HTML files.
+        output_dir (str): Where to write the index and manifest.json.
+        store_format (str): "langchain" (index.faiss + index.pkl) or "compact".
+        workers (int): Chunking processes; defaults to every core.
+        chunk_size (int): Maximum characters per chunk.
+        overlap (int): Characters shared between consecutive chunks.
+        batch_size (int): Texts per embedding batch (and per checkpoint).
+        force (bool): Replace an existing store that was not written by this builder.
+
+    Returns:
+        dict: The manifest.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    existing = [name for name in os.listdir(output_dir) if name not in (CHECKPOINT_DIR, MANIFEST_FILE)]
+    if existing and not force and not os.path.exists(os.path.join(output_dir, MANIFEST_FILE)):
+        raise FileExistsError(f"{output_dir} already holds a store not built by index_builder; pass --force")
+
+    start = time.perf_counter()
+    corpus, chunks = chunk_corpus(input_dir, chunk_size, overlap, workers)
+    if not chunks:
+        raise ValueError(f"No text found in {input_dir}")
+    print(f"Chunked {len(corpus)} files into {len(chunks)} chunks in {time.perf_counter() - start:.1f}s")
+
+    fingerprint = build_fingerprint(corpus, chunk_size, overlap, batch_size)
+    checkpoint_dir = os.path.join(output_dir, CHECKPOINT_DIR)
+    _prepare_checkpoint(checkpoint_dir, fingerprint)
+    vectors = embed_with_checkpoints([text for _, text, _ in chunks], checkpoint_dir, batch_size)
+
+    _clear_derived_files(output_dir, store_format)
+    names = write_store(output_dir, vectors, chunks, store_format)
+
+    import faiss
+
+    manifest = {
+        "fingerprint": fingerprint,
+        "model": EMBEDDING_MODEL_NAME,
+        "backend": EMBEDDING_BACKEND,
+        "chunk_size": chunk_size,
+        "chunk_overlap": overlap,
+        "embed_batch_size": batch_size,
+        "format": store_format,
+        "faiss_version": faiss.__version__,
+        "numpy_version": np.__version__,
+        "files": len(corpus),
+        "chunks": len(chunks),
+        "dimension": int(vectors.shape[1]),
+        "corpus": corpus,
+        "outputs": {
+            # index.pkl bytes vary between runs (pickled pydantic field sets follow string hash
+            # order), so the docstore is fingerprinted by its content instead
+            "vectors_sha256": _sha256_file(os.path.join(output_dir, names[0])),
+            "documents_sha256": documents_sha256(chunks),
+        },
+        "build_seconds": time.perf_counter() - start,
+    }
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    shutil.rmtree(checkpoint_dir)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build faiss_index/ from a corpus of PDF, text and HTML files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="build (or resume building) the index")
+    build_parser.add_argument("input_dir")
+    build_parser.add_argument("--output", default=FAISS_INDEX_PATH)
+    build_parser.add_argument("--format", choices=["langchain", "compact"], default="langchain")
+    build_parser.add_argument("--workers", type=int, default=None, help="chunking processes (default: all cores)")
+    build_parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    build_parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP)
+    build_parser.add_argument("--batch-size", type=int, default=BUILD_EMBED_BATCH_SIZE)
+    build_parser.add_argument("--force", action="store_true", help="replace a store not built by this tool")
+    args = parser.parse_args()
+
+    manifest = build_index(args.input_dir, args.output, args.format, args.workers,
+                           args.chunk_size, args.chunk_overlap, args.batch_size, args.force)
+    print(f"Built {manifest['chunks']} chunks from {manifest['files']} files in "
+          f"{manifest['build_seconds']:.1f}s; manifest written to {os.path.join(args.output, MANIFEST_FILE)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+BM25 inverted index over the same chunks as the FAISS store.
+
+Exact drug names and lab terms ("HbA1c", "metformin") are matched by the
+lexical index, and query_faiss fuses both rankings in its hybrid mode. The
+postings are kept as flat NumPy arrays (CSR layout: one slice of rows and
+term frequencies per term), saved next to the FAISS index in bm25.npz.
+
+Usage:
+    python lexical_index.py build
+    python lexical_index.py search "HbA1c"
+"""
+import argparse
+import os
+import re
+
+import numpy as np
+
+from retrieval_config import FAISS_INDEX_PATH
+
+LEXICAL_INDEX_FILE = "bm25.npz"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+
+
+def tokenize(text):
+    """Lowercase word and number tokens ("HbA1c 6.5%" -> ["hba1c", "6.5"])."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def lexical_index_path(index_dir=FAISS_INDEX_PATH):
+    return os.path.join(index_dir, LEXICAL_INDEX_FILE)
+
+
+class BM25Index:
+    """Okapi BM25 over an inverted index stored as NumPy arrays."""
+
+    def __init__(self, terms, offsets, rows, freqs, doc_lengths, k1=1.5, b=0.75):
+        self.terms = list(terms)
+        self.term_ids = {term: i for i, term in enumerate(self.terms)}
+        self.offsets = offsets
+        self.rows = rows
+        self.freqs = freqs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.avg_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    @property
+    def ntotal(self):
+        return len(self.doc_lengths)
+
+    @classmethod
+    def from_postings(cls, terms, postings, doc_lengths):
+        """
+        Build the CSR arrays from (term id, row, frequency) triplets.
+
+        Args:
+            terms (list): Vocabulary; term ids index into it.
+            postings (tuple): Arrays (term_ids, rows, freqs) of equal length.
+            doc_lengths (np.ndarray): Token count of every row.
+        """
+        term_ids, rows, freqs = postings
+        order = np.lexsort((rows, term_ids))
+        term_ids, rows, freqs = term_ids[order], rows[order], freqs[order]
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(terms)), out=offsets[1:])
+        return cls(terms, offsets, rows.astype(np.int32), freqs.astype(np.float32),
+                   np.asarray(doc_lengths, dtype=np.float32))
+
+    @classmethod
+    def build(cls, documents, base=None):
+        """
+        Build an index from (row, text) pairs.
+
+        Args:
+            documents (iterable): (row, text) pairs; rows must continue from base.
+            base (BM25Index): Existing index to extend with the new rows.
+        """
+        terms = list(base.terms) if base else []
+        term_ids = dict(base.term_ids) if base else {}
+        doc_lengths = list(base.doc_lengths) if base else []
+        new_terms, new_rows, new_freqs = [], [], []
+
+        for row, text in documents:
+            counts = {}
+            tokens = tokenize(text)
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                if token not in term_ids:
+                    term_ids[token] = len(terms)
+                    terms.append(token)
+                new_terms.append(term_ids[token])
+                new_rows.append(row)
+                new_freqs.append(count)
+            doc_lengths.append(len(tokens))
+
+        postings = (np.array(new_terms, dtype=np.int64), np.array(new_rows, dtype=np.int64),
+                    np.array(new_freqs, dtype=np.float32))
+        if base:
+            old_terms = np.repeat(np.arange(len(base.terms)), np.diff(base.offsets))
+            postings = tuple(np.concatenate(pair) for pair in zip((old_terms, base.rows, base.freqs), postings))
+        return cls.from_postings(terms, postings, doc_lengths)
+
+    def known(self, token):
+        return token in self.term_ids
+
+    def search(self, query, k=3, excluded_rows=None, allowed_rows=None):
+        """
+        Rank rows for a query with BM25.
+
+        Args:
+            query (str): The query text.
+            k (int): Number of rows to return.
+            excluded_rows (np.ndarray): Rows that must not be returned (e.g. tombstoned).
+            allowed_rows (np.ndarray): If given, only these rows may be returned (metadata filters).
+
+        Returns:
+            list: (row, score) pairs, best first; only rows matching a query term.
+        """
+        scores = np.zeros(self.ntotal, dtype=np.float32)
+        for token in set(tokenize(query)):
+            term_id = self.term_ids.get(token)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            rows, freqs = self.rows[start:end], self.freqs[start:end]
+            idf = np.log(1 + (self.ntotal - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[rows] / self.avg_length)
+            scores[rows] += idf * freqs * (self.k1 + 1) / (freqs + norm)
+
+        if allowed_rows is not None:
+            allowed = np.zeros(self.ntotal, dtype=bool)
+            allowed[allowed_rows[allowed_rows < self.ntotal]] = True
+            scores[~allowed] = 0
+        if excluded_rows is not None and len(excluded_rows):
+            scores[excluded_rows] = 0
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(int(row), float(scores[row])) for row in matched]
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, terms=np.array(self.terms, dtype=str), offsets=self.offsets,
+                     rows=self.rows, freqs=self.freqs, doc_lengths=self.doc_lengths)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["terms"].tolist(), data["offsets"], data["rows"], data["freqs"], data["doc_lengths"])
+
+
+def build_lexical_index(store, base=None):
+    """Index every chunk of an open vector store (or only the rows after base)."""
+    start = base.ntotal if base else 0
+    documents = ((row, document.page_content) for row, document in store.iter_documents() if row >= start)
+    return BM25Index.build(documents, base=base)
+
+
+def sync_lexical_index(store, index_dir=FAISS_INDEX_PATH):
+    """Bring bm25.npz (if one was built) in line with the store after ingestion."""
+    path = lexical_index_path(index_dir)
+    if not os.path.exists(path):
+        return
+    index = BM25Index.load(path)
+    if index.ntotal == store.index.ntotal:
+        return
+    # Appended rows extend the index; compaction renumbers rows, so it is rebuilt
+    base = index if index.ntotal < store.index.ntotal else None
+    build_lexical_index(store, base).save(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BM25 index over the FAISS store's chunks")
+    parser.add_argument("--index-dir", default=FAISS_INDEX_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("build", help="build bm25.npz from the stored chunks")
+    search_parser = subparsers.add_parser("search", help="run a lexical-only query")
+    search_parser.add_argument("query")
+    search_parser.add_argument("-k", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from faiss_ingest import load_store
+
+        index = build_lexical_index(load_store(args.index_dir))
+        index.save(lexical_index_path(args.index_dir))
+        print(f"Indexed {index.ntotal} chunks, {len(index.terms)} terms")
+        return
+
+    from query_faiss import query_faiss_batch
+
+    for text, score in query_faiss_batch([args.query], k=args.k, mode="lexical")[0]:
+        print(f"{score:.3f}  {text[:120]}")
+
+
+if __name__ == "__main__":
+    main()
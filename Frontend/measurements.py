@@ -0,0 +1,190 @@
+"""
+Compact, typed lab and vital readings.
+
+A Measurement holds an analyte code, a float value in the analyte's
+canonical unit, the code of that unit and the offset of the value in the
+source text. Lists of measurements pack into a NumPy structured array
+(MEASUREMENT_DTYPE, 14 bytes per reading) for bulk storage, and
+to_canonical() converts whole arrays of raw readings with one lookup in the
+unit-conversion table. Display strings are only made when rendering, by
+format_analyte() and format_values().
+"""
+from typing import Dict, List
+
+import numpy as np
+
+# Analyte codes (a Measurement stores the position in this tuple)
+ANALYTE_CODES = ("systolic", "diastolic", "glucose", "cholesterol", "hemoglobin", "temperature", "heart_rate")
+
+# Report-level analytes and the codes of the values they consist of
+ANALYTE_PARTS = {
+    "blood_pressure": ("systolic", "diastolic"),
+    "glucose": ("glucose",),
+    "cholesterol": ("cholesterol",),
+    "hemoglobin": ("hemoglobin",),
+    "temperature": ("temperature",),
+    "heart_rate": ("heart_rate",),
+}
+
+# Unit codes (a Measurement stores the position in this tuple)
+UNITS = ("mmHg", "mg/dL", "mmol/L", "g/dL", "°C", "°F", "bpm")
+
+CANONICAL_UNITS = {
+    "systolic": "mmHg",
+    "diastolic": "mmHg",
+    "glucose": "mg/dL",
+    "cholesterol": "mg/dL",
+    "hemoglobin": "g/dL",
+    "temperature": "°C",
+    "heart_rate": "bpm",
+}
+
+# Units as written in reports (lowercased) -> unit
+UNIT_ALIASES = {
+    "mmhg": "mmHg", "mm hg": "mmHg",
+    "mg/dl": "mg/dL", "mg%": "mg/dL",
+    "mmol/l": "mmol/L",
+    "g/dl": "g/dL", "gm/dl": "g/dL",
+    "°c": "°C", "c": "°C",
+    "°f": "°F", "f": "°F",
+    "bpm": "bpm", "beats": "bpm", "/min": "bpm",
+}
+
+# (analyte, unit) -> (scale, offset) converting to the canonical unit; canonical units need no entry
+UNIT_CONVERSIONS = {
+    ("glucose", "mmol/L"): (18.016, 0.0),
+    ("cholesterol", "mmol/L"): (38.67, 0.0),
+    ("temperature", "°F"): (5 / 9, -160 / 9),
+}
+
+# Conversion table indexed [analyte code, unit code]; NaN marks units that make no sense for an analyte
+SCALE = np.full((len(ANALYTE_CODES), len(UNITS)), np.nan)
+OFFSET = np.zeros((len(ANALYTE_CODES), len(UNITS)))
+for _analyte, _unit in CANONICAL_UNITS.items():
+    SCALE[ANALYTE_CODES.index(_analyte), UNITS.index(_unit)] = 1.0
+for (_analyte, _unit), (_scale, _offset) in UNIT_CONVERSIONS.items():
+    SCALE[ANALYTE_CODES.index(_analyte), UNITS.index(_unit)] = _scale
+    OFFSET[ANALYTE_CODES.index(_analyte), UNITS.index(_unit)] = _offset
+CANONICAL_UNIT_CODES = np.array([UNITS.index(CANONICAL_UNITS[analyte]) for analyte in ANALYTE_CODES], dtype=np.uint8)
+
+# Units always shown with at least one decimal ("37.0°C")
+DECIMAL_UNITS = {"°C", "°F"}
+
+MEASUREMENT_DTYPE = np.dtype([("analyte", np.uint8), ("unit", np.uint8), ("value", np.float64), ("offset", np.uint32)])
+
+
+class Measurement:
+    """One reading: analyte code, value in the canonical unit, unit code and source offset."""
+
+    __slots__ = ("analyte", "value", "unit", "offset")
+
+    def __init__(self, analyte: int, value: float, unit: int, offset: int = 0):
+        self.analyte = analyte
+        self.value = value
+        self.unit = unit
+        self.offset = offset
+
+    @property
+    def analyte_name(self) -> str:
+        return ANALYTE_CODES[self.analyte]
+
+    @property
+    def unit_name(self) -> str:
+        return UNITS[self.unit]
+
+    def to_record(self) -> List:
+        """[analyte, value, unit, offset], for JSON."""
+        return [self.analyte, self.value, self.unit, self.offset]
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(*record)
+
+    def __eq__(self, other):
+        return isinstance(other, Measurement) and self.to_record() == other.to_record()
+
+    def __repr__(self):
+        return f"Measurement({self.analyte_name}={self.value:g} {self.unit_name} @ {self.offset})"
+
+
+def unit_code(written: str, default: str) -> int:
+    """Unit code for a unit as written in a report, or for default when none was written."""
+    return UNITS.index(UNIT_ALIASES.get(written.strip().lower(), default) if written else default)
+
+
+def to_canonical(analytes, values, units):
+    """
+    Convert raw readings to their analytes' canonical units.
+
+    Args:
+        analytes, values, units: Arrays of analyte codes, raw values and unit codes.
+
+    Returns:
+        tuple: (values, unit codes) in canonical units; values are NaN where the
+            unit does not apply to the analyte.
+    """
+    analytes = np.asarray(analytes, dtype=np.intp)
+    units = np.asarray(units, dtype=np.intp)
+    values = np.asarray(values, dtype=np.float64) * SCALE[analytes, units] + OFFSET[analytes, units]
+    return values, CANONICAL_UNIT_CODES[analytes]
+
+
+def pack(measurements) -> np.ndarray:
+    """Measurements -> structured array of MEASUREMENT_DTYPE."""
+    return np.array([(measurement.analyte, measurement.unit, measurement.value, measurement.offset)
+                     for measurement in measurements], dtype=MEASUREMENT_DTYPE)
+
+
+def unpack(array) -> List[Measurement]:
+    return [Measurement(int(analyte), float(value), int(unit), int(offset))
+            for analyte, unit, value, offset in array.tolist()]
+
+
+def measurement_columns(measurement_lists) -> Dict:
+    """
+    Numeric columns for reference_ranges.classify(), one entry per list of measurements.
+
+    Returns:
+        dict: Analyte code name -> float array (the first reading of the analyte, NaN when absent).
+    """
+    table = np.full((len(ANALYTE_CODES), len(measurement_lists)), np.nan)
+    for row, measurements in enumerate(measurement_lists):
+        for measurement in reversed(measurements):
+            table[measurement.analyte, row] = measurement.value
+    return dict(zip(ANALYTE_CODES, table))
+
+
+def format_number(value: float, unit: str = None) -> str:
+    """
+    Values are shown as written, or as converted at full precision: 104.25 -> "104.25", 104.0 -> "104"
+    (temperatures always have a decimal, "37.0"). Rounding further could move a value across the band
+    edge it was classified against, e.g. show 99.04 mg/dL as "99" next to "Pre-diabetic".
+    """
+    # 12 significant digits drop float noise from unit conversions (99.08800000000001 -> "99.088")
+    text = format(value, ".12g")
+    if unit in DECIMAL_UNITS and "." not in text and "e" not in text:
+        text += ".0"
+    return text
+
+
+def format_analyte(analyte: str, values) -> str:
+    """Display string for a report-level analyte, e.g. ("blood_pressure", [120, 80]) -> "120/80 mmHg"."""
+    return format_analyte_column(analyte, [[value] for value in values])[0]
+
+
+def format_analyte_column(analyte: str, parts) -> List[str]:
+    """Display strings for many readings of a report-level analyte; parts holds one value sequence per part."""
+    unit = CANONICAL_UNITS[ANALYTE_PARTS[analyte][0]]
+    suffix = unit if unit.startswith("°") else " " + unit
+    columns = [[format_number(value, unit) for value in np.asarray(values, dtype=np.float64).tolist()]
+               for values in parts]
+    return ["/".join(texts) + suffix for texts in zip(*columns)]
+
+
+def format_values(measurements) -> Dict:
+    """{report-level analyte: display string} for the first reading of each analyte in measurements."""
+    first = {}
+    for measurement in measurements:
+        first.setdefault(measurement.analyte_name, measurement.value)
+    return {analyte: format_analyte(analyte, [first[code] for code in codes])
+            for analyte, codes in ANALYTE_PARTS.items() if all(code in first for code in codes)}
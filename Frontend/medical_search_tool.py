@@ -20,6 +20,8 @@ def search_google_serpapi(query):
         "api_key": SERPAPI_API_KEY,
         "num": 8
     })
+    # The client waits indefinitely by default; a hung search would keep its analysis thread forever
+    search.timeout = 10
     results = search.get_dict()
     links = []
 
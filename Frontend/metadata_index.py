@@ -0,0 +1,200 @@
+"""
+Per-attribute row id sets for metadata-filtered search.
+
+For every filterable metadata field (source, doc_type, date) and every
+value it takes, the index keeps the sorted FAISS rows of the chunks that
+have it. query_faiss turns a filter into the set of allowed rows and hands
+that to FAISS as an ID selector, so only matching vectors are searched and
+nothing is thrown away after retrieval. The sets are stored in CSR layout
+next to the FAISS index in metadata.npz.
+
+Filters map a field to a value, a list of accepted values, or a range on
+ordered values such as ISO dates:
+
+    {"doc_type": "fda_label"}
+    {"source": ["medlineplus.gov", "fda.gov"], "date": {"gte": "2023-01-01"}}
+
+Usage:
+    python metadata_index.py build
+"""
+import argparse
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from retrieval_config import FAISS_INDEX_PATH
+
+METADATA_INDEX_FILE = "metadata.npz"
+FILTER_FIELDS = ("source", "doc_type", "date")
+
+
+def metadata_index_path(index_dir=FAISS_INDEX_PATH):
+    return os.path.join(index_dir, METADATA_INDEX_FILE)
+
+
+class MetadataIndex:
+    """Sorted row id arrays per (field, value)."""
+
+    def __init__(self, postings, ntotal, cache_size=64):
+        # field -> (sorted values array, offsets array, rows array)
+        self.postings = postings
+        self.ntotal = ntotal
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        # Shared by retrieval-server handler threads and the report analysis pool
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, documents, base=None):
+        """
+        Build the index from (row, metadata) pairs.
+
+        Args:
+            documents (iterable): (row, metadata dict) pairs; rows must continue from base.
+            base (MetadataIndex): Existing index to extend with the new rows.
+        """
+        rows_by_value = {field: {} for field in FILTER_FIELDS}
+        if base:
+            for field, (values, offsets, rows) in base.postings.items():
+                for i, value in enumerate(values.tolist()):
+                    rows_by_value[field][value] = list(rows[offsets[i]:offsets[i + 1]])
+        ntotal = base.ntotal if base else 0
+
+        for row, metadata in documents:
+            for field in FILTER_FIELDS:
+                value = metadata.get(field)
+                if value is not None:
+                    rows_by_value[field].setdefault(str(value), []).append(row)
+            ntotal = max(ntotal, row + 1)
+
+        postings = {}
+        for field, by_value in rows_by_value.items():
+            values = sorted(by_value)
+            offsets = np.zeros(len(values) + 1, dtype=np.int64)
+            np.cumsum([len(by_value[value]) for value in values], out=offsets[1:])
+            rows = np.array([row for value in values for row in by_value[value]], dtype=np.int64)
+            postings[field] = (np.array(values, dtype=str), offsets, rows)
+        return cls(postings, ntotal)
+
+    def _rows_for_values(self, field, indices):
+        values, offsets, rows = self.postings[field]
+        parts = [rows[offsets[i]:offsets[i + 1]] for i in indices]
+        return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+    def _rows_for_condition(self, field, condition):
+        if field not in self.postings:
+            raise ValueError(f"Cannot filter on '{field}'; filterable fields are {FILTER_FIELDS}")
+        values = self.postings[field][0]
+
+        if isinstance(condition, dict):
+            # Range over the sorted values, e.g. {"gte": "2023-01-01", "lt": "2024-01-01"}
+            start, end = 0, len(values)
+            if "gte" in condition:
+                start = max(start, np.searchsorted(values, str(condition["gte"]), side="left"))
+            if "gt" in condition:
+                start = max(start, np.searchsorted(values, str(condition["gt"]), side="right"))
+            if "lte" in condition:
+                end = min(end, np.searchsorted(values, str(condition["lte"]), side="right"))
+            if "lt" in condition:
+                end = min(end, np.searchsorted(values, str(condition["lt"]), side="left"))
+            return self._rows_for_values(field, range(start, end))
+
+        accepted = condition if isinstance(condition, (list, tuple, set)) else [condition]
+        indices = []
+        for value in accepted:
+            i = np.searchsorted(values, str(value))
+            if i < len(values) and values[i] == str(value):
+                indices.append(i)
+        return self._rows_for_values(field, indices)
+
+    def rows_matching(self, filters):
+        """
+        Return the sorted rows whose metadata satisfies every condition.
+
+        Args:
+            filters (dict): Field -> value, list of values, or range dict.
+
+        Returns:
+            np.ndarray: int64 row ids.
+        """
+        key = json.dumps(filters, sort_keys=True, default=list)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        rows = None
+        for field, condition in filters.items():
+            field_rows = self._rows_for_condition(field, condition)
+            rows = field_rows if rows is None else np.intersect1d(rows, field_rows, assume_unique=True)
+            if len(rows) == 0:
+                break
+        if rows is None:
+            rows = np.arange(self.ntotal, dtype=np.int64)
+
+        with self._lock:
+            self._cache[key] = rows
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return rows
+
+    def save(self, path):
+        arrays = {"ntotal": np.array(self.ntotal)}
+        for field, (values, offsets, rows) in self.postings.items():
+            arrays[f"{field}_values"] = values
+            arrays[f"{field}_offsets"] = offsets
+            arrays[f"{field}_rows"] = rows
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            postings = {
+                field: (data[f"{field}_values"], data[f"{field}_offsets"], data[f"{field}_rows"])
+                for field in FILTER_FIELDS if f"{field}_values" in data
+            }
+            return cls(postings, int(data["ntotal"]))
+
+
+def build_metadata_index(store, base=None):
+    """Index the metadata of every chunk of an open vector store (or only the rows after base)."""
+    start = base.ntotal if base else 0
+    documents = ((row, document.metadata) for row, document in store.iter_documents() if row >= start)
+    return MetadataIndex.build(documents, base=base)
+
+
+def sync_metadata_index(store, index_dir=FAISS_INDEX_PATH):
+    """Bring metadata.npz (if one was built) in line with the store after ingestion."""
+    path = metadata_index_path(index_dir)
+    if not os.path.exists(path):
+        return
+    index = MetadataIndex.load(path)
+    if index.ntotal == store.index.ntotal:
+        return
+    # Appended rows extend the index; compaction renumbers rows, so it is rebuilt
+    base = index if index.ntotal < store.index.ntotal else None
+    build_metadata_index(store, base).save(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Metadata filter index over the FAISS store")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--index-dir", default=FAISS_INDEX_PATH)
+    args = parser.parse_args()
+
+    from faiss_ingest import load_store
+
+    index = build_metadata_index(load_store(args.index_dir))
+    index.save(metadata_index_path(args.index_dir))
+    for field, (values, _, rows) in index.postings.items():
+        print(f"{field}: {len(values)} values over {len(rows)} chunks")
+
+
+if __name__ == "__main__":
+    main()
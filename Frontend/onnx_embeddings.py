@@ -0,0 +1,249 @@
+"""
+ONNX Runtime backend for the all-MiniLM-L6-v2 sentence embedder.
+
+Runs the same transformer as HuggingFaceEmbeddings, followed by the same
+mean pooling and L2 normalization that sentence-transformers applies, but
+without importing PyTorch at query time. The exported model can be
+dynamically quantized to int8 for faster CPU inference.
+
+Select it with EMBEDDING_BACKEND=onnx (see retrieval_config.py).
+
+Usage:
+    python onnx_embeddings.py export [--no-quantize]   # needs torch + transformers, once
+    python onnx_embeddings.py parity                   # cosine vs the PyTorch embeddings
+    python onnx_embeddings.py bench                    # embeddings/s and import time
+"""
+import argparse
+import inspect
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from retrieval_config import EMBEDDING_MODEL_NAME, ONNX_MODEL_DIR, ONNX_QUANTIZED
+
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+# sentence-transformers truncates all-MiniLM-L6-v2 inputs at 256 tokens
+MAX_SEQ_LENGTH = 256
+
+
+class OnnxMiniLMEmbeddings(Embeddings):
+    """LangChain-compatible embeddings computed with ONNX Runtime."""
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, quantized=ONNX_QUANTIZED, batch_size=64, threads=None):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_file = QUANTIZED_MODEL_FILE if quantized else MODEL_FILE
+        model_path = os.path.join(model_dir, model_file)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"No ONNX model at {model_path}; run 'python onnx_embeddings.py export' first"
+            )
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            model_path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.batch_size = batch_size
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding()
+
+    def _embed_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        inputs = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        token_embeddings = self.session.run(
+            None, {name: value for name, value in inputs.items() if name in self.input_names}
+        )[0]
+
+        # Mean pooling over real tokens, then L2 normalization (as sentence-transformers does)
+        mask = inputs["attention_mask"][:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts):
+        """Embed a list of texts, batching similar lengths together to limit padding."""
+        texts = [text.replace("\n", " ") for text in texts]
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._embed_batch([texts[i] for i in batch])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def export_onnx(model_name=EMBEDDING_MODEL_NAME, model_dir=ONNX_MODEL_DIR, quantize=True):
+    """
+    Export the Hugging Face model to ONNX (and optionally an int8 copy).
+
+    Needs torch and transformers, which the PyTorch backend already installs.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(model_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+
+    # The fast tokenizer writes tokenizer.json, which the tokenizers library reads directly
+    tokenizer.save_pretrained(model_dir)
+
+    class _TokenEmbeddings(torch.nn.Module):
+        # Fixes the input order and passes everything by keyword, whatever the transformers version
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(
+                input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+            ).last_hidden_state
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    model_path = os.path.join(model_dir, MODEL_FILE)
+    export_kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # Newer torch defaults to the dynamo exporter, which needs onnxscript
+        export_kwargs["dynamo"] = False
+    with torch.no_grad():
+        torch.onnx.export(
+            _TokenEmbeddings(model),
+            tuple(sample[name] for name in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            **export_kwargs,
+        )
+    print(f"Exported {model_name} to {model_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized_path = os.path.join(model_dir, QUANTIZED_MODEL_FILE)
+        quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+        print(f"Wrote int8 model to {quantized_path}")
+
+
+def _sample_texts(count):
+    """Stored chunks plus typical search terms, used for parity and benchmarks."""
+    from query_faiss import get_vector_store
+
+    texts = ["diabetes", "hypertension", "HbA1c", "metformin dosage", "fever and cough"]
+    for _, document in get_vector_store().iter_documents():
+        if len(texts) >= count:
+            break
+        texts.append(document.page_content)
+    return texts
+
+
+def parity_check(reference, candidate, texts):
+    """
+    Compare two embedders on the same texts.
+
+    Returns:
+        dict: Minimum and mean cosine similarity between their embeddings.
+    """
+    a = np.array(reference.embed_documents(texts), dtype=np.float32)
+    b = np.array(candidate.embed_documents(texts), dtype=np.float32)
+    cosine = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+    return {"texts": len(texts), "min_cosine": float(cosine.min()), "mean_cosine": float(cosine.mean())}
+
+
+def embeddings_per_second(embedder, texts, repeats=3):
+    """Best-of-n throughput of embed_documents on a list of texts."""
+    embedder.embed_documents(texts[:8])  # warm-up
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        embedder.embed_documents(texts)
+        best = min(best, time.perf_counter() - start)
+    return len(texts) / best
+
+
+def import_time(statement):
+    """Seconds a fresh interpreter needs to run an import statement."""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", statement], check=True)
+    return time.perf_counter() - start
+
+
+def _reference_embeddings():
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ONNX Runtime embedding backend tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="export the model to ONNX")
+    export_parser.add_argument("--no-quantize", action="store_true")
+    parity_parser = subparsers.add_parser("parity", help="cosine similarity against the PyTorch embeddings")
+    parity_parser.add_argument("--texts", type=int, default=200)
+    parity_parser.add_argument("--min-cosine", type=float, default=0.99)
+    bench_parser = subparsers.add_parser("bench", help="embeddings per second and import time")
+    bench_parser.add_argument("--texts", type=int, default=512)
+    bench_parser.add_argument("--output", default=None, help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx(quantize=not args.no_quantize)
+        return
+
+    texts = _sample_texts(args.texts)
+    reference = _reference_embeddings()
+    candidates = {"onnx fp32": OnnxMiniLMEmbeddings(quantized=False)}
+    if os.path.exists(os.path.join(ONNX_MODEL_DIR, QUANTIZED_MODEL_FILE)):
+        candidates["onnx int8"] = OnnxMiniLMEmbeddings(quantized=True)
+
+    if args.command == "parity":
+        failed = False
+        for label, candidate in candidates.items():
+            result = parity_check(reference, candidate, texts)
+            print(f"{label}: min cosine {result['min_cosine']:.4f}, mean {result['mean_cosine']:.4f}")
+            failed = failed or result["min_cosine"] < args.min_cosine
+        sys.exit(1 if failed else 0)
+
+    results = {
+        "texts": len(texts),
+        "import_seconds": {
+            "huggingface": import_time("from langchain_community.embeddings import HuggingFaceEmbeddings; "
+                                       "import sentence_transformers"),
+            "onnx": import_time("import onnxruntime, tokenizers"),
+        },
+        "embeddings_per_second": {"huggingface": embeddings_per_second(reference, texts)},
+    }
+    for label, candidate in candidates.items():
+        results["embeddings_per_second"][label] = embeddings_per_second(candidate, texts)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
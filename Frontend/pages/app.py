@@ -8,14 +8,15 @@ from footer import footer
 # from csv_reader_tool import CSVReaderTool
 # from visualiser_tool import VisualiserTool
 from medical_search_tool import medical_search_tool
-from query_faiss import query_faiss
+from query_faiss import query_faiss, warm_up
+from report_cache import report_cache
+from pdf_extraction import extract_pdf_pages
+from report_analysis import iter_medical_report
+from measurements import Measurement, format_number, format_values
+from batch_reports import collect_uploaded_reports, run_batch
 import os
+import json
 # import tempfile
-import PyPDF2
-import io
-import re
-from typing import Dict, List
-# import json
 
 # Set Page Configuration
 st.set_page_config(
@@ -31,6 +32,9 @@ load_styles()
 # Display navbar
 navbar()
 
+# Load the embedding model and FAISS index in the background while the page renders
+warm_up()
+
 # Initialize session state variables if they don't exist
 if 'hospital_data' not in st.session_state:
     st.session_state.hospital_data = None
@@ -42,245 +46,54 @@ if 'last_analysis' not in st.session_state:
     st.session_state.last_analysis = None
 
 # PDF Processing Functions
-def extract_text_from_pdf(pdf_file):
-    """Extract text content from uploaded PDF file"""
+def extract_pages_from_pdf(pdf_file):
+    """Extract the text of each page of the uploaded PDF file"""
     try:
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_file.read()))
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text.strip()
+        # Pages are read straight from the upload; large reports are extracted by a process pool
+        return extract_pdf_pages(pdf_file)
     except Exception as e:
         st.error(f"Error reading PDF: {str(e)}")
         return None
 
-def extract_medical_values(text: str) -> Dict:
-    """Extract common medical values from text using regex patterns"""
-    values = {}
-    
-    # Blood Pressure patterns
-    bp_patterns = [
-        r'(?:blood pressure|bp|systolic|diastolic)[\s:]*(\d{2,3})[/\-](\d{2,3})',
-        r'(\d{2,3})[/\-](\d{2,3})[\s]*(?:mmhg|mm hg)',
-    ]
-    
-    # Glucose patterns
-    glucose_patterns = [
-        r'(?:glucose|sugar|fbs|rbs)[\s:]*(\d+\.?\d*)[\s]*(?:mg/dl|mmol/l|mg%)',
-        r'(?:fasting glucose|random glucose)[\s:]*(\d+\.?\d*)',
-    ]
-    
-    # Cholesterol patterns
-    cholesterol_patterns = [
-        r'(?:cholesterol|chol)[\s:]*(\d+\.?\d*)[\s]*(?:mg/dl|mmol/l)',
-        r'(?:total cholesterol|tc)[\s:]*(\d+\.?\d*)',
-    ]
-    
-    # Hemoglobin patterns
-    hb_patterns = [
-        r'(?:hemoglobin|hb|haemoglobin)[\s:]*(\d+\.?\d*)[\s]*(?:g/dl|gm/dl)',
-    ]
-    
-    # Temperature patterns
-    temp_patterns = [
-        r'(?:temperature|temp|fever)[\s:]*(\d+\.?\d*)[\s]*(?:°f|°c|f|c)',
-    ]
-    
-    # Heart Rate patterns
-    hr_patterns = [
-        r'(?:heart rate|pulse|hr)[\s:]*(\d+)[\s]*(?:bpm|beats|/min)',
-    ]
-    
-    text_lower = text.lower()
-    
-    # Extract Blood Pressure
-    for pattern in bp_patterns:
-        match = re.search(pattern, text_lower)
-        if match:
-            values['blood_pressure'] = f"{match.group(1)}/{match.group(2)} mmHg"
-            break
-    
-    # Extract Glucose
-    for pattern in glucose_patterns:
-        match = re.search(pattern, text_lower)
-        if match:
-            values['glucose'] = f"{match.group(1)} mg/dL"
-            break
-    
-    # Extract Cholesterol
-    for pattern in cholesterol_patterns:
-        match = re.search(pattern, text_lower)
-        if match:
-            values['cholesterol'] = f"{match.group(1)} mg/dL"
-            break
-    
-    # Extract Hemoglobin
-    for pattern in hb_patterns:
-        match = re.search(pattern, text_lower)
-        if match:
-            values['hemoglobin'] = f"{match.group(1)} g/dL"
-            break
-    
-    # Extract Temperature
-    for pattern in temp_patterns:
-        match = re.search(pattern, text_lower)
-        if match:
-            temp_val = float(match.group(1))
-            # Convert Fahrenheit to Celsius if needed
-            if temp_val > 50:  # Likely Fahrenheit
-                temp_celsius = (temp_val - 32) * 5/9
-                values['temperature'] = f"{temp_celsius:.1f}°C ({temp_val}°F)"
-            else:
-                values['temperature'] = f"{temp_val}°C"
-            break
-    
-    # Extract Heart Rate
-    for pattern in hr_patterns:
-        match = re.search(pattern, text_lower)
-        if match:
-            values['heart_rate'] = f"{match.group(1)} bpm"
-            break
-    
-    return values
+def show_report_sources(slots, analysis, final=False):
+    """Fill the placeholders for FAISS context, web results and the sources still outstanding"""
+    context_slot, info_slot, pending_slot = slots
 
-def interpret_medical_values(values: Dict) -> Dict:
-    """Interpret extracted medical values and provide recommendations"""
-    findings = []
-    recommendations = []
-    
-    # Blood Pressure interpretation
-    if 'blood_pressure' in values:
-        bp_text = values['blood_pressure']
-        systolic = int(bp_text.split('/')[0])
-        diastolic = int(bp_text.split('/')[1].split()[0])
-        
-        if systolic < 90 or diastolic < 60:
-            findings.append(f"Blood pressure: {bp_text} (Low)")
-            recommendations.append("Monitor for symptoms of hypotension")
-        elif systolic <= 120 and diastolic <= 80:
-            findings.append(f"Blood pressure: {bp_text} (Normal)")
-        elif systolic <= 139 or diastolic <= 89:
-            findings.append(f"Blood pressure: {bp_text} (Pre-hypertension)")
-            recommendations.append("Lifestyle modifications recommended")
-        else:
-            findings.append(f"Blood pressure: {bp_text} (High)")
-            recommendations.append("Consult physician for hypertension management")
-    
-    # Glucose interpretation
-    if 'glucose' in values:
-        glucose_text = values['glucose']
-        glucose_val = float(glucose_text.split()[0])
-        
-        if glucose_val < 70:
-            findings.append(f"Glucose: {glucose_text} (Low)")
-            recommendations.append("Monitor for hypoglycemia symptoms")
-        elif glucose_val <= 99:
-            findings.append(f"Glucose: {glucose_text} (Normal)")
-        elif glucose_val <= 125:
-            findings.append(f"Glucose: {glucose_text} (Pre-diabetic)")
-            recommendations.append("Dietary modifications and regular monitoring")
-        else:
-            findings.append(f"Glucose: {glucose_text} (High)")
-            recommendations.append("Diabetes screening and management needed")
-    
-    # Cholesterol interpretation
-    if 'cholesterol' in values:
-        chol_text = values['cholesterol']
-        chol_val = float(chol_text.split()[0])
-        
-        if chol_val < 200:
-            findings.append(f"Cholesterol: {chol_text} (Normal)")
-        elif chol_val <= 239:
-            findings.append(f"Cholesterol: {chol_text} (Borderline high)")
-            recommendations.append("Dietary changes and regular exercise")
-        else:
-            findings.append(f"Cholesterol: {chol_text} (High)")
-            recommendations.append("Lipid management and cardiac risk assessment")
-    
-    # Hemoglobin interpretation
-    if 'hemoglobin' in values:
-        hb_text = values['hemoglobin']
-        hb_val = float(hb_text.split()[0])
-        
-        if hb_val < 12:  # General threshold
-            findings.append(f"Hemoglobin: {hb_text} (Low - Anemia)")
-            recommendations.append("Iron supplementation and dietary counseling")
-        elif hb_val <= 15:
-            findings.append(f"Hemoglobin: {hb_text} (Normal)")
-        else:
-            findings.append(f"Hemoglobin: {hb_text} (High)")
-            recommendations.append("Further evaluation for polycythemia")
-    
-    # Temperature interpretation
-    if 'temperature' in values:
-        temp_text = values['temperature']
-        temp_val = float(temp_text.split('°')[0])
-        
-        if temp_val < 36:
-            findings.append(f"Temperature: {temp_text} (Low)")
-            recommendations.append("Monitor for hypothermia")
-        elif temp_val <= 37.5:
-            findings.append(f"Temperature: {temp_text} (Normal)")
-        else:
-            findings.append(f"Temperature: {temp_text} (Fever)")
-            recommendations.append("Fever management and infection screening")
-    
-    # Heart Rate interpretation
-    if 'heart_rate' in values:
-        hr_text = values['heart_rate']
-        hr_val = int(hr_text.split()[0])
-        
-        if hr_val < 60:
-            findings.append(f"Heart rate: {hr_text} (Bradycardia)")
-            recommendations.append("Cardiac evaluation recommended")
-        elif hr_val <= 100:
-            findings.append(f"Heart rate: {hr_text} (Normal)")
-        else:
-            findings.append(f"Heart rate: {hr_text} (Tachycardia)")
-            recommendations.append("Cardiac assessment and monitoring")
-    
-    return {
-        'findings': findings,
-        'recommendations': recommendations
-    }
+    # Related Knowledge Base Context
+    if analysis['faiss_context']:
+        related_info = "<br><br>".join([f"• {result[:200]}..." for result in analysis['faiss_context']])
+        context_slot.markdown(
+            f"""
+            <div style="background-color: white; padding: 15px; border-radius: 8px; box-shadow: 0 1px 3px rgba(0,0,0,0.1); margin-bottom: 15px;">
+                <span style="color: #d3d3d3;; font-weight: 500;">Related Information:</span><br>
+                <span style="color: black;">{related_info}</span>
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
 
-def analyze_medical_report(pdf_text: str) -> Dict:
-    """Comprehensive analysis of medical report"""
-    # Extract medical values
-    extracted_values = extract_medical_values(pdf_text)
-    
-    # Get interpretations
-    interpretations = interpret_medical_values(extracted_values)
-    
-    # Use FAISS for additional context
-    faiss_results = query_faiss(pdf_text[:500])  # First 500 chars for context
-    
-    # Use medical search for any specific conditions mentioned
-    conditions_found = []
-    condition_patterns = [
-        r'(?:diagnosis|diagnosed with|condition)[\s:]*([a-zA-Z\s]+)',
-        r'(?:hypertension|diabetes|anemia|fever|infection|pneumonia|asthma)',
-    ]
-    
-    for pattern in condition_patterns:
-        matches = re.findall(pattern, pdf_text.lower())
-        conditions_found.extend(matches)
-    
-    additional_info = []
-    for condition in conditions_found[:2]:  # Limit to 2 conditions
-        if condition.strip():
-            search_result = medical_search_tool.func(condition.strip())
-            if search_result and "No reliable information found" not in search_result:
-                additional_info.append(f"About {condition}: {search_result[:200]}...")
-    
-    return {
-        'extracted_values': extracted_values,
-        'findings': interpretations['findings'],
-        'recommendations': interpretations['recommendations'],
-        'faiss_context': faiss_results[:2],  # Top 2 relevant results
-        'additional_info': additional_info,
-        'raw_text_preview': pdf_text[:300] + "..." if len(pdf_text) > 300 else pdf_text
-    }
+    # Additional Medical Information
+    if analysis['additional_info']:
+        additional_html = "<br><br>".join([
+            f'<span style="color: black;">{info}</span>'
+            for info in analysis['additional_info']
+        ])
+        info_slot.markdown(
+            f"""
+            <div style="background-color: #f8f9ff; padding: 15px; border-radius: 8px; box-shadow: 0 1px 3px rgba(0,0,0,0.1); margin-bottom: 15px;">
+                <span style="color: #d3d3d3;; font-weight: 500;">Additional Medical Information:</span><br>
+                {additional_html}
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
+
+    if not analysis['pending']:
+        pending_slot.empty()
+    elif final:
+        pending_slot.info("Still pending (timed out or failed, retried on the next run): " + ", ".join(analysis['pending']))
+    else:
+        pending_slot.caption("⏳ Looking up: " + ", ".join(analysis['pending']))
 
 # Initialize hospital manager and tools (keeping existing functionality)
 # @st.cache_resource
@@ -369,103 +182,156 @@ with col1:
     uploaded_file = st.file_uploader("Drag and drop your patient report (PDF)", type="pdf", key="pdf")
     
     if uploaded_file:
-        # Process the uploaded PDF
-        with st.spinner("Analyzing your medical report..."):
-            # Extract text from PDF
-            pdf_text = extract_text_from_pdf(uploaded_file)
+        # Reuse the analysis of a report that was already processed (same bytes), so reruns skip the work
+        report_key = report_cache.report_key(uploaded_file.getvalue())
+        analysis_result = report_cache.get(report_key)
+        analysis_updates = None
+
+        if analysis_result is None:
+            with st.spinner("Analyzing your medical report..."):
+                # Extract text from PDF (page by page, so readings keep their page numbers)
+                pdf_pages = extract_pages_from_pdf(uploaded_file)
+                pdf_text = "\n".join(pdf_pages).strip() if pdf_pages else None
+
+                if pdf_text:
+                    # Values and findings are shown as soon as the extraction is done; FAISS context
+                    # and web results fill their placeholders below as they arrive
+                    analysis_updates = iter_medical_report(pdf_text, pdf_pages)
+                    analysis_result = next(analysis_updates)
+        
+        if analysis_result:
+            st.session_state.last_analysis = analysis_result
+            
+            # Display success message
+            st.markdown(
+                """
+                <div class="success-message">
+                    <svg xmlns="http://www.w3.org/2000/svg" width="20" height="20" viewBox="0 0 24 24" fill="none" stroke="#34C759" stroke-width="2" stroke-linecap="round" stroke-linejoin="round" style="vertical-align: middle; margin-right: 8px;">
+                        <path d="M22 11.08V12a10 10 0 1 1-5.93-9.14"></path>
+                        <polyline points="22 4 12 14.01 9 11.01"></polyline>
+                    </svg>
+                    Report uploaded and analyzed successfully!
+                </div>
+                """,
+                unsafe_allow_html=True
+            )
+            
+            # Display Dynamic Analysis Results
+            st.markdown(
+                """
+                <div style="margin-top: 20px;">
+                    <h3 style="color: grey; font-size: 1.2rem; font-weight: 600;">AI Analysis Results:</h3>
+                """,
+                unsafe_allow_html=True
+            )
             
-            if pdf_text:
-                # Analyze the medical report
-                analysis_result = analyze_medical_report(pdf_text)
-                st.session_state.last_analysis = analysis_result
-                
-                # Display success message
+            # Key Findings
+            if analysis_result['findings']:
+                findings_html = "<br>".join([
+                f'<span style="color: black;">• {finding}</span>' 
+                for finding in analysis_result['findings']
+            ])
+
                 st.markdown(
-                    """
-                    <div class="success-message">
-                        <svg xmlns="http://www.w3.org/2000/svg" width="20" height="20" viewBox="0 0 24 24" fill="none" stroke="#34C759" stroke-width="2" stroke-linecap="round" stroke-linejoin="round" style="vertical-align: middle; margin-right: 8px;">
-                            <path d="M22 11.08V12a10 10 0 1 1-5.93-9.14"></path>
-                            <polyline points="22 4 12 14.01 9 11.01"></polyline>
-                        </svg>
-                        Report uploaded and analyzed successfully!
+                    f"""
+                    <div style="background-color: white; padding: 15px; border-radius: 8px; box-shadow: 0 1px 3px rgba(0,0,0,0.1); margin-bottom: 15px;">
+                        <span style="color: #d3d3d3; font-weight: 500;">Key Findings:</span><br>
+                        {findings_html}
                     </div>
                     """,
                     unsafe_allow_html=True
                 )
-                
-                # Display Dynamic Analysis Results
+            
+            # Recommendations
+            if analysis_result['recommendations']:
+                recommendations_html = "<br>".join([
+                f'<span style="color: black;">• {rec}</span>'
+                for rec in analysis_result['recommendations']
+            ])
                 st.markdown(
-                    """
-                    <div style="margin-top: 20px;">
-                        <h3 style="color: grey; font-size: 1.2rem; font-weight: 600;">AI Analysis Results:</h3>
+                    f"""
+                    <div style="background-color: white; padding: 15px; border-radius: 8px; box-shadow: 0 1px 3px rgba(0,0,0,0.1); margin-bottom: 15px;">
+                        <span style="color: #d3d3d3;; font-weight: 500;">Recommendations:</span><br>
+                        {recommendations_html}
+                    </div>
                     """,
                     unsafe_allow_html=True
                 )
-                
-                # Key Findings
-                if analysis_result['findings']:
-                    findings_html = "<br>".join([
-                    f'<span style="color: black;">• {finding}</span>' 
-                    for finding in analysis_result['findings']
-                ])
-
-                    st.markdown(
-                        f"""
-                        <div style="background-color: white; padding: 15px; border-radius: 8px; box-shadow: 0 1px 3px rgba(0,0,0,0.1); margin-bottom: 15px;">
-                            <span style="color: #d3d3d3; font-weight: 500;">Key Findings:</span><br>
-                            {findings_html}
-                        </div>
-                        """,
-                        unsafe_allow_html=True
-                    )
-                
-                # Recommendations
-                if analysis_result['recommendations']:
-                    recommendations_html = "<br>".join([
-                    f'<span style="color: black;">• {rec}</span>'
-                    for rec in analysis_result['recommendations']
-                ])
-                    st.markdown(
-                        f"""
-                        <div style="background-color: white; padding: 15px; border-radius: 8px; box-shadow: 0 1px 3px rgba(0,0,0,0.1); margin-bottom: 15px;">
-                            <span style="color: #d3d3d3;; font-weight: 500;">Recommendations:</span><br>
-                            {recommendations_html}
-                        </div>
-                        """,
-                        unsafe_allow_html=True
-                    )
-                
-                # Additional Medical Information
-                if analysis_result['additional_info']:
-                    additional_html = "<br><br>".join([
-                    f'<span style="color: black;">{info}</span>' 
-                    for info in analysis_result['additional_info']
-                ])
+            
+            # Sources that arrive after the findings
+            source_slots = (st.empty(), st.empty(), st.empty())
+            show_report_sources(source_slots, analysis_result, final=analysis_updates is None)
+            
+            # Raw Values Extracted (for debugging/transparency)
+            if analysis_result['measurements']:
+                with st.expander("📊 Extracted Medical Values"):
+                    st.json(format_values([Measurement.from_record(record)
+                                           for record in analysis_result['measurements']]))
 
-                    st.markdown(
-                        f"""
-                        <div style="background-color: #f8f9ff; padding: 15px; border-radius: 8px; box-shadow: 0 1px 3px rgba(0,0,0,0.1); margin-bottom: 15px;">
-                            <span style="color: #d3d3d3;; font-weight: 500;">Additional Medical Information:</span><br>
-                            {additional_html}
-                        </div>
-                        """,
-                        unsafe_allow_html=True
-                    )
-                
-                # Raw Values Extracted (for debugging/transparency)
-                if analysis_result['extracted_values']:
-                    with st.expander("📊 Extracted Medical Values"):
-                        st.json(analysis_result['extracted_values'])
-                
-                # Text Preview (for debugging)
+            # Every reading of analytes measured more than once (multi-visit reports)
+            repeated = {name: series for name, series in analysis_result.get('time_series', {}).items()
+                        if len(series['values']) > 1}
+            if repeated:
+                with st.expander("📈 Readings Over Time"):
+                    for name, series in repeated.items():
+                        st.markdown(f"**{name.replace('_', ' ').title()}**")
+                        st.table([
+                            {"Date": date or "", "Value": f"{format_number(value, unit)} {unit}", "Page": page}
+                            for value, unit, date, page in zip(series['values'], series['units'],
+                                                               series['dates'], series['pages'])
+                        ])
+            
+            # Text Preview (for debugging); analyses read back from the disk cache have none
+            if analysis_result.get('raw_text_preview'):
                 with st.expander("📄 Document Preview"):
-                    st.text_area("Extracted Text (Preview)", analysis_result['raw_text_preview'], height=150, disabled=True)
-                
-                st.markdown("</div>", unsafe_allow_html=True)
+                    st.text_area("Extracted Text (Preview)", analysis_result['raw_text_preview'], height=150,
+                                 disabled=True)
             
-            else:
-                st.error("Could not extract text from the PDF. Please ensure the file is not corrupted and contains readable text.")
-    
+            if analysis_updates is not None:
+                for update in analysis_updates:
+                    analysis_result.update(update)
+                    show_report_sources(source_slots, analysis_result)
+                show_report_sources(source_slots, analysis_result, final=True)
+                # Results missing a late source are not cached, so the next run can fill them in
+                if not analysis_result['pending']:
+                    report_cache.put(report_key, analysis_result)
+            
+            st.markdown("</div>", unsafe_allow_html=True)
+        
+        else:
+            st.error("Could not extract text from the PDF. Please ensure the file is not corrupted and contains readable text.")
+    
+    # Batch mode: analyze a ZIP archive or several PDFs across a pool of worker processes
+    with st.expander("📁 Batch Analysis (ZIP or multiple PDFs)"):
+        batch_files = st.file_uploader("Upload a ZIP of reports or several PDFs", type=["pdf", "zip"],
+                                       accept_multiple_files=True, key="batch_pdfs")
+        if batch_files and st.button("Analyze batch", key="batch_button"):
+            batch_tasks = collect_uploaded_reports(batch_files)
+            progress_bar = st.progress(0.0, text=f"Analyzing {len(batch_tasks)} reports...")
+
+            def show_progress(done, total, row):
+                progress_bar.progress(done / total, text=f"Analyzed {done}/{total}: {row['report']}")
+
+            st.session_state.batch_results = run_batch(batch_tasks, on_result=show_progress)
+
+        if st.session_state.get('batch_results'):
+            batch_rows = st.session_state.batch_results
+            st.dataframe([
+                {
+                    "Report": row['report'],
+                    "Findings": "; ".join(row['findings']),
+                    "Recommendations": "; ".join(row['recommendations']),
+                    "Error": row['error'] or "",
+                }
+                for row in batch_rows
+            ])
+            st.download_button(
+                "Download results (JSONL)",
+                data="".join(json.dumps(row) + "\n" for row in batch_rows),
+                file_name="report_results.jsonl",
+                mime="application/json",
+            )
+
     st.markdown("</div>", unsafe_allow_html=True)
 
 with col2:
@@ -553,7 +419,9 @@ with col2:
         analysis = st.session_state.last_analysis
         st.write(f"**Findings:** {len(analysis['findings'])} items identified")
         st.write(f"**Recommendations:** {len(analysis['recommendations'])} suggestions")
-        st.write(f"**Values Extracted:** {len(analysis['extracted_values'])} parameters")
+        # Counted like the values table, so blood pressure is one parameter rather than two readings
+        values = format_values([Measurement.from_record(record) for record in analysis['measurements']])
+        st.write(f"**Values Extracted:** {len(values)} parameters")
         
         st.markdown("</div>", unsafe_allow_html=True)
     
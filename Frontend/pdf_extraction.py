@@ -0,0 +1,187 @@
+"""
+Page-level text extraction for PDF reports.
+
+iter_pdf_pages() yields (page number, text) pairs in page order. Small
+documents are read in the calling thread straight from the upload stream
+(no copy into a new buffer); documents with at least PDF_PARALLEL_MIN_PAGES
+pages are split into page ranges that a shared, lazily started process
+pool extracts in parallel, with only a few ranges in flight at a time.
+Workers open the document by path (uploads are written to a temporary
+file once) rather than receiving its bytes. Closing the generator early
+cancels the ranges that have not started, so callers can stop as soon as
+they have what they need.
+
+extract_pdf_text() joins the pages once, optionally stopping after a page
+or character budget; extract_pdf_pages() keeps them apart, for callers
+that report page numbers.
+"""
+import multiprocessing
+import os
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import PyPDF2
+
+from retrieval_config import PDF_PARALLEL_MIN_PAGES, PDF_WORKERS
+
+# Pages per task sent to a worker process
+PAGES_PER_TASK = 8
+
+# Process pools shared by every extraction in the process, per worker count; created on first use
+# with the spawn start method, since forking the multi-threaded Streamlit server is unsafe
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Worker-process state: (document key, reader) of the document last extracted
+_worker_reader = (None, None)
+
+
+def _extract_range(task):
+    global _worker_reader
+    document, path, start, end = task
+    if _worker_reader[0] != document:
+        _worker_reader = (document, PyPDF2.PdfReader(path))
+    reader = _worker_reader[1]
+    return [reader.pages[number].extract_text() or "" for number in range(start, end)]
+
+
+def _get_pool(workers):
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pools[workers] = pool
+        return pool
+
+
+def _discard_pool(workers, pool):
+    """Drop a pool whose worker died, so the next extraction starts a new one."""
+    with _pools_lock:
+        if _pools.get(workers) is pool:
+            del _pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _open_reader(source):
+    """PdfReader over a path, bytes or a readable binary stream (read in place, not copied)."""
+    if isinstance(source, (bytes, bytearray)):
+        import io
+        source = io.BytesIO(source)
+    elif hasattr(source, "seek"):
+        source.seek(0)
+    return PyPDF2.PdfReader(source)
+
+
+def _worker_path(source):
+    """
+    A path the worker processes can open: the source's own path, or a temporary copy of its bytes.
+
+    Returns:
+        tuple: (path, whether it is a temporary file to remove afterwards).
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source), False
+    if isinstance(source, (bytes, bytearray)):
+        data = source
+    elif hasattr(source, "getbuffer"):
+        data = source.getbuffer()
+    else:
+        source.seek(0)
+        data = source.read()
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        f.write(data)
+    return f.name, True
+
+
+def iter_pdf_pages(source, max_pages=None, workers=PDF_WORKERS, parallel_min_pages=PDF_PARALLEL_MIN_PAGES):
+    """
+    Yield the text of each page of a PDF, in order.
+
+    Args:
+        source: Path, bytes or binary file-like object (e.g. a Streamlit upload).
+        max_pages (int): Stop after this many pages.
+        workers (int): Worker processes for large documents (default: all cores).
+        parallel_min_pages (int): Page count from which the process pool is used.
+
+    Yields:
+        tuple: (page number starting at 0, page text).
+    """
+    reader = _open_reader(source)
+    page_count = len(reader.pages)
+    if max_pages is not None:
+        page_count = min(page_count, max_pages)
+
+    workers = workers or os.cpu_count() or 1
+    if page_count < parallel_min_pages or workers < 2:
+        for number in range(page_count):
+            yield number, reader.pages[number].extract_text() or ""
+        return
+
+    # Workers read the document from disk, so its bytes are never pickled into the pool
+    path, temporary = _worker_path(source)
+    document = uuid.uuid4().hex
+    tasks = [(document, path, start, min(start + PAGES_PER_TASK, page_count))
+             for start in range(0, page_count, PAGES_PER_TASK)]
+    pool = _get_pool(workers)
+    pending = []
+    try:
+        # Keep a bounded window of ranges in flight, so an early stop leaves little work behind
+        next_task = 0
+        while next_task < len(tasks) or pending:
+            while next_task < len(tasks) and len(pending) < 2 * workers:
+                pending.append((tasks[next_task][2], pool.submit(_extract_range, tasks[next_task])))
+                next_task += 1
+            start, future = pending.pop(0)
+            try:
+                texts = future.result()
+            except BrokenProcessPool:
+                _discard_pool(workers, pool)
+                raise
+            for offset, text in enumerate(texts):
+                yield start + offset, text
+    finally:
+        # The pool is shared; only this document's ranges that have not started are cancelled
+        for _, future in pending:
+            future.cancel()
+        if temporary:
+            os.remove(path)
+
+
+def extract_pdf_pages(source, max_pages=None, workers=PDF_WORKERS):
+    """
+    Extract the text of each page of a PDF.
+
+    Returns:
+        list: Page texts in order; "\n".join(pages).strip() equals extract_pdf_text().
+    """
+    return [text for _, text in iter_pdf_pages(source, max_pages=max_pages, workers=workers)]
+
+
+def extract_pdf_text(source, max_pages=None, max_chars=None, workers=PDF_WORKERS):
+    """
+    Extract the text of a PDF, one line break between pages.
+
+    Args:
+        source: Path, bytes or binary file-like object.
+        max_pages (int): Only read this many pages.
+        max_chars (int): Stop reading pages once this many characters were extracted.
+        workers (int): Worker processes for large documents.
+
+    Returns:
+        str: The extracted text, stripped.
+    """
+    pages = []
+    length = 0
+    page_iterator = iter_pdf_pages(source, max_pages=max_pages, workers=workers)
+    try:
+        for _, text in page_iterator:
+            pages.append(text)
+            length += len(text) + 1
+            if max_chars is not None and length >= max_chars:
+                break
+    finally:
+        page_iterator.close()
+    return "\n".join(pages).strip()
@@ -1,33 +1,506 @@
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings  # Updated import
-
-# Initialize Hugging Face Embeddings
-model_name = "sentence-transformers/all-MiniLM-L6-v2"
-huggingface_embeddings = HuggingFaceEmbeddings(model_name=model_name)
-
-# Load FAISS Index with Hugging Face Embeddings
-vector_store = FAISS.load_local(
-    r"C:\Users\Divyanshu\Desktop\ML projects\HealthCareSystem\faiss_index",  # Path to the FAISS index
-    embeddings=huggingface_embeddings,
-    allow_dangerous_deserialization=True  # Allow loading of pickle files
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+from resource_registry import registry
+from embedding_cache import EmbeddingCache
+from retrieval_config import (
+    FAISS_INDEX_PATH, EMBEDDING_MODEL_NAME, EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_PATH,
+    FAISS_INDEX_MODE, FAISS_SHARDS, FAISS_RELOAD_INTERVAL, EMBEDDING_BACKEND, ONNX_QUANTIZED,
+    RETRIEVAL_MODE, LEXICAL_FAST_PATH_MAX_TOKENS, HYBRID_CANDIDATES, RRF_K, QUERY_LOG_PATH,
+    RETRIEVAL_SERVER_URL, RETRIEVAL_SERVER_TIMEOUT, RETRIEVAL_SERVER_RETRY_INTERVAL,
+    REPORT_CHUNK_SIZE, REPORT_CHUNK_OVERLAP, REPORT_MAX_CHUNKS, RETRIEVAL_VERBOSE
 )
 
+# Version of faiss_index/ the loaded store was read from, and when it was last checked
+_store_state = {"version": None, "checked_at": 0.0}
+_store_state_lock = threading.Lock()
+_query_log_lock = threading.Lock()
+
+# When the retrieval server was last found unreachable (searches run in-process until the retry interval passes)
+_server_state = {"down_since": None}
+
+
+def _store_version():
+    """Modification times of the index files, which change whenever faiss_ingest writes."""
+    version = []
+    for name in sorted(os.listdir(FAISS_INDEX_PATH)):
+        if name.startswith(("index", "vectors", "docstore", "bm25", "metadata")) or name == "tombstones.json":
+            version.append((name, os.path.getmtime(os.path.join(FAISS_INDEX_PATH, name))))
+    return tuple(version)
+
+
+# Loaders for the shared resources (run once per process, on first use)
+def _load_embeddings():
+    if EMBEDDING_BACKEND == "onnx":
+        from onnx_embeddings import OnnxMiniLMEmbeddings
+
+        # Same model through ONNX Runtime (optionally int8), without importing PyTorch
+        return OnnxMiniLMEmbeddings()
+
+    from langchain_community.embeddings import HuggingFaceEmbeddings  # Updated import
+
+    # Initialize Hugging Face Embeddings
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+
+
+def _embedder_id():
+    """Identifies the model and backend, so cached embeddings from another backend are not reused."""
+    if EMBEDDING_BACKEND == "onnx":
+        return f"{EMBEDDING_MODEL_NAME}:onnx{'-int8' if ONNX_QUANTIZED else ''}"
+    return EMBEDDING_MODEL_NAME
+
+
+def _load_vector_store():
+    from compact_store import is_compact, open_vector_store
+
+    # Read the version first, so a write during loading triggers another reload
+    _store_state["version"] = _store_version()
+
+    # The compact format (memory-mapped vectors + SQLite docstore) needs no model to
+    # load; the LangChain format unpickles index.pkl with the Hugging Face Embeddings
+    embeddings = None if is_compact(FAISS_INDEX_PATH) else registry.get("embeddings")
+    vector_store = open_vector_store(FAISS_INDEX_PATH, embeddings)
+
+    # Split the vectors into shards searched in parallel (row ids stay global)
+    if FAISS_SHARDS > 1:
+        from sharded_index import load_sharded_index
+        vector_store.index = load_sharded_index(FAISS_INDEX_MODE, FAISS_SHARDS, exact_index=vector_store.index)
+    # Swap in an approximate index built from the same vectors (row ids are unchanged)
+    elif FAISS_INDEX_MODE != "flat":
+        from ann_index import load_ann_index
+        vector_store.index = load_ann_index(FAISS_INDEX_MODE)
+    return vector_store
+
+
+def _load_deleted_rows():
+    from faiss_ingest import load_tombstones
+    import faiss
+
+    # Translate tombstoned document ids into FAISS rows to exclude from searches
+    tombstones = load_tombstones(FAISS_INDEX_PATH)
+    # Read the store without the reload check: resetting resources from inside a loader would
+    # try to take this resource's lock again and deadlock
+    rows = registry.get("vector_store").rows_for_ids(tombstones) if tombstones else []
+    if not rows:
+        return None
+    rows = np.array(rows, dtype=np.int64)
+    deleted = faiss.IDSelectorBatch(rows)
+    selector = faiss.IDSelectorNot(deleted)
+    # Keep the inner selector alive for as long as the outer one is used
+    selector.referenced_objects = [deleted]
+    return rows, selector
+
+
+def _load_lexical_index():
+    from lexical_index import BM25Index, lexical_index_path
+
+    path = lexical_index_path(FAISS_INDEX_PATH)
+    if not os.path.exists(path):
+        # Loaded again after every reload, so the hint is only printed when verbose
+        if RETRIEVAL_VERBOSE:
+            print("No BM25 index found (run 'python lexical_index.py build'); using vector search only")
+        return None
+    return BM25Index.load(path)
+
+
+def _load_metadata_index():
+    from metadata_index import MetadataIndex, metadata_index_path
+
+    path = metadata_index_path(FAISS_INDEX_PATH)
+    return MetadataIndex.load(path) if os.path.exists(path) else None
+
+
+def _load_embedding_cache():
+    return EmbeddingCache(
+        max_size=EMBEDDING_CACHE_SIZE,
+        path=EMBEDDING_CACHE_PATH or None,
+        model_name=_embedder_id(),
+    )
+
+
+registry.register("embeddings", _load_embeddings)
+registry.register("vector_store", _load_vector_store)
+registry.register("embedding_cache", _load_embedding_cache)
+registry.register("deleted_rows", _load_deleted_rows)
+registry.register("lexical_index", _load_lexical_index)
+registry.register("metadata_index", _load_metadata_index)
+
+
+def get_embeddings():
+    """Return the process-wide embedding model, loading it if needed."""
+    return registry.get("embeddings")
+
+
+def _reload_if_changed():
+    """Drop the loaded store if faiss_ingest changed it (checked at most every FAISS_RELOAD_INTERVAL s)."""
+    now = time.monotonic()
+    with _store_state_lock:
+        if not registry.is_loaded("vector_store") or now - _store_state["checked_at"] < FAISS_RELOAD_INTERVAL:
+            return
+        _store_state["checked_at"] = now
+    if _store_version() != _store_state["version"]:
+        registry.reset("vector_store")
+        registry.reset("deleted_rows")
+        registry.reset("lexical_index")
+        registry.reset("metadata_index")
+
+
+def get_vector_store():
+    """Return the process-wide FAISS vector store, loading it if needed."""
+    _reload_if_changed()
+    return registry.get("vector_store")
+
+
+def warm_up():
+    """Start loading the embedding model and FAISS index in the background, unless the server has them."""
+    if _server_available() and _server_request("/health", timeout=1.0) is not None:
+        return None
+    return registry.warm_up(["embeddings", "vector_store"])
+
+
+def load_times():
+    """Return how long each retrieval resource took to load, in seconds."""
+    return registry.load_times()
+
+
+def embedding_cache_stats():
+    """Return hit/miss counters of the query embedding cache."""
+    return registry.get("embedding_cache").stats()
+
+
+def embed_queries(queries, cache_embeddings=True):
+    """
+    Embed query strings, reusing cached embeddings where possible.
+
+    Only the queries missing from the cache go through the model, all in
+    one forward pass.
+
+    Args:
+        queries (list): The query strings to embed.
+        cache_embeddings (bool): Look up and store the embeddings in the
+            query embedding cache. Off for one-off texts, such as document
+            chunks, that would only evict the embeddings of repeated queries.
+
+    Returns:
+        list: One embedding vector per query, in input order.
+    """
+    cache = registry.get("embedding_cache") if cache_embeddings else None
+    vectors = [cache.get(query) for query in queries] if cache else [None] * len(queries)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+
+    if missing:
+        # Queries that normalize to the same key are embedded once
+        pending = {}
+        for i in missing:
+            pending.setdefault(EmbeddingCache.normalize(queries[i]), []).append(i)
+        new_vectors = get_embeddings().embed_documents([queries[ids[0]] for ids in pending.values()])
+        for ids, vector in zip(pending.values(), new_vectors):
+            if cache:
+                cache.put(queries[ids[0]], vector)
+            for i in ids:
+                vectors[i] = vector
+    return vectors
+
+
+def _allowed_rows(filters):
+    """Rows whose metadata matches the filters, minus deleted rows (None means no restriction)."""
+    if not filters:
+        return None
+    metadata_index = registry.get("metadata_index")
+    if metadata_index is None:
+        raise ValueError("Metadata filters need a metadata index; run 'python metadata_index.py build'")
+    rows = metadata_index.rows_matching(filters)
+    deleted_rows = registry.get("deleted_rows")
+    if deleted_rows is not None:
+        rows = np.setdiff1d(rows, deleted_rows[0], assume_unique=True)
+    return rows
+
+
+def _search_vectors(vectors, k, allowed_rows=None):
+    """
+    Search the FAISS index with a matrix of query vectors in a single call.
+
+    Args:
+        vectors (list): Query embeddings, one row per query.
+        k (int): Number of neighbours to return per query.
+        allowed_rows (np.ndarray): If given, only these rows are searched.
+
+    Returns:
+        tuple: (scores, rows) arrays of shape (n_queries, k); missing hits have row -1.
+    """
+    import faiss
+
+    vector_store = get_vector_store()
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    if vector_store.normalize_L2:
+        faiss.normalize_L2(matrix)
+
+    index = vector_store.index
+    if FAISS_SHARDS > 1:
+        # Each shard builds its own selectors from the global row arrays
+        deleted_rows = registry.get("deleted_rows")
+        excluded = deleted_rows[0] if deleted_rows is not None and allowed_rows is None else None
+        return index.search(matrix, k, allowed_rows=allowed_rows, excluded_rows=excluded)
+
+    # Restrict the search to the filtered rows, and never return documents deleted by faiss_ingest
+    if allowed_rows is not None:
+        selector = faiss.IDSelectorBatch(allowed_rows)
+    else:
+        deleted_rows = registry.get("deleted_rows")
+        selector = deleted_rows[1] if deleted_rows is not None else None
+
+    if selector is not None:
+        from ann_index import search_params
+        params = search_params(index, selector)
+        return index.search(matrix, k, params=params)
+    return index.search(matrix, k)
+
+
+def _vector_hits(queries, k, allowed_rows=None, cache_embeddings=True):
+    """Embed queries in one batch and search them in one FAISS call; (row, distance) pairs per query."""
+    if not queries:
+        return []
+    if allowed_rows is not None and len(allowed_rows) == 0:
+        return [[] for _ in queries]
+
+    # Generate all query embeddings in one forward pass (cached ones are skipped)
+    query_embeddings = embed_queries(list(queries), cache_embeddings)
+
+    # Perform one similarity search for the whole batch
+    scores, rows = _search_vectors(query_embeddings, k, allowed_rows)
+    return [
+        [(int(row), float(score)) for score, row in zip(query_scores, query_rows) if row != -1]
+        for query_scores, query_rows in zip(scores, rows)
+    ]
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Fuse several rankings of rows with reciprocal rank fusion.
+
+    Args:
+        rankings (list): Lists of (row, score) pairs, each best first.
+        k (int): RRF constant; larger values flatten the weight of top ranks.
+
+    Returns:
+        list: (row, fused score) pairs, best first.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, (row, _) in enumerate(ranking):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def _is_keyword_query(query, lexical_index):
+    """Short queries made only of indexed terms, e.g. "metformin" or "HbA1c"."""
+    from lexical_index import tokenize
+
+    tokens = tokenize(query)
+    return 0 < len(tokens) <= LEXICAL_FAST_PATH_MAX_TOKENS and all(lexical_index.known(t) for t in tokens)
+
+
+def _retrieve(queries, k, mode, filters=None, cache_embeddings=True):
+    """Return (row, score) hits per query for the given retrieval mode and metadata filters."""
+    allowed = _allowed_rows(filters)
+    lexical_index = registry.get("lexical_index") if mode != "vector" else None
+    if lexical_index is None:
+        return _vector_hits(queries, k, allowed, cache_embeddings)
+
+    deleted_rows = registry.get("deleted_rows")
+    excluded = deleted_rows[0] if deleted_rows is not None else None
+
+    def lexical_search(query, depth):
+        return lexical_index.search(query, depth, excluded_rows=excluded, allowed_rows=allowed)
+
+    if mode == "lexical":
+        return [lexical_search(query, k) for query in queries]
+
+    hits = [None] * len(queries)
+    to_embed = []
+    for i, query in enumerate(queries):
+        # Fast path: keyword queries are answered by BM25 alone, without an embedding
+        if _is_keyword_query(query, lexical_index):
+            lexical_hits = lexical_search(query, k)
+            if len(lexical_hits) >= k:
+                hits[i] = lexical_hits
+                continue
+        to_embed.append(i)
+
+    depth = max(k, HYBRID_CANDIDATES)
+    vector_hits = _vector_hits([queries[i] for i in to_embed], depth, allowed, cache_embeddings)
+    for i, query_vector_hits in zip(to_embed, vector_hits):
+        lexical_hits = lexical_search(queries[i], depth)
+        hits[i] = reciprocal_rank_fusion([query_vector_hits, lexical_hits])[:k]
+    return hits
+
+
+def _hits_to_results(hits):
+    """Replace row ids with document text, looking up every returned row once."""
+    rows = sorted({row for query_hits in hits for row, _ in query_hits})
+    documents = dict(zip(rows, get_vector_store().get_documents(rows)))
+    return [[(documents[row].page_content, score) for row, score in query_hits] for query_hits in hits]
+
+
+def _log_queries(queries, k, mode, filters):
+    """Append the queries to QUERY_LOG_PATH, so real traffic can be replayed by retrieval_benchmark.py."""
+    if not QUERY_LOG_PATH:
+        return
+    now = time.time()
+    lines = "".join(
+        json.dumps({"time": now, "query": query, "k": k, "mode": mode, "filters": filters}) + "\n"
+        for query in queries
+    )
+    with _query_log_lock, open(QUERY_LOG_PATH, "a", encoding="utf-8") as f:
+        f.write(lines)
+
+
+def _server_available():
+    """Whether a retrieval server is configured and was not found down recently."""
+    if not RETRIEVAL_SERVER_URL:
+        return False
+    down_since = _server_state["down_since"]
+    return down_since is None or time.monotonic() - down_since >= RETRIEVAL_SERVER_RETRY_INTERVAL
+
+
+def _server_request(path, payload=None, timeout=RETRIEVAL_SERVER_TIMEOUT):
+    """
+    Call the retrieval server.
+
+    Returns:
+        dict: The decoded JSON response, or None if the server cannot be reached
+            (it is then skipped for RETRIEVAL_SERVER_RETRY_INTERVAL seconds).
+
+    Raises:
+        ValueError: If the server rejected the request (e.g. invalid filters).
+    """
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    request = urllib.request.Request(
+        RETRIEVAL_SERVER_URL.rstrip("/") + path, data=data, headers={"Content-Type": "application/json"}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            body = json.loads(response.read().decode("utf-8"))
+    except urllib.error.HTTPError as error:
+        if error.code == 400:
+            raise ValueError(json.loads(error.read().decode("utf-8"))["error"])
+        _server_state["down_since"] = time.monotonic()
+        return None
+    except (urllib.error.URLError, OSError, ValueError):
+        _server_state["down_since"] = time.monotonic()
+        return None
+    _server_state["down_since"] = None
+    return body
+
+
+def search_local(queries, k=3, mode=RETRIEVAL_MODE, filters=None, cache_embeddings=True):
+    """Run a batch of queries against the model and index loaded in this process."""
+    return _hits_to_results(_retrieve(list(queries), k, mode, filters, cache_embeddings))
+
+
+# Function to Query FAISS with many queries at once
+def query_faiss_batch(queries, k=3, mode=None, filters=None, cache_embeddings=True, log_queries=True):
+    """
+    Query the FAISS vector store with several queries in one batch.
+
+    If a retrieval server is running (see retrieval_server.py) the batch is
+    sent to it; otherwise it is searched in-process. Either way all uncached
+    queries are embedded in a single forward pass and the whole batch is
+    searched as one matrix in a single FAISS call.
+
+    Args:
+        queries (list): The query strings to search for.
+        k (int): Number of matches to return per query.
+        mode (str): "vector", "hybrid" (BM25 and FAISS fused with reciprocal
+            rank fusion) or "lexical". Defaults to RETRIEVAL_MODE.
+        filters (dict): Metadata conditions, e.g. {"doc_type": "fda_label"};
+            only matching chunks are searched (see metadata_index.py).
+        cache_embeddings (bool): Use the query embedding cache (see embed_queries).
+        log_queries (bool): Append the queries to QUERY_LOG_PATH. Off for
+            texts that are not user queries, such as document chunks.
+
+    Returns:
+        list: One list per query of (document text, score) tuples, best first.
+            In vector mode the score is the FAISS distance, so lower means
+            closer; BM25 and fused scores are higher for better matches.
+    """
+    if not queries:
+        return []
+    mode = mode or RETRIEVAL_MODE
+    if log_queries:
+        _log_queries(queries, k, mode, filters)
+
+    if _server_available():
+        payload = {"queries": list(queries), "k": k, "mode": mode, "filters": filters,
+                   "cache_embeddings": cache_embeddings}
+        response = _server_request("/query", payload)
+        if response is not None:
+            return [[(text, score) for text, score in results] for results in response["results"]]
+    return search_local(queries, k, mode, filters, cache_embeddings)
+
+
 # Function to Query FAISS
-def query_faiss(query):
+def query_faiss(query, mode=None, filters=None):
     """
     Query the FAISS vector store and return the top 3 matches.
 
     Args:
         query (str): The query string to search for.
+        mode (str): Retrieval mode, see query_faiss_batch. Defaults to RETRIEVAL_MODE.
+        filters (dict): Metadata conditions, see query_faiss_batch.
 
     Returns:
         list: A list of the top 3 matching documents (as strings).
     """
-    # Generate query embedding
-    query_embedding = huggingface_embeddings.embed_query(query)
-    
-    # Perform similarity search
-    results = vector_store.similarity_search_by_vector(query_embedding, k=3)
-    
+    # A single query is a batch of one
+    results = query_faiss_batch([query], k=3, mode=mode, filters=filters)[0]
+
     # Return results as a list of strings
-    return [doc.page_content for doc in results]
\ No newline at end of file
+    return [text for text, _ in results]
+
+
+def query_faiss_document(text, k=3, per_chunk=5, mode=None, filters=None):
+    """
+    Retrieve context for a whole document, such as a medical report.
+
+    The text is split into chunks (REPORT_CHUNK_SIZE characters) that are
+    searched as one query_faiss_batch call, so a full report still takes one
+    embedding batch and one index search. The per-chunk rankings are fused
+    with reciprocal rank fusion, which only uses ranks and so works for
+    distances and BM25 scores alike; a passage returned for several chunks
+    is counted once, with the fused weight of all of them.
+
+    Args:
+        text (str): The document text.
+        k (int): Number of passages to return.
+        per_chunk (int): Matches retrieved for each chunk before fusion.
+        mode (str): Retrieval mode, see query_faiss_batch.
+        filters (dict): Metadata conditions, see query_faiss_batch.
+
+    Returns:
+        list: Up to k distinct passages (as strings), best first.
+    """
+    from faiss_ingest import chunk_text
+
+    chunks = chunk_text(text, REPORT_CHUNK_SIZE, REPORT_CHUNK_OVERLAP)
+    if len(chunks) > REPORT_MAX_CHUNKS:
+        # Chunks spread over the whole document rather than only its beginning
+        chunks = [chunks[i * len(chunks) // REPORT_MAX_CHUNKS] for i in range(REPORT_MAX_CHUNKS)]
+    if not chunks:
+        return []
+
+    # Chunks are unlikely to be searched again, so they bypass the query embedding cache; they are
+    # not user queries (and hold patient text), so they are not written to the query log either
+    results = query_faiss_batch(chunks, k=max(k, per_chunk), mode=mode, filters=filters,
+                                cache_embeddings=False, log_queries=False)
+    # Passages are keyed by their text, so the same passage found by several chunks is fused into one entry
+    fused = reciprocal_rank_fusion(results)
+    return [passage for passage, _ in fused[:k]]
+
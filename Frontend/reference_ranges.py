@@ -0,0 +1,175 @@
+"""
+Reference-range interpretation of vital and lab values.
+
+The thresholds live in REFERENCE_RULES instead of if/elif chains. classify()
+evaluates them with NumPy over numeric columns in canonical units (see
+measurements.py; one entry per patient), so
+thousands of patients are classified in a handful of array operations;
+interpret_batch() turns the result into the findings and recommendations
+that interpret_medical_values returns for a single report.
+
+Rules can be restricted by sex and age. A patient is judged by the last
+rule of an analyte that applies to them, so specific rules follow the
+general one; without sex or age only the general rules apply.
+"""
+import numpy as np
+
+from measurements import ANALYTE_PARTS, format_analyte_column
+
+# (analyte, finding label, sex ("male"/"female" or None), (min age, max age) or None, bands).
+# Bands are tried in order: (band name, recommendation or None, "any"/"all", [(column, operator, threshold)]);
+# a band without conditions always matches.
+REFERENCE_RULES = [
+    ("blood_pressure", "Blood pressure", None, None, [
+        ("Low", "Monitor for symptoms of hypotension", "any", [("systolic", "<", 90), ("diastolic", "<", 60)]),
+        ("Normal", None, "all", [("systolic", "<=", 120), ("diastolic", "<=", 80)]),
+        ("Pre-hypertension", "Lifestyle modifications recommended", "any",
+         [("systolic", "<=", 139), ("diastolic", "<=", 89)]),
+        ("High", "Consult physician for hypertension management", "all", []),
+    ]),
+    ("glucose", "Glucose", None, None, [
+        ("Low", "Monitor for hypoglycemia symptoms", "all", [("glucose", "<", 70)]),
+        ("Normal", None, "all", [("glucose", "<=", 99)]),
+        ("Pre-diabetic", "Dietary modifications and regular monitoring", "all", [("glucose", "<=", 125)]),
+        ("High", "Diabetes screening and management needed", "all", []),
+    ]),
+    ("cholesterol", "Cholesterol", None, None, [
+        ("Normal", None, "all", [("cholesterol", "<", 200)]),
+        ("Borderline high", "Dietary changes and regular exercise", "all", [("cholesterol", "<=", 239)]),
+        ("High", "Lipid management and cardiac risk assessment", "all", []),
+    ]),
+    ("hemoglobin", "Hemoglobin", None, None, [
+        ("Low - Anemia", "Iron supplementation and dietary counseling", "all", [("hemoglobin", "<", 12)]),
+        ("Normal", None, "all", [("hemoglobin", "<=", 15)]),
+        ("High", "Further evaluation for polycythemia", "all", []),
+    ]),
+    # WHO anaemia cut-off for adult men is 13 g/dL
+    ("hemoglobin", "Hemoglobin", "male", (15, None), [
+        ("Low - Anemia", "Iron supplementation and dietary counseling", "all", [("hemoglobin", "<", 13)]),
+        ("Normal", None, "all", [("hemoglobin", "<=", 17)]),
+        ("High", "Further evaluation for polycythemia", "all", []),
+    ]),
+    ("temperature", "Temperature", None, None, [
+        ("Low", "Monitor for hypothermia", "all", [("temperature", "<", 36)]),
+        ("Normal", None, "all", [("temperature", "<=", 37.5)]),
+        ("Fever", "Fever management and infection screening", "all", []),
+    ]),
+    ("heart_rate", "Heart rate", None, None, [
+        ("Bradycardia", "Cardiac evaluation recommended", "all", [("heart_rate", "<", 60)]),
+        ("Normal", None, "all", [("heart_rate", "<=", 100)]),
+        ("Tachycardia", "Cardiac assessment and monitoring", "all", []),
+    ]),
+]
+
+OPERATORS = {"<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal}
+
+# Every band of every rule, so a classification is one small integer per patient and analyte:
+# (analyte, finding label, band name, recommendation)
+BANDS = [(analyte, label, band[0], band[1])
+         for analyte, label, _, _, bands in REFERENCE_RULES for band in bands]
+
+# Per band: text before and after the value in a finding ("Glucose: " ... " (Normal)"), recommendation
+FINDING_TEXT = [(f"{label}: ", f" ({name})", recommendation) for _, label, name, recommendation in BANDS]
+
+# Analytes in the order their findings are reported
+ANALYTES = list(dict.fromkeys(rule[0] for rule in REFERENCE_RULES))
+
+
+def _sex_codes(sex, count):
+    """"Male", "M", "female", ... -> "m" / "f" ("" when unknown), one per patient."""
+    if sex is None or isinstance(sex, str):
+        sex = [sex] * count
+    return np.array([(str(value).strip().lower()[:1] if value else "") for value in sex], dtype="<U1")
+
+
+def _rule_applies(rule_sex, age_range, sex_codes, ages):
+    applies = np.ones(len(sex_codes), dtype=bool)
+    if rule_sex:
+        applies &= sex_codes == rule_sex[0]
+    if age_range:
+        low, high = age_range
+        # Unknown ages (NaN) compare False, so age-specific rules never apply to them
+        if low is not None:
+            applies &= ages >= low
+        if high is not None:
+            applies &= ages <= high
+    return applies
+
+
+def classify(columns, sex=None, age=None):
+    """
+    Classify many patients at once.
+
+    Args:
+        columns (dict): Column name -> numeric values, one per patient (NaN when not measured).
+        sex: One value for every patient, or one per patient ("male"/"female"/None).
+        age: One value for every patient, or one per patient (None/NaN when unknown).
+
+    Returns:
+        dict: {analyte: int array of BANDS indices, -1 where the analyte was not measured}.
+    """
+    arrays = {name: np.asarray(values, dtype=np.float64) for name, values in columns.items()}
+    count = len(next(iter(arrays.values()))) if arrays else 0
+    missing = np.full(count, np.nan)
+    sex_codes = _sex_codes(sex, count)
+    ages = np.broadcast_to(np.asarray(np.nan if age is None else age, dtype=np.float64), (count,))
+
+    result = {}
+    band_offset = 0
+    with np.errstate(invalid="ignore"):
+        for analyte, _, rule_sex, age_range, bands in REFERENCE_RULES:
+            conditions = []
+            measured = np.ones(count, dtype=bool)
+            for _, _, combine, tests in bands:
+                checks = []
+                for column, operator, threshold in tests:
+                    values = arrays.get(column, missing)
+                    measured &= ~np.isnan(values)
+                    checks.append(OPERATORS[operator](values, threshold))
+                if not checks:
+                    conditions.append(np.ones(count, dtype=bool))
+                else:
+                    conditions.append(np.logical_or.reduce(checks) if combine == "any"
+                                      else np.logical_and.reduce(checks))
+            choices = np.arange(band_offset, band_offset + len(bands))
+            bands_found = np.select(conditions, choices, default=-1)
+            band_offset += len(bands)
+
+            applies = _rule_applies(rule_sex, age_range, sex_codes, ages) & measured
+            if analyte in result:
+                result[analyte] = np.where(applies, bands_found, result[analyte])
+            else:
+                result[analyte] = np.where(applies, bands_found, -1)
+    return result
+
+
+def interpret_batch(columns, sex=None, age=None):
+    """
+    Findings and recommendations for many patients in one call.
+
+    Args:
+        columns (dict): Column name -> numeric values in canonical units, one per patient
+            (e.g. from measurements.measurement_columns()).
+        sex: One value for every patient, or one per patient.
+        age: One value for every patient, or one per patient.
+
+    Returns:
+        list: {"findings": [...], "recommendations": [...]} per patient.
+    """
+    bands = classify(columns, sex, age)
+    count = len(next(iter(bands.values())))
+    findings = [[] for _ in range(count)]
+    recommendations = [[] for _ in range(count)]
+    # Column by column, touching only the patients that have the analyte
+    for analyte in ANALYTES:
+        measured = np.flatnonzero(bands[analyte] >= 0)
+        # Values are formatted here, when the findings are written, not stored as strings
+        texts = format_analyte_column(analyte, [np.asarray(columns[code], dtype=np.float64)[measured]
+                                                for code in ANALYTE_PARTS[analyte]])
+        for row, band, text in zip(measured.tolist(), bands[analyte][measured].tolist(), texts):
+            prefix, suffix, recommendation = FINDING_TEXT[band]
+            findings[row].append(prefix + text + suffix)
+            if recommendation:
+                recommendations[row].append(recommendation)
+    return [{'findings': row_findings, 'recommendations': row_recommendations}
+            for row_findings, row_recommendations in zip(findings, recommendations)]
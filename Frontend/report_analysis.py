@@ -0,0 +1,470 @@
+"""
+Medical report analysis shared by the diagnostics page and batch_reports.py.
+
+extract_measurements and interpret_medical_values (backed by the rule
+tables of reference_ranges) are pure functions working on the first
+reading of each analyte, as typed measurements in canonical units (see
+measurements.py); iter_measurements reports every reading with its
+offset, page, unit and date, and measurement_series turns those into a
+per-report time series.
+iter_medical_report adds FAISS context and web search results for the
+conditions mentioned in the report (found with the lexicon of
+conditions.py), fetched concurrently with per-source deadlines (see
+ANALYSIS_FAISS_DEADLINE / ANALYSIS_SEARCH_DEADLINE), and yields each part
+as soon as it is ready; analyze_medical_report returns the complete result.
+"""
+import bisect
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List
+
+from conditions import condition_matcher, find_conditions
+from measurements import (
+    ANALYTE_CODES, ANALYTE_PARTS, UNITS, Measurement, format_values, measurement_columns, to_canonical, unit_code
+)
+from reference_ranges import interpret_batch
+from retrieval_config import (
+    ANALYSIS_FAISS_DEADLINE, ANALYSIS_FAISS_WORKERS, ANALYSIS_SEARCH_DEADLINE, ANALYSIS_SEARCH_WORKERS
+)
+
+
+# Analytes found by extract_measurements: (key in measurements.ANALYTE_PARTS, patterns in
+# priority order, unit when none is written). Patterns run on the lowercased text, must start
+# or end with a (?:keyword|...) group and capture one value per part of the analyte. A new
+# analyte only needs a row here.
+VITAL_PATTERNS = [
+    ('blood_pressure', [
+        r'(?:blood pressure|bp|systolic|diastolic)[\s:]*(\d{2,3})[/\-](\d{2,3})',
+        r'(\d{2,3})[/\-](\d{2,3})[\s]*(?:mmhg|mm hg)',
+    ], "mmHg"),
+    ('glucose', [
+        r'(?:glucose|sugar|fbs|rbs)[\s:]*(\d+\.?\d*)[\s]*(?:mg/dl|mmol/l|mg%)',
+        r'(?:fasting glucose|random glucose)[\s:]*(\d+\.?\d*)',
+    ], "mg/dL"),
+    ('cholesterol', [
+        r'(?:cholesterol|chol)[\s:]*(\d+\.?\d*)[\s]*(?:mg/dl|mmol/l)',
+        r'(?:total cholesterol|tc)[\s:]*(\d+\.?\d*)',
+    ], "mg/dL"),
+    ('hemoglobin', [
+        r'(?:hemoglobin|hb|haemoglobin)[\s:]*(\d+\.?\d*)[\s]*(?:g/dl|gm/dl)',
+    ], "g/dL"),
+    ('temperature', [
+        r'(?:temperature|temp|fever)[\s:]*(\d+\.?\d*)[\s]*(?:°f|°c|f|c)',
+    ], "°C"),
+    ('heart_rate', [
+        r'(?:heart rate|pulse|hr)[\s:]*(\d+)[\s]*(?:bpm|beats|/min)',
+    ], "bpm"),
+]
+
+# Literal alternation a pattern starts with (or, failing that, ends with), used as its anchor keywords
+LEADING_KEYWORDS = re.compile(r'^\(\?:([^()\[\]\\]+)\)')
+TRAILING_KEYWORDS = re.compile(r'\(\?:([^()\[\]\\]+)\)$')
+# Characters searched for keywords at a time
+SCAN_WINDOW = 16384
+
+# Dates a reading can be attached to: 2024-01-05, 05/01/2024, 5 Jan 2024, January 5, 2024
+MONTHS = r'(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?'
+DATE_PATTERN = re.compile(
+    # The leading lookahead lets the regex engine skip characters no date can start with
+    rf'(?=[\dadfjmnos])\b(?:\d{{4}}-\d{{1,2}}-\d{{1,2}}|\d{{1,2}}[/.]\d{{1,2}}[/.](?:\d{{4}}|\d{{2}})'
+    rf'|\d{{1,2}} {MONTHS},? \d{{4}}|{MONTHS} \d{{1,2}},? \d{{4}})\b'
+)
+
+
+# As before, a temperature above 50 is read as Fahrenheit whatever unit follows it
+FAHRENHEIT_ABOVE = 50
+
+CODE_INDEX = {code: index for index, code in enumerate(ANALYTE_CODES)}
+
+
+def _lower(text):
+    """Lowercase text, keeping offsets aligned with the original."""
+    text_lower = text.lower()
+    if len(text_lower) != len(text):
+        # A few characters (e.g. "İ") lowercase to two
+        text_lower = "".join(char.lower()[0] for char in text)
+    return text_lower
+
+
+def _reading_measurements(readings, base_offset=0):
+    """Typed measurements, in canonical units, for (analyte position, match) readings."""
+    analytes, values, units, offsets = [], [], [], []
+    for position, match in readings:
+        key, _, default_unit = VITAL_PATTERNS[position]
+        written_unit = match.string[match.end(match.lastindex):match.end()]
+        for group, code in enumerate(ANALYTE_PARTS[key], start=1):
+            value = float(match.group(group))
+            if code == "temperature":
+                unit = UNITS.index("°F" if value > FAHRENHEIT_ABOVE else "°C")
+            else:
+                unit = unit_code(written_unit, default_unit)
+            analytes.append(CODE_INDEX[code])
+            values.append(value)
+            units.append(unit)
+            offsets.append(base_offset + match.start(group))
+    values, units = to_canonical(analytes, values, units)
+    return [Measurement(analyte, value, unit, offset)
+            for analyte, value, unit, offset in zip(analytes, values.tolist(), units.tolist(), offsets)]
+
+
+class VitalsScanner:
+    """
+    Keyword-anchored scanner for a table of analyte patterns.
+
+    Every pattern starts (or ends) with a literal keyword alternation such
+    as (?:glucose|sugar|fbs|rbs). Instead of running each pattern over the
+    whole text, the scanner walks the keyword occurrences in text order
+    (str.find over fixed-size windows, which skips text at memchr speed)
+    and only tries a pattern where one of its keywords occurs.
+
+    A pattern anchored at its end is searched back to the previous
+    occurrence of one of its keywords (or the start of the text), so each
+    stretch of text is tried once however far the match starts from its
+    keyword, e.g. across the long runs of spaces in column-aligned PDF text.
+
+    scan() returns the first reading of each analyte and stops as soon as
+    every analyte is settled; the result is the same as searching each
+    pattern separately, provided the text an end-anchored pattern matches
+    before its keyword cannot itself contain that keyword (true of every
+    VITAL_PATTERNS row). readings() reports every reading instead.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.patterns = []  # (analyte position, priority, compiled pattern, anchored at end)
+        self.anchors = {}  # keyword -> indices into self.patterns
+        for position, (name, patterns, _) in enumerate(table):
+            for priority, pattern in enumerate(patterns):
+                leading = LEADING_KEYWORDS.match(pattern)
+                trailing = TRAILING_KEYWORDS.search(pattern)
+                if not (leading or trailing):
+                    raise ValueError(f"Pattern for '{name}' must start or end with a (?:keyword|...) group: {pattern}")
+                at_end = leading is None
+                keywords = (leading or trailing).group(1).split("|")
+                index = len(self.patterns)
+                self.patterns.append((position, priority, re.compile(rf"(?:{pattern})\Z" if at_end else pattern), at_end))
+                for keyword in keywords:
+                    # A keyword that extends another one of the same pattern adds no new anchor positions
+                    if at_end or not any(keyword != other and keyword.startswith(other) for other in keywords):
+                        self.anchors.setdefault(keyword, []).append(index)
+
+    def _matches(self, text_lower, needed=None):
+        """
+        Yield (pattern index, match) at each keyword occurrence, in text order.
+
+        Keywords are located window by window, so a caller that stops early
+        leaves the rest of the text unscanned. Patterns missing from needed
+        (a set the caller may shrink while iterating) are skipped.
+        """
+        # End-anchored pattern index -> end of its previous keyword occurrence, where its next search starts
+        searched_to = {}
+        for window_start in range(0, len(text_lower), SCAN_WINDOW):
+            hits = []
+            for keyword, indices in self.anchors.items():
+                if needed is not None and needed.isdisjoint(indices):
+                    continue
+                limit = window_start + SCAN_WINDOW + len(keyword) - 1
+                start = text_lower.find(keyword, window_start, limit)
+                while start >= 0:
+                    hits.append((start, keyword))
+                    start = text_lower.find(keyword, start + 1, limit)
+            hits.sort()
+
+            for start, keyword in hits:
+                for index in self.anchors[keyword]:
+                    if needed is not None and index not in needed:
+                        continue
+                    _, _, pattern, at_end = self.patterns[index]
+                    if at_end:
+                        end = start + len(keyword)
+                        match = pattern.search(text_lower, min(searched_to.get(index, 0), start), end)
+                        searched_to[index] = end
+                    else:
+                        match = pattern.match(text_lower, start)
+                    if match:
+                        yield index, match
+
+    def scan(self, text_lower):
+        """Return the first reading of each analyte in lowercased text as (analyte position, match), in table order."""
+        found = {}  # analyte position -> (priority, match)
+        needed = set(range(len(self.patterns)))
+        for index, match in self._matches(text_lower, needed):
+            position, priority = self.patterns[index][:2]
+            found[position] = (priority, match)
+            # This pattern and the lower-priority ones of the analyte are settled
+            needed -= {other for other in needed
+                       if self.patterns[other][0] == position and self.patterns[other][1] >= priority}
+            if not needed:
+                break
+
+        return [(position, found[position][1]) for position in sorted(found)]
+
+    def readings(self, text_lower):
+        """
+        Return every reading in lowercased text as (analyte position, match), ordered by value offset.
+
+        Patterns of one analyte that capture the same value (e.g. "fasting glucose 104 mg/dl"
+        matches both glucose patterns) give one reading, from the higher-priority pattern.
+        """
+        best = {}  # (analyte position, value offset) -> (priority, match)
+        for index, match in self._matches(text_lower):
+            position, priority = self.patterns[index][:2]
+            key = (position, match.start(1))
+            if key not in best or priority < best[key][0]:
+                best[key] = (priority, match)
+        return [(position, match) for (position, _), (_, match)
+                in sorted(best.items(), key=lambda item: item[0][1])]
+
+
+vitals_scanner = VitalsScanner(VITAL_PATTERNS)
+
+
+def extract_measurements(text: str) -> List[Measurement]:
+    """Extract the first reading of each common medical value, typed and in canonical units"""
+    return _reading_measurements(vitals_scanner.scan(_lower(text)))
+
+
+def extract_medical_values(text: str) -> Dict:
+    """Extract common medical values from text as display strings (e.g. for rendering)"""
+    return format_values(extract_measurements(text))
+
+
+def _reading_date(dates, value_offset, line_start, line_end):
+    """The date closest to the reading on its own line, else the last date before it on the page."""
+    first = bisect.bisect_left(dates, (line_start,))
+    last = bisect.bisect_left(dates, (line_end,))
+    if first < last:
+        return min(dates[first:last], key=lambda date: abs(date[0] - value_offset))[1]
+    before = bisect.bisect_left(dates, (value_offset,))
+    return dates[before - 1][1] if before else None
+
+
+def iter_measurements(pages):
+    """
+    Yield every vital and lab reading in a report, page by page.
+
+    Dates are only searched up to the line of the latest reading (and on
+    earlier pages only when a reading needs them), so text after the last
+    reading is never scanned twice.
+
+    Args:
+        pages: Page texts in order (e.g. from pdf_extraction.iter_pdf_pages), or one string.
+
+    Yields:
+        dict: {"analyte", "value", "unit", "offset", "page", "date"}: the analyte code
+            (blood pressure gives a systolic and a diastolic reading), the value as a float
+            in the canonical unit, the position of the value in the pages joined by line
+            breaks (as extract_pdf_text joins them, before stripping), the page starting at 1
+            and the date written on the reading's line or, failing that, the last date
+            before it (or None).
+    """
+    if isinstance(pages, str):
+        pages = [pages]
+    page_offset = 0
+    # Earlier pages, newest first: [page text, lowercased text,
+    # offset dates were scanned up to, last date seen]
+    earlier_pages = []
+    for page_number, page_text in enumerate(pages, start=1):
+        text_lower = _lower(page_text)
+        dates = []  # (offset, date as written)
+        scanned = 0
+        readings = vitals_scanner.readings(text_lower)
+        reading_dates = []
+        for position, match in readings:
+            value_offset = match.start(1)
+            line_start = text_lower.rfind("\n", 0, value_offset) + 1
+            line_end = text_lower.find("\n", value_offset)
+            line_end = len(text_lower) if line_end < 0 else line_end
+            if line_end > scanned:
+                dates.extend((date.start(), page_text[date.start():date.end()])
+                             for date in DATE_PATTERN.finditer(text_lower, scanned, line_end))
+                scanned = line_end
+
+            date = _reading_date(dates, value_offset, line_start, line_end)
+            if date is None:
+                date = _last_earlier_date(earlier_pages)
+            reading_dates.extend([date] * len(ANALYTE_PARTS[VITAL_PATTERNS[position][0]]))
+
+        # The page's readings are converted to canonical units together
+        for measurement, date in zip(_reading_measurements(readings, page_offset), reading_dates):
+            yield {
+                "analyte": measurement.analyte_name,
+                "value": measurement.value,
+                "unit": measurement.unit_name,
+                "offset": measurement.offset,
+                "page": page_number,
+                "date": date,
+            }
+        if dates:
+            # Readings on later pages never need dates from before a page that has one
+            earlier_pages.clear()
+        earlier_pages.insert(0, [page_text, text_lower, scanned, dates[-1][1] if dates else None])
+        page_offset += len(page_text) + 1
+
+
+def _last_earlier_date(earlier_pages):
+    """The last date on the closest earlier page that has one, finishing the date scan of those pages as needed."""
+    for position, entry in enumerate(earlier_pages):
+        page_text, text_lower, scanned, last_date = entry
+        if scanned < len(text_lower):
+            for date in DATE_PATTERN.finditer(text_lower, scanned):
+                last_date = page_text[date.start():date.end()]
+            entry[2:] = [len(text_lower), last_date]
+        if last_date is not None:
+            del earlier_pages[position + 1:]
+            return last_date
+    earlier_pages.clear()
+    return None
+
+
+def measurement_series(measurements) -> Dict:
+    """
+    Group readings into a compact per-analyte time series.
+
+    Returns:
+        dict: {analyte: {"values": [...], "units": [...], "dates": [...], "pages": [...]}},
+            each list in report order.
+    """
+    series = {}
+    for measurement in measurements:
+        columns = series.setdefault(measurement["analyte"], {"values": [], "units": [], "dates": [], "pages": []})
+        columns["values"].append(measurement["value"])
+        columns["units"].append(measurement["unit"])
+        columns["dates"].append(measurement["date"])
+        columns["pages"].append(measurement["page"])
+    return series
+
+def interpret_medical_values(measurements: List[Measurement], sex: str = None, age: float = None) -> Dict:
+    """Interpret extracted medical values and provide recommendations"""
+    # The reference ranges are evaluated by the vectorized rule engine, here for a single patient
+    return interpret_batch(measurement_columns([measurements]), sex, age)[0]
+
+# Shared by every analysis (threads start on first use); late calls finish here without blocking the caller.
+# Separate pools, so web searches that hang past their deadline cannot hold up FAISS retrieval
+_faiss_pool = ThreadPoolExecutor(max_workers=ANALYSIS_FAISS_WORKERS, thread_name_prefix="report-faiss")
+_search_pool = ThreadPoolExecutor(max_workers=ANALYSIS_SEARCH_WORKERS, thread_name_prefix="report-search")
+
+def _shutdown_pools():
+    for pool in (_faiss_pool, _search_pool):
+        pool.shutdown(wait=False, cancel_futures=True)
+
+# Lookups still queued at exit are dropped. Registered with threading rather than atexit, whose handlers
+# only run after concurrent.futures has joined the pool threads (and so would wait for the queued work)
+threading._register_atexit(_shutdown_pools)
+
+def _search_condition(condition: str):
+    from medical_search_tool import medical_search_tool
+
+    search_result = medical_search_tool.func(condition)
+    if search_result and "No reliable information found" not in search_result:
+        return f"About {condition}: {search_result[:200]}..."
+    return None
+
+def _faiss_context(pdf_text: str):
+    from query_faiss import query_faiss_document
+
+    # Top 2 passages for the whole report, fused over its chunks
+    return query_faiss_document(pdf_text, k=2)
+
+def iter_medical_report(pdf_text: str, pages: List[str] = None,
+                        faiss_deadline: float = ANALYSIS_FAISS_DEADLINE,
+                        search_deadline: float = ANALYSIS_SEARCH_DEADLINE) -> Iterator[Dict]:
+    """
+    Analyze a medical report progressively.
+
+    FAISS retrieval and the web search for each condition start on a thread pool
+    first. The first update, yielded as soon as the regex extraction and
+    interpretation are done, holds every key of the analysis; each later update
+    carries a source as it completes ('faiss_context' or the 'additional_info'
+    found so far) and the sources still outstanding. A source that misses its
+    deadline is cancelled if it has not started and is not waited for; like a
+    source that raised, it stays in 'pending' with its result left out.
+
+    Args:
+        pdf_text (str): Text of the report.
+        pages (list): Text per page, for page numbers in the time series.
+        faiss_deadline (float): Seconds to wait for FAISS context.
+        search_deadline (float): Seconds to wait for the web searches.
+
+    Yields:
+        dict: Keys of the analysis to add or replace, in the order they become available.
+    """
+    start = time.monotonic()
+    # future -> (source, deadline): retrieval and web searches are I/O bound and run on the shared pools
+    outstanding = {_faiss_pool.submit(_faiss_context, pdf_text): ("faiss_context", start + faiss_deadline)}
+    # Canonical IDs of the lexicon conditions the report mentions; the first two are looked up on the web
+    condition_ids = find_conditions(pdf_text)
+    conditions = [condition_matcher.name(condition_id) for condition_id in condition_ids[:2]]
+    for condition in conditions:
+        outstanding[_search_pool.submit(_search_condition, condition)] = (f"search: {condition}",
+                                                                         start + search_deadline)
+    sources = [source for source, _ in outstanding.values()]
+
+    # Extract medical values
+    measurements = extract_measurements(pdf_text)
+
+    # Every reading, for reports that cover several visits
+    time_series = measurement_series(iter_measurements(pages or [pdf_text]))
+    
+    # Get interpretations
+    interpretations = interpret_medical_values(measurements)
+
+    yield {
+        # Typed [analyte, value, unit, offset] records; display strings are made when rendering
+        'measurements': [measurement.to_record() for measurement in measurements],
+        'findings': interpretations['findings'],
+        'recommendations': interpretations['recommendations'],
+        'time_series': time_series,
+        'conditions': condition_ids,
+        'faiss_context': [],
+        'additional_info': [],
+        'pending': sources,
+        'raw_text_preview': pdf_text[:300] + "..." if len(pdf_text) > 300 else pdf_text
+    }
+
+    finished = {}
+    while outstanding:
+        now = time.monotonic()
+        for future in [future for future, (_, deadline) in outstanding.items() if deadline <= now]:
+            # A call that already started keeps running in the pool; its result is dropped
+            future.cancel()
+            del outstanding[future]
+        if not outstanding:
+            break
+        timeout = min(deadline for _, deadline in outstanding.values()) - now
+        done, _ = wait(outstanding, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            continue
+
+        update = {}
+        for future in done:
+            source, _ = outstanding.pop(future)
+            if future.exception() is not None:
+                # Reported as pending, like a missed deadline, so the other sources are still shown
+                continue
+            finished[source] = future.result()
+            if source == "faiss_context":
+                update['faiss_context'] = finished[source]
+            else:
+                # Web results are kept in the order of the conditions, whichever finishes first
+                update['additional_info'] = [finished[f"search: {condition}"] for condition in conditions
+                                             if finished.get(f"search: {condition}")]
+        update['pending'] = [source for source in sources if source not in finished]
+        yield update
+
+def analyze_medical_report(pdf_text: str, pages: List[str] = None,
+                           faiss_deadline: float = ANALYSIS_FAISS_DEADLINE,
+                           search_deadline: float = ANALYSIS_SEARCH_DEADLINE) -> Dict:
+    """
+    Comprehensive analysis of medical report, once every source has finished or missed its deadline.
+
+    Returns:
+        dict: The analysis (see iter_medical_report); 'pending' names the sources that missed
+            their deadline ("faiss_context", "search: <condition>"), whose results are left out.
+    """
+    analysis = {}
+    for update in iter_medical_report(pdf_text, pages, faiss_deadline, search_deadline):
+        analysis.update(update)
+    return analysis
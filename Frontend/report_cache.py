@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from retrieval_config import REPORT_CACHE_SIZE, REPORT_CACHE_DIR, REPORT_CACHE_TTL
+
+# Bump when the analysis output changes, so results cached by older code are recomputed
+REPORT_CACHE_VERSION = 6
+
+# Analysis keys kept in memory only: the start of the report text is not written to disk
+UNPERSISTED_KEYS = ("raw_text_preview",)
+
+
+class ReportCache:
+    """
+    Two-tier cache of report analyses keyed on the SHA-256 of the uploaded file.
+
+    A bounded in-memory LRU serves Streamlit reruns within the process; an
+    optional directory of JSON files keeps results across restarts and
+    processes, without UNPERSISTED_KEYS. Entries older than the TTL are
+    recomputed, since the analysis includes live web search results;
+    expired and outdated files are deleted when they are read.
+    """
+
+    def __init__(self, max_size=32, directory=None, ttl=7 * 24 * 3600):
+        self.max_size = max_size
+        self.directory = directory
+        self.ttl = ttl
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def report_key(data):
+        """Cache key for a report's raw bytes."""
+        return hashlib.sha256(data).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _expired(self, created):
+        return self.ttl and time.time() - created > self.ttl
+
+    def get(self, key):
+        """Return the cached analysis for a report key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry[0]):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        entry = self._load(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, entry)
+            return entry[1]
+
+    def put(self, key, result):
+        """Store an analysis in memory and on disk."""
+        entry = (time.time(), result)
+        with self._lock:
+            self._remember(key, entry)
+        self._save(key, entry)
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _load(self, key):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error loading cached report analysis: {e}")
+            return None
+        if data.get("version") != REPORT_CACHE_VERSION or self._expired(data["created"]):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return data["created"], data["result"]
+
+    def _save(self, key, entry):
+        if not self.directory:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                result = {name: value for name, value in entry[1].items() if name not in UNPERSISTED_KEYS}
+                json.dump({"version": REPORT_CACHE_VERSION, "created": entry[0], "result": result}, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Error saving report analysis: {e}")
+
+    def stats(self):
+        """Return hit/miss counters and the in-memory size."""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+            }
+
+    def clear(self):
+        """Remove the in-memory entries and reset the counters (the disk tier is kept)."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+
+
+# Shared by every Streamlit session and rerun in the process
+report_cache = ReportCache(REPORT_CACHE_SIZE, REPORT_CACHE_DIR or None, REPORT_CACHE_TTL)
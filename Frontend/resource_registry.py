@@ -0,0 +1,105 @@
+import threading
+import time
+
+from retrieval_config import RETRIEVAL_VERBOSE
+
+
+class ResourceRegistry:
+    """
+    Process-wide registry of expensive resources (models, indexes).
+
+    Each resource is built by its loader on first use, exactly once per
+    process, and then shared by every Streamlit session and thread. Load
+    times are kept for load_times(), and printed only when verbose.
+    """
+
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self._loaders = {}
+        self._resources = {}
+        self._load_times = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._warm_up_thread = None
+
+    def register(self, name, loader):
+        """Register a zero-argument loader for a resource name."""
+        with self._lock:
+            self._loaders[name] = loader
+            self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name):
+        """
+        Return the named resource, loading it on first use.
+
+        Args:
+            name (str): Name the loader was registered under.
+
+        Returns:
+            object: The shared resource instance.
+        """
+        if name in self._resources:
+            return self._resources[name]
+
+        if name not in self._loaders:
+            raise KeyError(f"No loader registered for resource '{name}'")
+
+        # One lock per resource, so a loader may itself depend on other resources
+        with self._locks[name]:
+            if name not in self._resources:
+                start = time.perf_counter()
+                resource = self._loaders[name]()
+                elapsed = time.perf_counter() - start
+                self._load_times[name] = elapsed
+                self._resources[name] = resource
+                if self.verbose:
+                    print(f"Loaded {name} in {elapsed:.2f}s")
+        return self._resources[name]
+
+    def is_loaded(self, name):
+        """Check whether a resource has already been loaded."""
+        return name in self._resources
+
+    def load_times(self):
+        """Return the load time in seconds of every loaded resource."""
+        return dict(self._load_times)
+
+    def reset(self, name):
+        """Drop a loaded resource so the next get() loads it again."""
+        with self._locks.get(name, self._lock):
+            self._resources.pop(name, None)
+            self._load_times.pop(name, None)
+
+    def warm_up(self, names=None):
+        """
+        Load resources in a background daemon thread.
+
+        Args:
+            names (list): Resource names to load, in order. Defaults to all registered ones.
+
+        Returns:
+            threading.Thread: The warm-up thread, or None if everything is already loaded.
+        """
+        names = [name for name in (names if names is not None else self._loaders)
+                 if name not in self._resources]
+        if not names:
+            return None
+
+        def _load_all():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"Error warming up {name}: {e}")
+
+        # Streamlit reruns call this on every interaction; reuse a running warm-up
+        with self._lock:
+            if self._warm_up_thread is not None and self._warm_up_thread.is_alive():
+                return self._warm_up_thread
+            thread = threading.Thread(target=_load_all, name="resource-warm-up", daemon=True)
+            thread.start()
+            self._warm_up_thread = thread
+        return thread
+
+# Shared by every module in the process
+registry = ResourceRegistry(verbose=RETRIEVAL_VERBOSE)
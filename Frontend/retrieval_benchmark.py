@@ -0,0 +1,351 @@
+"""
+Benchmark harness for query_faiss.
+
+Replays a query set (synthetic queries built from the stored chunks plus,
+optionally, a real-query log written with QUERY_LOG_PATH) and reports:
+
+- cold start: import, model + index load and first query, in a fresh process
+- latency percentiles (p50/p95/p99) of single queries
+- throughput at several concurrency levels
+- memory footprint (RSS) and index size on disk
+- recall@k of the configured retrieval path against exact search
+
+Results are written as JSON so runs can be compared for regressions.
+
+Usage:
+    python retrieval_benchmark.py run --query-log queries.jsonl --output bench.json
+    python retrieval_benchmark.py compare baseline.json bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from retrieval_config import (
+    FAISS_INDEX_PATH, FAISS_INDEX_MODE, EMBEDDING_BACKEND, RETRIEVAL_MODE, QUERY_LOG_PATH
+)
+
+SYNTHETIC_TERMS = [
+    "diabetes", "hypertension", "HbA1c", "metformin dosage", "fever and cough",
+    "high cholesterol treatment", "normal blood pressure range", "anemia symptoms",
+    "kidney function test", "thyroid disorder", "asthma inhaler", "heart attack warning signs",
+]
+
+# Metrics compared between runs, and whether a higher value is better
+TRACKED_METRICS = {
+    "cold_start.total_seconds": False,
+    "latency_ms.p50": False,
+    "latency_ms.p95": False,
+    "latency_ms.p99": False,
+    "memory.rss_mb": False,
+    "recall_at_k": True,
+}
+
+COLD_START_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import query_faiss
+imported = time.perf_counter()
+query_faiss.get_embeddings()
+query_faiss.get_vector_store()
+loaded = time.perf_counter()
+query_faiss.query_faiss_batch([{query!r}], k={k}, mode={mode!r})
+done = time.perf_counter()
+print(json.dumps({{"import_seconds": imported - start, "load_seconds": loaded - imported,
+                  "first_query_seconds": done - loaded, "total_seconds": done - start}}))
+"""
+
+
+def percentiles(latencies):
+    """p50/p95/p99/mean of a list of latencies in milliseconds."""
+    values = np.asarray(latencies, dtype=np.float64)
+    return {
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "mean": float(values.mean()),
+    }
+
+
+def rss_mb():
+    """Current resident set size in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def index_size_mb(index_dir=FAISS_INDEX_PATH):
+    """Total size of the files in the index directory."""
+    total = sum(os.path.getsize(os.path.join(index_dir, name)) for name in os.listdir(index_dir)
+                if os.path.isfile(os.path.join(index_dir, name)))
+    return total / 2 ** 20
+
+
+def synthetic_queries(count, seed=0):
+    """Typical search terms plus the opening words of randomly chosen stored chunks."""
+    from query_faiss import get_vector_store
+
+    store = get_vector_store()
+    rng = random.Random(seed)
+    rows = rng.sample(range(store.index.ntotal), min(count, store.index.ntotal))
+    queries = list(SYNTHETIC_TERMS)
+    for document in store.get_documents(sorted(rows)):
+        words = document.page_content.split()
+        if words:
+            start = rng.randrange(max(1, len(words) - 12))
+            queries.append(" ".join(words[start:start + rng.randint(3, 12)]))
+    rng.shuffle(queries)
+    return queries[:count]
+
+
+def load_query_log(path, limit=None):
+    """Read the queries of a QUERY_LOG_PATH file (JSON lines) or a plain one-query-per-line file."""
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            queries.append(json.loads(line)["query"] if line.startswith("{") else line)
+            if limit and len(queries) >= limit:
+                break
+    return queries
+
+
+def measure_cold_start(query, k, mode):
+    """Time import, loading and the first query in a fresh interpreter (no warm caches in memory)."""
+    script = COLD_START_SCRIPT.format(query=query, k=k, mode=mode)
+    env = dict(os.environ, QUERY_LOG_PATH="")
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure_latency(queries, k, mode):
+    """Run the queries one at a time and return per-query latencies in milliseconds."""
+    from query_faiss import query_faiss_batch
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        query_faiss_batch([query], k=k, mode=mode)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def measure_throughput(queries, k, mode, concurrency):
+    """Queries per second (and latency percentiles) with `concurrency` callers issuing single queries."""
+    from query_faiss import query_faiss_batch
+
+    def timed(query):
+        start = time.perf_counter()
+        query_faiss_batch([query], k=k, mode=mode)
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(timed, queries))
+    elapsed = time.perf_counter() - start
+    return dict({"concurrency": concurrency, "queries_per_second": len(queries) / elapsed},
+                **{f"{name}_ms": value for name, value in percentiles(latencies).items()})
+
+
+def measure_recall(queries, k, mode):
+    """
+    Recall@k of the configured retrieval path against an exact flat search.
+
+    Ground truth is the exact top-k of the query embeddings over every live
+    vector, so approximate indexes and hybrid fusion both show up as lost recall.
+    """
+    import faiss
+    from ann_index import exact_index_path
+    from compact_store import MMAP_FLAGS
+    from query_faiss import _retrieve, embed_queries, get_vector_store
+    from resource_registry import registry
+
+    store = get_vector_store()
+    exact_index = faiss.read_index(exact_index_path(FAISS_INDEX_PATH), MMAP_FLAGS)
+    matrix = np.asarray(embed_queries(queries), dtype=np.float32)
+    if store.normalize_L2:
+        faiss.normalize_L2(matrix)
+    deleted_rows = registry.get("deleted_rows")
+    if deleted_rows is not None:
+        _, exact_rows = exact_index.search(matrix, k, params=faiss.SearchParameters(sel=deleted_rows[1]))
+    else:
+        _, exact_rows = exact_index.search(matrix, k)
+
+    found = expected = 0
+    for exact, hits in zip(exact_rows, _retrieve(queries, k, mode)):
+        exact = {int(row) for row in exact if row != -1}
+        found += len(exact & {row for row, _ in hits})
+        expected += len(exact)
+    return found / expected if expected else 1.0
+
+
+def run_benchmark(queries, k=3, mode=RETRIEVAL_MODE, concurrency_levels=(1, 2, 4, 8), warm_cache=False,
+                  cold_start=True):
+    """
+    Run every measurement and return the results as a JSON-serialisable dict.
+
+    Args:
+        queries (list): The query strings to replay.
+        k (int): Number of matches per query.
+        mode (str): Retrieval mode passed to query_faiss_batch.
+        concurrency_levels (tuple): Numbers of concurrent callers for the throughput runs.
+        warm_cache (bool): Keep the query embedding cache between runs; by default it is
+            cleared so every run pays for embedding, as unseen queries do.
+        cold_start (bool): Measure cold start in a fresh process.
+    """
+    import query_faiss
+
+    # Replayed queries must not be appended to the log they came from
+    query_faiss.QUERY_LOG_PATH = ""
+
+    def reset_cache():
+        if not warm_cache:
+            query_faiss.registry.get("embedding_cache").clear()
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "k": k, "mode": mode, "index_mode": FAISS_INDEX_MODE, "embedding_backend": EMBEDDING_BACKEND,
+            "queries": len(queries), "warm_cache": warm_cache,
+            "python": platform.python_version(), "cpu_count": os.cpu_count(),
+        },
+    }
+    if cold_start:
+        results["cold_start"] = measure_cold_start(queries[0], k, mode)
+
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    query_faiss.get_embeddings()
+    store = query_faiss.get_vector_store()
+    results["load_seconds"] = time.perf_counter() - start
+    results["config"]["ntotal"] = store.index.ntotal
+
+    # One untimed pass loads the lazy resources (BM25, tombstones, cache)
+    query_faiss.query_faiss_batch(queries[:1], k=k, mode=mode)
+
+    reset_cache()
+    results["latency_ms"] = percentiles(measure_latency(queries, k, mode))
+    results["throughput"] = []
+    for concurrency in concurrency_levels:
+        reset_cache()
+        results["throughput"].append(measure_throughput(queries, k, mode, concurrency))
+
+    results["recall_at_k"] = measure_recall(queries, k, mode)
+    results["memory"] = {
+        "rss_mb": rss_mb(),
+        "rss_before_load_mb": rss_before,
+        "index_on_disk_mb": index_size_mb(),
+    }
+    results["embedding_cache"] = query_faiss.embedding_cache_stats()
+    return results
+
+
+def _metric(results, name):
+    value = results
+    for part in name.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def compare_results(baseline, current, tolerance=0.1):
+    """
+    Compare two benchmark runs.
+
+    Args:
+        baseline (dict): Results of the reference run.
+        current (dict): Results of the new run.
+        tolerance (float): Relative change allowed before a metric counts as a regression.
+
+    Returns:
+        list: (metric, baseline value, current value, relative change, regressed) tuples.
+    """
+    rows = []
+    metrics = dict(TRACKED_METRICS)
+    for level in current.get("throughput", []):
+        metrics[f"queries_per_second@{level['concurrency']}"] = True
+
+    for name, higher_is_better in metrics.items():
+        if name.startswith("queries_per_second@"):
+            concurrency = int(name.split("@")[1])
+            old, new = (next((level["queries_per_second"] for level in run.get("throughput", [])
+                              if level["concurrency"] == concurrency), None) for run in (baseline, current))
+        else:
+            old, new = _metric(baseline, name), _metric(current, name)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        rows.append((name, old, new, change, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency, throughput, memory and recall benchmark for query_faiss")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmark and write the results as JSON")
+    run_parser.add_argument("--queries", type=int, default=200, help="number of synthetic queries")
+    run_parser.add_argument("--query-log", default=QUERY_LOG_PATH or None,
+                            help="real queries to replay (QUERY_LOG_PATH JSONL or one query per line)")
+    run_parser.add_argument("--max-logged", type=int, default=1000)
+    run_parser.add_argument("-k", type=int, default=3)
+    run_parser.add_argument("--mode", default=RETRIEVAL_MODE, choices=["vector", "hybrid", "lexical"])
+    run_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    run_parser.add_argument("--warm-cache", action="store_true", help="keep the embedding cache between runs")
+    run_parser.add_argument("--no-cold-start", action="store_true")
+    run_parser.add_argument("--output", default="retrieval_benchmark.json")
+
+    compare_parser = subparsers.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        rows = compare_results(baseline, current, args.tolerance)
+        for name, old, new, change, regressed in rows:
+            print(f"{name:<28} {old:>12.3f} -> {new:>12.3f}  {change:+7.1%}{'  REGRESSION' if regressed else ''}")
+        sys.exit(1 if any(row[4] for row in rows) else 0)
+
+    queries = synthetic_queries(args.queries)
+    if args.query_log and os.path.exists(args.query_log):
+        queries += load_query_log(args.query_log, args.max_logged)
+
+    results = run_benchmark(queries, args.k, args.mode, tuple(args.concurrency),
+                            warm_cache=args.warm_cache, cold_start=not args.no_cold_start)
+    print(f"p50={results['latency_ms']['p50']:.2f}ms  p95={results['latency_ms']['p95']:.2f}ms  "
+          f"p99={results['latency_ms']['p99']:.2f}ms  recall@{args.k}={results['recall_at_k']:.3f}  "
+          f"rss={results['memory']['rss_mb']:.0f}MB")
+    for level in results["throughput"]:
+        print(f"concurrency {level['concurrency']}: {level['queries_per_second']:.1f} queries/s")
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Repository root (the directory that holds faiss_index/)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Location of the FAISS index and the embedding model used to build it
+FAISS_INDEX_PATH = os.getenv("FAISS_INDEX_PATH", os.path.join(PROJECT_ROOT, "faiss_index"))
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+
+
+# Query embedding cache (set EMBEDDING_CACHE_PATH to keep it across restarts)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")
+
+# Which FAISS index to search: flat (exact), ivf_flat, hnsw or ivf_pq (see ann_index.py)
+FAISS_INDEX_MODE = os.getenv("FAISS_INDEX_MODE", "flat")
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+# Split the index into this many shards searched in parallel threads (see sharded_index.py); 1 disables it.
+# Flat shards stay memory-mapped only when saved with 'python sharded_index.py build --mode flat';
+# otherwise they are copied into each process's memory when the store is loaded
+FAISS_SHARDS = int(os.getenv("FAISS_SHARDS", "1"))
+
+# How often (seconds) query processes check faiss_index/ for newly ingested documents
+FAISS_RELOAD_INTERVAL = float(os.getenv("FAISS_RELOAD_INTERVAL", "60"))
+# Print a line whenever a retrieval resource is (re)loaded; load times are always in query_faiss.load_times()
+RETRIEVAL_VERBOSE = os.getenv("RETRIEVAL_VERBOSE", "") not in ("", "0")
+
+# Chunking used when ingesting documents
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "100"))
+# Chunking of a whole report into context queries (query_faiss_document); reports with more chunks
+# are represented by REPORT_MAX_CHUNKS chunks spread evenly over the text
+REPORT_CHUNK_SIZE = int(os.getenv("REPORT_CHUNK_SIZE", "500"))
+REPORT_CHUNK_OVERLAP = int(os.getenv("REPORT_CHUNK_OVERLAP", "50"))
+REPORT_MAX_CHUNKS = int(os.getenv("REPORT_MAX_CHUNKS", "64"))
+
+# Embedding backend: huggingface (PyTorch) or onnx (ONNX Runtime, see onnx_embeddings.py)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "huggingface")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(PROJECT_ROOT, "onnx_model"))
+ONNX_QUANTIZED = os.getenv("ONNX_QUANTIZED", "1") == "1"
+
+# Retrieval mode: vector (FAISS only), hybrid (BM25 + FAISS fused with reciprocal rank fusion) or lexical
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+# Hybrid mode answers keyword queries of at most this many known terms from BM25 alone, skipping embedding
+LEXICAL_FAST_PATH_MAX_TOKENS = int(os.getenv("LEXICAL_FAST_PATH_MAX_TOKENS", "2"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Append every query_faiss query to this JSONL file (replayed by retrieval_benchmark.py); empty disables it
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", "")
+
+# Shared retrieval server (retrieval_server.py) that owns the model and index for all Streamlit
+# workers; query_faiss searches in-process when it is not running. Empty URL (the default, for
+# deployments without a server) disables the client, e.g. set it to http://127.0.0.1:8765.
+# The timeout (seconds) stays below ANALYSIS_FAISS_DEADLINE, so a hung server cannot outlast the analysis
+RETRIEVAL_SERVER_URL = os.getenv("RETRIEVAL_SERVER_URL", "")
+RETRIEVAL_SERVER_TIMEOUT = float(os.getenv("RETRIEVAL_SERVER_TIMEOUT", "3"))
+# Seconds to wait before trying an unreachable server again
+RETRIEVAL_SERVER_RETRY_INTERVAL = float(os.getenv("RETRIEVAL_SERVER_RETRY_INTERVAL", "30"))
+# Dynamic micro-batching: concurrent requests are merged for up to this long / this many queries
+SERVER_MAX_WAIT_MS = float(os.getenv("SERVER_MAX_WAIT_MS", "5"))
+SERVER_MAX_BATCH = int(os.getenv("SERVER_MAX_BATCH", "64"))
+
+# Vector-store backend for vector_stores.get_backend(): faiss (faiss_index/) or chroma (a Chroma
+# collection filled from the FAISS store with 'python vector_stores.py sync-chroma', in an untracked
+# directory; Frontend/db holds the collection of crewai's PDFSearchTool)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "faiss")
+CHROMA_PATH = os.getenv("CHROMA_PATH", os.path.join(PROJECT_ROOT, "chroma_db"))
+CHROMA_COLLECTION = os.getenv("CHROMA_COLLECTION", "medical_corpus")
+
+# Report analysis cache keyed on the SHA-256 of uploaded PDFs: in-memory entries, a directory for
+# the on-disk tier and how long (seconds) results, which include web searches, stay valid. The disk
+# tier stores patient analyses as plaintext JSON, so it is off unless a directory is set
+# (e.g. REPORT_CACHE_DIR=report_cache, which .gitignore covers)
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "32"))
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", "")
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", str(7 * 24 * 3600)))
+
+# PDF reports with at least this many pages are extracted by a process pool of PDF_WORKERS (0 = all cores)
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "0")) or None
+
+# analyze_medical_report runs FAISS retrieval and the condition web searches concurrently, on pools of
+# ANALYSIS_FAISS_WORKERS and ANALYSIS_SEARCH_WORKERS threads; sources that miss their deadline
+# (seconds) or fail are reported as pending. Searches past their deadline keep their thread until
+# the request returns, so the search pool has room for a few of them
+ANALYSIS_FAISS_WORKERS = int(os.getenv("ANALYSIS_FAISS_WORKERS", "4"))
+ANALYSIS_SEARCH_WORKERS = int(os.getenv("ANALYSIS_SEARCH_WORKERS", "8"))
+ANALYSIS_FAISS_DEADLINE = float(os.getenv("ANALYSIS_FAISS_DEADLINE", "5"))
+ANALYSIS_SEARCH_DEADLINE = float(os.getenv("ANALYSIS_SEARCH_DEADLINE", "8"))
@@ -0,0 +1,199 @@
+"""
+Local retrieval server shared by all Streamlit workers.
+
+One process owns the embedding model and the FAISS index; query_faiss in
+every worker sends its queries here over localhost HTTP instead of loading
+its own copy (and searches in-process when the server is not running).
+
+Concurrent requests are merged by dynamic micro-batching: the first
+request waits up to SERVER_MAX_WAIT_MS for others, and everything that
+arrived is embedded in one forward pass and searched in one FAISS call.
+
+Endpoints:
+    POST /query   {"queries": [...], "k": 3, "mode": "vector", "filters": null, "cache_embeddings": true}
+    GET  /health
+    GET  /stats
+
+Usage:
+    python retrieval_server.py [--host 127.0.0.1] [--port 8765]
+    RETRIEVAL_SERVER_URL=http://127.0.0.1:8765 streamlit run home.py   # clients use the server
+"""
+import argparse
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from retrieval_config import RETRIEVAL_MODE, RETRIEVAL_SERVER_URL, SERVER_MAX_BATCH, SERVER_MAX_WAIT_MS
+
+
+class MicroBatcher:
+    """
+    Collects concurrent search requests and runs them as shared batches.
+
+    Requests with the same k, mode, filters and cache setting are searched
+    together; each caller gets back the results for its own queries.
+    """
+
+    def __init__(self, search_fn, max_batch=SERVER_MAX_BATCH, max_wait_ms=SERVER_MAX_WAIT_MS):
+        self.search_fn = search_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._requests = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.queries = 0
+        self.requests = 0
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, queries, k, mode, filters=None, cache_embeddings=True):
+        """Queue a request and block until its results are ready."""
+        future = Future()
+        self._requests.put((list(queries), k, mode, filters, cache_embeddings, future))
+        return future.result()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "queries": self.queries,
+                "mean_batch_size": self.queries / self.batches if self.batches else 0.0,
+            }
+
+    def _collect(self):
+        """Take the next request, then anything else that arrives within max_wait (up to max_batch queries)."""
+        pending = [self._requests.get()]
+        size = len(pending[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            pending.append(request)
+            size += len(request[0])
+        return pending
+
+    def _run(self):
+        while True:
+            groups = {}
+            for request in self._collect():
+                queries, k, mode, filters, cache_embeddings, future = request
+                key = (k, mode, json.dumps(filters, sort_keys=True), cache_embeddings)
+                groups.setdefault(key, []).append(request)
+            for group in groups.values():
+                self._search_group(group)
+
+    def _search_group(self, group):
+        _, k, mode, filters, cache_embeddings, _ = group[0]
+        batch = [query for queries, *_ in group for query in queries]
+        try:
+            results = self.search_fn(batch, k, mode, filters, cache_embeddings)
+        except Exception as error:
+            for *_, future in group:
+                future.set_exception(error)
+            return
+
+        with self._stats_lock:
+            self.batches += 1
+            self.requests += len(group)
+            self.queries += len(batch)
+        start = 0
+        for queries, *_, future in group:
+            future.set_result(results[start:start + len(queries)])
+            start += len(queries)
+
+
+class RetrievalRequestHandler(BaseHTTPRequestHandler):
+    """JSON endpoints in front of the shared MicroBatcher."""
+
+    batcher = None
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/stats":
+            from query_faiss import embedding_cache_stats, load_times
+
+            self._send_json(200, {
+                "batching": self.batcher.stats(),
+                "load_times": load_times(),
+                "embedding_cache": embedding_cache_stats(),
+            })
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/query":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            results = self.batcher.submit(
+                request["queries"], int(request.get("k", 3)),
+                request.get("mode") or RETRIEVAL_MODE, request.get("filters"),
+                bool(request.get("cache_embeddings", True)),
+            )
+        except (KeyError, TypeError, ValueError) as error:
+            self._send_json(400, {"error": str(error)})
+            return
+        except Exception as error:
+            self._send_json(500, {"error": str(error)})
+            return
+        self._send_json(200, {"results": results})
+
+    def log_message(self, format, *args):
+        # Per-request access logs would flood the console
+        pass
+
+
+def serve(host, port, max_batch=SERVER_MAX_BATCH, max_wait_ms=SERVER_MAX_WAIT_MS):
+    """Load the model and index, then serve queries until interrupted."""
+    import query_faiss
+
+    # This process is the server, so it must never forward queries to itself
+    query_faiss.RETRIEVAL_SERVER_URL = ""
+    query_faiss.get_embeddings()
+    query_faiss.get_vector_store()
+
+    RetrievalRequestHandler.batcher = MicroBatcher(query_faiss.search_local, max_batch, max_wait_ms)
+    server = ThreadingHTTPServer((host, port), RetrievalRequestHandler)
+    server.daemon_threads = True
+    print(f"Retrieval server listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    url = urlparse(RETRIEVAL_SERVER_URL or "http://127.0.0.1:8765")
+    parser = argparse.ArgumentParser(description="Shared retrieval server for query_faiss")
+    parser.add_argument("--host", default=url.hostname)
+    parser.add_argument("--port", type=int, default=url.port or 8765)
+    parser.add_argument("--max-batch", type=int, default=SERVER_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=SERVER_MAX_WAIT_MS)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.max_batch, args.max_wait_ms)
+
+
+if __name__ == "__main__":
+    main()
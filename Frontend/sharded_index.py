@@ -0,0 +1,293 @@
+"""
+Scatter-gather search over a FAISS index split into shards.
+
+The stored vectors are split into FAISS_SHARDS contiguous row ranges, each
+held in its own FAISS index and searched by its own thread (FAISS releases
+the GIL while searching, so shards run on separate cores). Per-shard top-k
+results are shifted back to global row ids and merged by score, so callers
+see the same rows and scores as with a single index.
+
+Shards are built once and saved next to the index:
+
+    python sharded_index.py build --mode flat --shards 4
+    python sharded_index.py build --mode hnsw --shards 4
+    python sharded_index.py bench --shards 1 2 4 8
+
+Saved flat shards are memory-mapped like the exact index (see
+compact_store.MMAP_FLAGS), at the cost of a second copy of the vectors on
+disk. Without them, flat shards are copied out of the exact index into
+process memory when the store is loaded, which gives up the memory mapping.
+"""
+import argparse
+import glob
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+import numpy as np
+
+from ann_index import (
+    ANN_MODES, build_ann_index, exact_index_path, reconstruct_vectors, sample_queries,
+    search_params, set_search_params,
+)
+from compact_store import MMAP_FLAGS
+from retrieval_config import FAISS_INDEX_PATH, FAISS_NPROBE, FAISS_EF_SEARCH
+
+SHARD_MODES = ("flat",) + ANN_MODES
+SHARD_FILE_PATTERN = re.compile(r"index_(\w+?)_shard(\d+)of(\d+)\.faiss$")
+
+
+def shard_path(mode, shard, shards, index_dir=FAISS_INDEX_PATH):
+    """Path of one saved shard, e.g. index_hnsw_shard0of4.faiss."""
+    return os.path.join(index_dir, f"index_{mode}_shard{shard}of{shards}.faiss")
+
+
+def shard_bounds(ntotal, shards):
+    """Split rows 0..ntotal into `shards` contiguous (start, end) ranges of near-equal size."""
+    edges = np.linspace(0, ntotal, shards + 1).astype(np.int64)
+    return [(int(start), int(end)) for start, end in zip(edges[:-1], edges[1:])]
+
+
+class ShardedIndex:
+    """
+    A list of FAISS indexes over consecutive row ranges, searched in parallel.
+
+    Exposes the parts of the faiss.Index interface query_faiss uses (ntotal,
+    d, metric_type, search), with row ids global across shards.
+    """
+
+    def __init__(self, shards):
+        self.shards = list(shards)
+        sizes = [shard.ntotal for shard in self.shards]
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        self.d = self.shards[0].d
+        self.metric_type = self.shards[0].metric_type
+        self._executor = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="faiss-shard")
+        # Selectors for the tombstoned rows, rebuilt only when the deleted rows change
+        self._excluded = (None, None)
+
+    @property
+    def ntotal(self):
+        return int(self.offsets[-1])
+
+    def _local_rows(self, rows, shard):
+        start, end = self.offsets[shard], self.offsets[shard + 1]
+        return rows[(rows >= start) & (rows < end)] - start
+
+    def _excluded_selectors(self, excluded_rows):
+        cached_rows, selectors = self._excluded
+        if cached_rows is not excluded_rows:
+            selectors = []
+            for shard in range(len(self.shards)):
+                local = self._local_rows(excluded_rows, shard)
+                if len(local):
+                    deleted = faiss.IDSelectorBatch(local)
+                    selector = faiss.IDSelectorNot(deleted)
+                    selector.referenced_objects = [deleted]
+                    selectors.append(selector)
+                else:
+                    selectors.append(None)
+            self._excluded = (excluded_rows, selectors)
+        return selectors
+
+    def _search_shard(self, shard, x, k, selector):
+        index = self.shards[shard]
+        if selector is None:
+            distances, rows = index.search(x, k)
+        else:
+            distances, rows = index.search(x, k, params=search_params(index, selector))
+        return distances, np.where(rows == -1, -1, rows + self.offsets[shard])
+
+    def search(self, x, k, allowed_rows=None, excluded_rows=None):
+        """
+        Search every shard in parallel and merge the per-shard top-k by score.
+
+        Args:
+            x (np.ndarray): float32 query matrix.
+            k (int): Number of neighbours per query.
+            allowed_rows (np.ndarray): If given, only these global rows are searched.
+            excluded_rows (np.ndarray): Global rows that must not be returned.
+
+        Returns:
+            tuple: (distances, rows) arrays of shape (n_queries, k), as faiss.Index.search.
+        """
+        tasks = []
+        for shard in range(len(self.shards)):
+            selector = None
+            if allowed_rows is not None:
+                local = self._local_rows(allowed_rows, shard)
+                if not len(local):
+                    continue
+                selector = faiss.IDSelectorBatch(local)
+            elif excluded_rows is not None and len(excluded_rows):
+                selector = self._excluded_selectors(excluded_rows)[shard]
+            tasks.append((shard, selector))
+
+        higher_is_better = self.metric_type == faiss.METRIC_INNER_PRODUCT
+        worst = -np.inf if higher_is_better else np.inf
+        if not tasks:
+            return np.full((len(x), k), worst, dtype=np.float32), np.full((len(x), k), -1, dtype=np.int64)
+
+        results = list(self._executor.map(lambda task: self._search_shard(task[0], x, k, task[1]), tasks))
+        distances = np.hstack([result[0] for result in results])
+        rows = np.hstack([result[1] for result in results])
+        distances = np.where(rows == -1, worst, distances)
+
+        order = np.argsort(-distances if higher_is_better else distances, axis=1, kind="stable")[:, :k]
+        distances = np.take_along_axis(distances, order, axis=1)
+        rows = np.take_along_axis(rows, order, axis=1)
+        if rows.shape[1] < k:
+            pad = k - rows.shape[1]
+            distances = np.pad(distances, ((0, 0), (0, pad)), constant_values=worst)
+            rows = np.pad(rows, ((0, 0), (0, pad)), constant_values=-1)
+        return distances, rows
+
+
+def split_flat_index(index, shards):
+    """Copy an exact index into `shards` flat indexes over consecutive row ranges."""
+    parts = []
+    for start, end in shard_bounds(index.ntotal, shards):
+        part = faiss.IndexFlat(index.d, index.metric_type)
+        if end > start:
+            part.add(index.reconstruct_n(start, end - start))
+        parts.append(part)
+    return ShardedIndex(parts)
+
+
+def build_shards(vectors, mode, shards, metric=faiss.METRIC_L2, **kwargs):
+    """Build one flat or approximate index per row range (see ann_index.build_ann_index for kwargs)."""
+    parts = []
+    for start, end in shard_bounds(len(vectors), shards):
+        if mode == "flat":
+            part = faiss.IndexFlat(vectors.shape[1], metric)
+            if end > start:
+                part.add(vectors[start:end])
+        else:
+            part = build_ann_index(vectors[start:end], mode, metric=metric, **kwargs)
+        parts.append(part)
+    return parts
+
+
+def load_sharded_index(mode, shards, index_dir=FAISS_INDEX_PATH, exact_index=None,
+                       nprobe=FAISS_NPROBE, ef_search=FAISS_EF_SEARCH):
+    """
+    Load the store's vectors as a ShardedIndex.
+
+    Args:
+        mode (str): "flat" or one of ann_index.ANN_MODES.
+        shards (int): Number of shards.
+        index_dir (str): The FAISS index directory.
+        exact_index (faiss.Index): Already loaded exact index, split in memory when
+            there are no saved flat shards of the same size (flat mode).
+    """
+    paths = [shard_path(mode, shard, shards, index_dir) for shard in range(shards)]
+    if mode == "flat":
+        if all(os.path.exists(path) for path in paths):
+            parts = [faiss.read_index(path, MMAP_FLAGS) for path in paths]
+            if exact_index is None or sum(part.ntotal for part in parts) == exact_index.ntotal:
+                return ShardedIndex(parts)
+        if exact_index is None:
+            exact_index = faiss.read_index(exact_index_path(index_dir), MMAP_FLAGS)
+        return split_flat_index(exact_index, shards)
+
+    missing = [path for path in paths if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(
+            f"No {mode} shards at {missing[0]}; run 'python sharded_index.py build --mode {mode} --shards {shards}'"
+        )
+    return ShardedIndex([set_search_params(faiss.read_index(path), nprobe, ef_search) for path in paths])
+
+
+def sync_shards(store, index_dir=FAISS_INDEX_PATH):
+    """Bring any saved shards in line with the store after ingestion."""
+    layouts = set()
+    for path in glob.glob(os.path.join(index_dir, "index_*_shard*of*.faiss")):
+        match = SHARD_FILE_PATTERN.search(os.path.basename(path))
+        if match and match.group(1) in SHARD_MODES:
+            layouts.add((match.group(1), int(match.group(3))))
+
+    for mode, shards in layouts:
+        paths = [shard_path(mode, shard, shards, index_dir) for shard in range(shards)]
+        if not all(os.path.exists(path) for path in paths):
+            continue
+        parts = [faiss.read_index(path) for path in paths]
+        ntotal = sum(part.ntotal for part in parts)
+        if ntotal == store.index.ntotal:
+            continue
+        if ntotal < store.index.ntotal:
+            # Appended rows go to the last shard, so every shard keeps a consecutive row range
+            parts[-1].add(store.index.reconstruct_n(ntotal, store.index.ntotal - ntotal))
+            changed = [len(parts) - 1]
+        else:
+            # Compaction renumbers rows, so the shards are rebuilt
+            parts = build_shards(reconstruct_vectors(store.index), mode, shards, metric=store.index.metric_type)
+            changed = range(shards)
+        for shard in changed:
+            faiss.write_index(parts[shard], paths[shard] + ".tmp")
+            os.replace(paths[shard] + ".tmp", paths[shard])
+
+
+def _bench(exact_index, shard_counts, n_queries, k, repeats=3):
+    """Single-query latency and batch throughput of the flat index for each shard count."""
+    queries = sample_queries(reconstruct_vectors(exact_index), n_queries)
+    rows = []
+    for shards in shard_counts:
+        index = split_flat_index(exact_index, shards)
+        index.search(queries[:1], k)  # warm-up
+
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query.reshape(1, -1), k)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            index.search(queries, k)
+            best = min(best, time.perf_counter() - start)
+        rows.append({
+            "shards": shards,
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "batch_queries_per_second": len(queries) / best,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded scatter-gather FAISS search")
+    parser.add_argument("--index-dir", default=FAISS_INDEX_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="build shards next to the exact index")
+    build_parser.add_argument("--mode", choices=SHARD_MODES, required=True)
+    build_parser.add_argument("--shards", type=int, required=True)
+
+    bench_parser = subparsers.add_parser("bench", help="latency and throughput per shard count (flat)")
+    bench_parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    bench_parser.add_argument("--queries", type=int, default=200)
+    bench_parser.add_argument("-k", type=int, default=3)
+    args = parser.parse_args()
+
+    exact_index = faiss.read_index(exact_index_path(args.index_dir))
+
+    if args.command == "build":
+        start = time.perf_counter()
+        parts = build_shards(reconstruct_vectors(exact_index), args.mode, args.shards,
+                             metric=exact_index.metric_type)
+        for shard, part in enumerate(parts):
+            faiss.write_index(part, shard_path(args.mode, shard, args.shards, args.index_dir))
+        print(f"Built {args.shards} {args.mode} shards over {exact_index.ntotal} vectors "
+              f"in {time.perf_counter() - start:.1f}s")
+        return
+
+    for row in _bench(exact_index, args.shards, args.queries, args.k):
+        print(f"shards={row['shards']:<3} p50={row['p50_ms']:.3f}ms  p95={row['p95_ms']:.3f}ms  "
+              f"batch={row['batch_queries_per_second']:.0f} queries/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+One vector-store interface over the FAISS index and a Chroma collection.
+
+Both backends share the process-wide embedder and query embedding cache of
+query_faiss, and expose the same call:
+
+    backend = get_backend("chroma")
+    backend.search_batch(["HbA1c target", "metformin dose"], k=3, filters={"doc_type": "fda_label"})
+
+which returns one list of (document text, distance) tuples per query, like
+query_faiss_batch in vector mode. Filters use the metadata_index format.
+
+The Chroma collection in CHROMA_PATH (chroma_db/ by default, not tracked)
+is filled from the FAISS store (same chunks, same vectors), so results are
+comparable. The embedchain_store collection in Frontend/db that crewai's
+PDFSearchTool created holds 768-dimensional Google embeddings and cannot
+be searched with the shared embedder; it is left untouched.
+
+Usage:
+    python vector_stores.py sync-chroma
+    python vector_stores.py bench --queries 200 --output vector_store_bench.json
+"""
+import argparse
+import json
+import re
+import time
+
+import numpy as np
+
+from resource_registry import registry
+from retrieval_config import CHROMA_PATH, CHROMA_COLLECTION, VECTOR_BACKEND
+
+DATE_PATTERN = re.compile(r"^(\d{4})-(\d{2})-(\d{2})")
+RANGE_OPERATORS = {"gte": "$gte", "gt": "$gt", "lte": "$lte", "lt": "$lt"}
+
+
+class FaissBackend:
+    """The FAISS store of query_faiss (exact, approximate or sharded, as configured)."""
+
+    name = "faiss"
+
+    def load(self):
+        from query_faiss import get_vector_store
+
+        get_vector_store()
+
+    def count(self):
+        from query_faiss import get_vector_store
+
+        return get_vector_store().index.ntotal
+
+    def search_batch(self, queries, k=3, filters=None):
+        from query_faiss import search_local
+
+        return search_local(queries, k, mode="vector", filters=filters)
+
+
+class ChromaBackend:
+    """A Chroma collection holding the same chunks and vectors as the FAISS store."""
+
+    name = "chroma"
+
+    def load(self):
+        registry.get("chroma_collection")
+
+    def count(self):
+        return registry.get("chroma_collection").count()
+
+    def search_batch(self, queries, k=3, filters=None):
+        from query_faiss import embed_queries
+
+        if not queries:
+            return []
+        collection = registry.get("chroma_collection")
+        response = collection.query(
+            query_embeddings=embed_queries(list(queries)),
+            n_results=k,
+            where=chroma_where(filters),
+            include=["documents", "distances"],
+        )
+        return [list(zip(documents, distances))
+                for documents, distances in zip(response["documents"], response["distances"])]
+
+
+BACKENDS = {"faiss": FaissBackend, "chroma": ChromaBackend}
+
+
+def get_backend(name=VECTOR_BACKEND):
+    """Return a vector-store backend by name ("faiss" or "chroma")."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown vector backend '{name}', expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+def _date_number(value):
+    """"2024-05-01" -> 20240501, so date ranges work with Chroma's numeric-only range operators."""
+    match = DATE_PATTERN.match(str(value))
+    return int("".join(match.groups())) if match else None
+
+
+def chroma_where(filters):
+    """Translate metadata_index filters into a Chroma where clause."""
+    if not filters:
+        return None
+    clauses = []
+    for field, condition in filters.items():
+        if isinstance(condition, dict):
+            for operator, bound in condition.items():
+                number = _date_number(bound) if field == "date" else bound
+                if not isinstance(number, (int, float)):
+                    raise ValueError(f"Chroma supports range filters only on numbers and dates, not '{field}'")
+                clauses.append({"date_number" if field == "date" else field: {RANGE_OPERATORS[operator]: number}})
+        elif isinstance(condition, (list, tuple, set)):
+            clauses.append({field: {"$in": [str(value) for value in condition]}})
+        else:
+            clauses.append({field: str(condition)})
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _chroma_metadata(metadata):
+    """Chroma accepts only scalar metadata; the filter fields are stored as strings."""
+    clean = {}
+    for key, value in metadata.items():
+        if isinstance(value, (str, int, float, bool)):
+            clean[key] = str(value) if key in ("source", "doc_type", "date") else value
+    if "date" in clean and _date_number(clean["date"]) is not None:
+        clean["date_number"] = _date_number(clean["date"])
+    return clean
+
+
+def _open_chroma_client():
+    import chromadb
+
+    return chromadb.PersistentClient(path=CHROMA_PATH)
+
+
+def _load_chroma_collection():
+    from query_faiss import _embedder_id
+
+    collection = _open_chroma_client().get_collection(CHROMA_COLLECTION)
+    embedder = (collection.metadata or {}).get("embedder")
+    if embedder != _embedder_id():
+        raise ValueError(
+            f"Chroma collection '{CHROMA_COLLECTION}' was built with {embedder}, not {_embedder_id()}; "
+            "run 'python vector_stores.py sync-chroma'"
+        )
+    return collection
+
+
+registry.register("chroma_collection", _load_chroma_collection)
+
+
+def sync_chroma(batch_size=None):
+    """
+    Rebuild the Chroma collection from the FAISS store, reusing its vectors.
+
+    Tombstoned chunks are skipped, so both backends hold the same live documents.
+
+    Returns:
+        int: Number of chunks written.
+    """
+    import faiss
+    from ann_index import exact_index_path
+    from compact_store import MMAP_FLAGS
+    from faiss_ingest import load_tombstones
+    from query_faiss import _embedder_id, get_vector_store
+    from retrieval_config import FAISS_INDEX_PATH
+
+    store = get_vector_store()
+    exact_index = faiss.read_index(exact_index_path(FAISS_INDEX_PATH), MMAP_FLAGS)
+    tombstones = load_tombstones(FAISS_INDEX_PATH)
+
+    client = _open_chroma_client()
+    if CHROMA_COLLECTION in [collection.name for collection in client.list_collections()]:
+        client.delete_collection(CHROMA_COLLECTION)
+    # FAISS uses L2 distances, so Chroma's HNSW is built for the same metric
+    collection = client.create_collection(
+        CHROMA_COLLECTION, metadata={"hnsw:space": "l2", "embedder": _embedder_id()}
+    )
+    batch_size = batch_size or client.get_max_batch_size()
+
+    written = 0
+    batch = []
+
+    def flush():
+        rows = [row for row, _ in batch]
+        vectors = np.vstack([exact_index.reconstruct(row) for row in rows])
+        if store.normalize_L2:
+            faiss.normalize_L2(vectors)
+        collection.add(
+            ids=[document.id for _, document in batch],
+            embeddings=vectors,
+            documents=[document.page_content for _, document in batch],
+            metadatas=[_chroma_metadata(document.metadata) or None for _, document in batch],
+        )
+
+    for row, document in store.iter_documents():
+        if document.id in tombstones:
+            continue
+        batch.append((row, document))
+        if len(batch) >= batch_size:
+            flush()
+            written += len(batch)
+            batch = []
+    if batch:
+        flush()
+        written += len(batch)
+
+    registry.reset("chroma_collection")
+    return written
+
+
+def benchmark_backends(queries, k=3, names=("faiss", "chroma"), repeats=3):
+    """
+    Compare backends on the same pre-embedded queries.
+
+    Queries are embedded once up front, so the numbers measure the vector
+    stores rather than the shared embedder.
+
+    Returns:
+        dict: Per backend: load time, single-query latency percentiles, batch
+            throughput, and overlap of its top-k with the first backend's.
+    """
+    from query_faiss import embed_queries
+    from retrieval_benchmark import percentiles
+
+    embed_queries(queries)
+    results = {"queries": len(queries), "k": k, "backends": {}}
+    reference = None
+    for name in names:
+        backend = get_backend(name)
+        start = time.perf_counter()
+        backend.load()
+        load_seconds = time.perf_counter() - start
+
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            backend.search_batch([query], k)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            hits = backend.search_batch(queries, k)
+            best = min(best, time.perf_counter() - start)
+
+        texts = [{text for text, _ in query_hits} for query_hits in hits]
+        reference = reference or texts
+        overlap = sum(len(a & b) for a, b in zip(texts, reference)) / max(1, sum(len(a) for a in reference))
+        results["backends"][name] = {
+            "documents": backend.count(),
+            "load_seconds": load_seconds,
+            "latency_ms": percentiles(latencies),
+            "batch_queries_per_second": len(queries) / best,
+            f"overlap_at_k_vs_{names[0]}": overlap,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FAISS / Chroma vector-store backends")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("sync-chroma", help="fill the Chroma collection from the FAISS store")
+    bench_parser = subparsers.add_parser("bench", help="side-by-side latency and throughput")
+    bench_parser.add_argument("--queries", type=int, default=200)
+    bench_parser.add_argument("-k", type=int, default=3)
+    bench_parser.add_argument("--backends", nargs="+", choices=sorted(BACKENDS), default=["faiss", "chroma"])
+    bench_parser.add_argument("--output", default="vector_store_bench.json")
+    args = parser.parse_args()
+
+    if args.command == "sync-chroma":
+        print(f"Wrote {sync_chroma()} chunks to Chroma collection '{CHROMA_COLLECTION}' in {CHROMA_PATH}")
+        return
+
+    from retrieval_benchmark import synthetic_queries
+
+    results = benchmark_backends(synthetic_queries(args.queries), args.k, tuple(args.backends))
+    for name, row in results["backends"].items():
+        print(f"{name:<7} load={row['load_seconds']:.2f}s  p50={row['latency_ms']['p50']:.2f}ms  "
+              f"p95={row['latency_ms']['p95']:.2f}ms  batch={row['batch_queries_per_second']:.0f} queries/s")
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()